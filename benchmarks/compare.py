@@ -0,0 +1,199 @@
+import argparse
+import json
+import statistics
+import sys
+from typing import Dict, Optional, Tuple
+
+# 実行環境の違いを確認する項目
+ENVIRONMENT_KEYS = ["Machine", "Processor", "CPU Count", "Torch Threads", "torch", "lightgbm"]
+
+# ばらつきを求めるのに必要な測定回数
+MIN_SAMPLES = 3
+
+# 正規分布の場合に MAD を標準偏差に揃える係数
+MAD_SCALE = 1.4826
+
+
+def load_results(path: str) -> Tuple[dict, Dict[Tuple[str, str], dict]]:
+    """
+    suite.py の結果を読み込む関数
+
+    Parameters
+    ----------
+    path: str
+        結果の JSON のパス
+
+    Returns
+    ----------
+    report: dict
+        結果の全体
+    results: Dict[Tuple[str, str], dict]
+        (データの大きさ, 項目) をキーとした測定結果
+    """
+    with open(path) as f:
+        report = json.load(f)
+    results = {
+        (result["size"], result["benchmark"]): result
+        for result in report["results"]
+    }
+
+    return report, results
+
+
+def slowdown(base: dict, new: dict) -> float:
+    """
+    基準の結果に対して, どれだけ遅くなったかを求める関数
+
+    Parameters
+    ----------
+    base: dict
+        基準の測定結果
+    new: dict
+        比較する測定結果
+
+    Returns
+    ----------
+    change: float
+        遅くなった割合, 0.1 であれば 10 % 遅く, 負の値であれば速くなったことを表す
+    """
+    # スループットは逆数を取り, 時間と同じく小さいほど良い値として比べる
+    if base["higher_is_better"]:
+        return base["median"] / new["median"] - 1
+
+    return new["median"] / base["median"] - 1
+
+
+def relative_spread(result: dict) -> Optional[float]:
+    """
+    測定値のばらつきを, 中央値に対する割合として求める関数
+
+    外れ値に引きずられないよう, 中央絶対偏差 (MAD) を標準偏差の尺度に揃えて使う.
+
+    Parameters
+    ----------
+    result: dict
+        測定結果
+
+    Returns
+    ----------
+    spread: Optional[float]
+        中央値に対するばらつきの割合, 測定が MIN_SAMPLES 回より少ない場合は None
+    """
+    samples = result["samples"]
+    if len(samples) < MIN_SAMPLES:
+        return None
+
+    median = statistics.median(samples)
+    mad = statistics.median([abs(sample - median) for sample in samples])
+
+    return MAD_SCALE * mad / abs(median)
+
+
+def noise_margin(base: dict, new: dict, factor: float) -> Optional[float]:
+    """
+    中央値の差をばらつきとみなす範囲を求める関数
+
+    Parameters
+    ----------
+    base: dict
+        基準の測定結果
+    new: dict
+        比較する測定結果
+    factor: float
+        ばらつきの何倍までを誤差とみなすか
+
+    Returns
+    ----------
+    margin: Optional[float]
+        slowdown の値がこの範囲に収まる場合はばらつきとみなす, 求められない場合は None
+    """
+    spreads = [relative_spread(base), relative_spread(new)]
+    if None in spreads:
+        return None
+
+    # 2 つの中央値の差のばらつきとして, それぞれのばらつきを合わせる
+    return factor * (spreads[0] ** 2 + spreads[1] ** 2) ** 0.5
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(
+    description="suite.py の 2 つの結果を比べ, 遅くなった項目を表示する"
+)
+parser.add_argument("base", help="基準となる結果の JSON")
+parser.add_argument("new", help="比較する結果の JSON")
+parser.add_argument(
+    "--threshold", type=float, default=0.1,
+    help="この割合より遅くなった項目を regression とする"
+)
+parser.add_argument(
+    "--noise", type=float, default=3.0,
+    help="変化が測定値のばらつき (MAD) のこの倍数以内の場合は noisy とする"
+)
+args = parser.parse_args()
+
+base_report, base_results = load_results(args.base)
+new_report, new_results = load_results(args.new)
+
+print(f"base: {base_report['git']['commit']} ({base_report['created_at']})")
+print(f"new : {new_report['git']['commit']} ({new_report['created_at']})")
+
+# 実行環境が異なる場合は, 速度の差が変更によるものとは限らない
+for key in ENVIRONMENT_KEYS:
+    base_value = base_report["environment"].get(key)
+    new_value = new_report["environment"].get(key)
+    if base_value != new_value:
+        print(f"warning: {key} differs ({base_value} -> {new_value})")
+
+print(
+    f"{'size':>10} {'benchmark':>20} {'base':>12} {'new':>12} {'unit':>10} "
+    f"{'change':>8}  status"
+)
+n_regressions = 0
+n_unestimated = 0
+for key in list(base_results) + [key for key in new_results if key not in base_results]:
+    size, name = key
+    base = base_results.get(key)
+    new = new_results.get(key)
+    if base is None or new is None:
+        result = base or new
+        status = "only in base" if new is None else "only in new"
+        print(f"{size:>10} {name:>20} {'':>12} {'':>12} {result['unit']:>10} {'':>8}  {status}")
+        continue
+
+    # 行数が異なる場合は, 同じ条件の測定ではないため比べない
+    if base["rows"] != new["rows"]:
+        print(
+            f"{size:>10} {name:>20} {'':>12} {'':>12} {base['unit']:>10} {'':>8}  "
+            f"rows differ ({base['rows']} -> {new['rows']})"
+        )
+        continue
+
+    # 中央値の差が閾値を超えても, 測定値のばらつきから見て有意でない場合は noisy とする
+    # 測定回数が少なくばらつきを求められない場合は, 中央値の差のみで判定する
+    change = slowdown(base, new)
+    margin = noise_margin(base, new, args.noise)
+    if margin is None:
+        n_unestimated += 1
+    if abs(change) > args.threshold and margin is not None and abs(change) <= margin:
+        status = "noisy"
+    elif change > args.threshold:
+        status = "REGRESSION"
+        n_regressions += 1
+    elif change < -args.threshold:
+        status = "improved"
+    else:
+        status = "ok"
+    print(
+        f"{size:>10} {name:>20} {base['median']:>12.3f} {new['median']:>12.3f} "
+        f"{base['unit']:>10} {change:>+7.1%}  {status}"
+    )
+
+if n_unestimated:
+    print(
+        f"warning: {n_unestimated} benchmark(s) have fewer than {MIN_SAMPLES} samples, "
+        "noise is not estimated (run suite.py with a larger --repeat)"
+    )
+
+# 遅くなった項目があれば終了コード 1 を返し, CI などで検知できるようにする
+print(f"{n_regressions} regression(s) over {args.threshold:.0%}")
+sys.exit(1 if n_regressions else 0)
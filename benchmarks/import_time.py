@@ -0,0 +1,78 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict
+
+# 読み込みに時間がかかるフレームワーク
+HEAVY_MODULES = ["torch", "lightgbm", "matplotlib"]
+
+
+def measure(module: str, scripts_dir: str, root_dir: str) -> Dict[str, int]:
+    """
+    -X importtime でモジュールの読み込みにかかる時間を測定する関数
+
+    Parameters
+    ----------
+    module: str
+        測定するモジュールの名前
+    scripts_dir: str
+        実行時のカレントディレクトリ, scripts 以下のモジュールを読み込むために使う
+    root_dir: str
+        PYTHONPATH に追加するリポジトリのルート
+
+    Returns
+    ----------
+    times: Dict[str, int]
+        モジュールごとの累積の読み込み時間 [us]
+    """
+    env = dict(os.environ, PYTHONPATH=root_dir)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=scripts_dir, env=env, capture_output=True, text=True, check=True
+    )
+
+    # "import time: self [us] | cumulative | imported package" の形式の行を読む
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if name in [module] + HEAVY_MODULES:
+            times[name] = int(cumulative)
+
+    return times
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(
+    description="スクリプトの起動時のモジュールの読み込み時間を測定する"
+)
+parser.add_argument(
+    "--modules", nargs="+",
+    default=["train_lgb", "train_nn", "utils.preprocessing", "utils.result"]
+)
+parser.add_argument("--repeat", type=int, default=5)
+args = parser.parse_args()
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+scripts_dir = os.path.join(root_dir, "scripts")
+
+# 各モジュールを別プロセスで繰り返し読み込み, 中央値を求める
+header = " | ".join(f"{name:>10}" for name in HEAVY_MODULES)
+print(f"| {'module':<20} | {'total [ms]':>10} | {header} |")
+print(f"|{'-' * 22}|{'-' * 12}|" + "|".join("-" * 12 for _ in HEAVY_MODULES) + "|")
+for module in args.modules:
+    runs = [measure(module, scripts_dir, root_dir) for _ in range(args.repeat)]
+    total = statistics.median(run[module] for run in runs) / 1000
+
+    # 読み込まれなかったフレームワークは "-" と表示する
+    cells = []
+    for name in HEAVY_MODULES:
+        if name in runs[0]:
+            cells.append(f"{statistics.median(run[name] for run in runs) / 1000:>10.0f}")
+        else:
+            cells.append(f"{'-':>10}")
+    print(f"| {module:<20} | {total:>10.0f} | {' | '.join(cells)} |")
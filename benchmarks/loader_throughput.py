@@ -0,0 +1,64 @@
+import argparse
+import time
+
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from trainers.loader import TensorLoader
+
+
+def measure(loader, epochs: int) -> float:
+    """
+    ローダーから全てのミニバッチを取り出す速度を測定する関数
+
+    Parameters
+    ----------
+    loader:
+        測定するローダー
+    epochs: int
+        繰り返すエポック数
+
+    Returns
+    ----------
+    throughput: float
+        1 秒あたりに取り出したサンプル数
+    """
+    n_samples = 0
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for inputs, label in loader:
+            n_samples += len(inputs)
+    elapsed = time.perf_counter() - start
+    throughput = n_samples / elapsed
+
+    return throughput
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(
+    description="DataLoader と TensorLoader のスループットを比較する"
+)
+parser.add_argument("--rows", type=int, nargs="+", default=[500, 50000])
+parser.add_argument("--features", type=int, default=11)
+parser.add_argument("--batch-size", type=int, default=16)
+parser.add_argument("--epochs", type=int, default=3)
+args = parser.parse_args()
+
+print(f"{'rows':>8} {'shuffle':>8} {'DataLoader':>14} {'TensorLoader':>14} {'ratio':>7}")
+for rows in args.rows:
+    dataset = TensorDataset(
+        torch.randn(rows, args.features), torch.randn(rows)
+    )
+    for shuffle in [False, True]:
+        base = measure(
+            DataLoader(dataset, batch_size=args.batch_size, shuffle=shuffle),
+            args.epochs
+        )
+        fast = measure(
+            TensorLoader(dataset, batch_size=args.batch_size, shuffle=shuffle),
+            args.epochs
+        )
+        print(
+            f"{rows:>8} {str(shuffle):>8} {base:>12.0f}/s {fast:>12.0f}/s "
+            f"{fast / base:>6.1f}x"
+        )
@@ -0,0 +1,128 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+def request(conn: http.client.HTTPConnection, method: str, path: str, body=None) -> dict:
+    """
+    サーバーに依頼を送り, 返された JSON を取得する関数
+
+    Parameters
+    ----------
+    conn: http.client.HTTPConnection
+        サーバーへの接続
+    method: str
+        HTTP のメソッド
+    path: str
+        依頼先のパス
+    body: = None
+        送る内容, JSON に変換して送る
+
+    Returns
+    ----------
+    response: dict
+        返された内容
+    """
+    headers = {}
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=data, headers=headers)
+    response = conn.getresponse()
+    content = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(f"{response.status}: {content}")
+
+    return content
+
+
+def client(
+        host: str, port: int, rows: np.ndarray, latencies: list, barrier: threading.Barrier
+    ) -> None:
+    """
+    1 行ずつ順に予測を依頼し, 依頼ごとの応答時間を記録する関数, スレッドごとに実行される
+
+    Parameters
+    ----------
+    host: str
+        サーバーのアドレス
+    port: int
+        サーバーのポート
+    rows: np.ndarray
+        依頼する説明変数
+    latencies: list
+        応答時間 (秒) を追加するリスト
+    barrier: threading.Barrier
+        全てのスレッドで同時に依頼を始めるための Barrier
+
+    Returns
+    ----------
+    None
+    """
+    conn = http.client.HTTPConnection(host, port)
+    barrier.wait()
+    for row in rows.tolist():
+        start = time.perf_counter()
+        request(conn, "POST", "/predict", {"features": row})
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(
+    description="予測サーバーに同時に 1 行ずつ依頼を送り, 応答時間とスループットを測定する"
+)
+parser.add_argument("--url", default="http://127.0.0.1:8000", help="予測サーバーの URL")
+parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="同時に依頼するクライアント数")
+parser.add_argument("--requests", type=int, default=200, help="クライアントごとの依頼数")
+args = parser.parse_args()
+
+url = urlparse(args.url)
+conn = http.client.HTTPConnection(url.hostname, url.port)
+health = request(conn, "GET", "/health")
+n_features = len(health["features"])
+print(f"model: {health['model_type']}, features: {n_features}")
+
+print(
+    f"{'clients':>8} {'requests':>9} {'p50 [ms]':>9} {'p99 [ms]':>9} "
+    f"{'throughput':>13} {'batch size':>11}"
+)
+rng = np.random.default_rng(0)
+for concurrency in args.concurrency:
+    before = request(conn, "GET", "/health")
+    latencies = []
+    barrier = threading.Barrier(concurrency + 1)
+    threads = [
+        threading.Thread(
+            target=client,
+            args=(
+                url.hostname, url.port,
+                rng.random((args.requests, n_features)), latencies, barrier
+            )
+        )
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    after = request(conn, "GET", "/health")
+
+    # 測定の間に処理されたバッチの平均行数
+    batches = after["batches"] - before["batches"]
+    batch_size = (after["rows"] - before["rows"]) / batches if batches else 0.0
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    print(
+        f"{concurrency:>8} {len(latencies):>9} {p50:>9.2f} {p99:>9.2f} "
+        f"{len(latencies) / elapsed:>11.0f}/s {batch_size:>11.1f}"
+    )
+conn.close()
@@ -0,0 +1,340 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import warnings
+from typing import Callable, List
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import torch
+
+from experiment_tools.set_random_seed import fix_seed
+from experiment_tools.set_up import get_os_info
+from models.networks import NeuralNetwork
+from trainers.loader import get_dataloader
+from trainers.loop import train_nn
+from trainers.opt import options
+from utils.preprocessing import (
+    add_lag_features, build_splits, make_datasets, make_datasets_for_nn,
+    read_data
+)
+from utils.result import recursive_forecast
+
+# 結果の形式のバージョン, 形式を変えた場合は上げる
+RESULT_VERSION = 1
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# 測定に使うデータ, synthetic は実行時に --synthetic-rows 行の系列を作成する
+DATA_PATHS = {
+    "downsized": os.path.join(ROOT_DIR, "data", "sample_data_downsized.csv"),
+    "full": os.path.join(ROOT_DIR, "data", "sample_data.csv")
+}
+
+
+def measure(func: Callable[[], float], repeat: int) -> List[float]:
+    """
+    関数を繰り返し実行し, 各回の測定値を取得する関数
+
+    Parameters
+    ----------
+    func: Callable[[], float]
+        1 回分の測定を行い, 測定値を返す関数
+    repeat: int
+        繰り返す回数
+
+    Returns
+    ----------
+    samples: List[float]
+        各回の測定値
+    """
+    return [float(func()) for _ in range(repeat)]
+
+
+def elapsed_ms(func: Callable[[], object]) -> float:
+    """
+    関数の実行にかかった時間を測定する関数
+
+    Parameters
+    ----------
+    func: Callable[[], object]
+        測定する関数
+
+    Returns
+    ----------
+    elapsed: float
+        実行にかかった時間 [ms]
+    """
+    start = time.perf_counter()
+    func()
+
+    return (time.perf_counter() - start) * 1000
+
+
+def make_synthetic_data(n_rows: int, path: str, seed: int = 0) -> None:
+    """
+    sample_data.csv と同じ形式の人工の系列を CSV に書き出す関数
+
+    Parameters
+    ----------
+    n_rows: int
+        系列の長さ
+    path: str
+        書き出す CSV のパス
+    seed: int = 0
+        ノイズの乱数のシード
+
+    Returns
+    ----------
+    None
+    """
+    rng = np.random.default_rng(seed)
+
+    # sample_data.csv と同じ刻み幅で x を並べ, 正弦波にノイズを加える
+    x = np.arange(n_rows) * 0.0006000120002400048
+    y = np.sin(x) + 0.05 * rng.standard_normal(n_rows)
+    pd.DataFrame({"x": x, "y": y}).to_csv(path, index=False)
+
+
+def load_config(model_type: str, data_path: str) -> dict:
+    """
+    config/default の config を読み込み, 測定用に書き換える関数
+
+    Parameters
+    ----------
+    model_type: str
+        読み込む config のモデルのタイプ
+    data_path: str
+        測定に使うデータのパス
+
+    Returns
+    ----------
+    cfg: dict
+        測定に使う config データ
+    """
+    with open(os.path.join(ROOT_DIR, "config", "default", f"{model_type}.json")) as f:
+        cfg = json.load(f)
+
+    # キャッシュを使うと 2 回目以降の前処理を測定できないため使わない
+    cfg["data_path"] = data_path
+    cfg["cache"]["enable"] = False
+
+    return cfg
+
+
+def run_size(size: str, data_path: str, args: argparse.Namespace) -> List[dict]:
+    """
+    1 つのデータで全ての項目を測定する関数
+
+    Parameters
+    ----------
+    size: str
+        データの大きさの名前
+    data_path: str
+        測定に使うデータのパス
+    args: argparse.Namespace
+        コマンドライン引数
+
+    Returns
+    ----------
+    results: List[dict]
+        項目ごとの測定結果
+    """
+    lgb_cfg = load_config("LightGBM", data_path)
+    nn_cfg = load_config("NeuralNetwork", data_path)
+    fix_seed(nn_cfg["seed"])
+
+    df = read_data(data_path)
+    splits = build_splits(nn_cfg)
+    lag = nn_cfg["lag"]
+    results = []
+
+    def record(name: str, unit: str, higher_is_better: bool, samples: List[float]) -> None:
+        """
+        測定結果を追加し, 中央値を表示する関数
+        """
+        median = statistics.median(samples)
+        results.append({
+            "size": size,
+            "rows": len(df),
+            "benchmark": name,
+            "unit": unit,
+            "higher_is_better": higher_is_better,
+            "median": median,
+            "samples": samples
+        })
+        print(f"{size:>10} {len(df):>9} {name:>20} {median:>14.3f} {unit}")
+
+    # 前処理: データの読み込み, ラグ特徴量の作成, 分割までの全体
+    record("read_data", "ms", False, measure(
+        lambda: elapsed_ms(lambda: read_data(data_path)), args.repeat
+    ))
+    record("lag_features", "ms", False, measure(
+        lambda: elapsed_ms(lambda: add_lag_features(df, lag)), args.repeat
+    ))
+    record("build_splits", "ms", False, measure(
+        lambda: elapsed_ms(lambda: build_splits(nn_cfg)), args.repeat
+    ))
+
+    # データセットの作成, LightGBM はビンの作成まで行う
+    def construct_lgb() -> None:
+        out = make_datasets(lgb_cfg, splits)
+        out["train_dataset"].construct()
+        out["valid_dataset"].construct()
+
+    record("nn_datasets", "ms", False, measure(
+        lambda: elapsed_ms(lambda: make_datasets_for_nn(nn_cfg, splits)), args.repeat
+    ))
+    record("lgb_datasets", "ms", False, measure(
+        lambda: elapsed_ms(construct_lgb), args.repeat
+    ))
+
+    # NeuralNetwork: 1 エポック (学習と検証) で処理したサンプル数
+    nn_out = make_datasets_for_nn(nn_cfg, splits)
+    train_dataloader = get_dataloader(nn_cfg, nn_out["train_dataset"])
+    valid_dataloader = get_dataloader(nn_cfg, nn_out["valid_dataset"])
+    n_samples = len(nn_out["train_dataset"]) + len(nn_out["valid_dataset"])
+
+    def nn_epoch() -> float:
+        model = NeuralNetwork(nn_cfg, lag + 1, 1)
+        optimizer = options(nn_cfg, model).getter()
+        # 学習ループの進捗バーと損失関数の警告は, 測定結果の表示の妨げになるため捨てる
+        start = time.perf_counter()
+        with contextlib.redirect_stderr(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            train_nn(
+                epochs=1,
+                train_dataloader=train_dataloader,
+                valid_dataloader=valid_dataloader,
+                model=model,
+                optimizer=optimizer,
+                batch_size=nn_cfg["dataloader_params"]["batch_size"],
+                device="cpu",
+                cfg=nn_cfg,
+                callbacks=[]
+            )
+        return n_samples / (time.perf_counter() - start)
+
+    record("nn_epoch", "samples/s", True, measure(nn_epoch, args.repeat))
+
+    # LightGBM: early stopping を使わずに一定のラウンド数を学習する
+    lgb_out = make_datasets(lgb_cfg, splits)
+    params = dict(lgb_cfg["params"], seed=lgb_cfg["seed"], verbose=-1)
+    lgb_model = None
+
+    def lgb_train() -> float:
+        nonlocal lgb_model
+        start = time.perf_counter()
+        lgb_model = lgb.train(params, lgb_out["train_dataset"], args.rounds)
+        return args.rounds / (time.perf_counter() - start)
+
+    record("lgb_train", "rounds/s", True, measure(lgb_train, args.repeat))
+
+    # 再帰的な予測: 評価データの先頭から predict_steps ステップ分の 1 ステップあたりの時間
+    eval_df = splits["eval_data"].iloc[:args.predict_steps]
+    nn_model = NeuralNetwork(nn_cfg, lag + 1, 1)
+
+    def recursive(model_type: str, model) -> float:
+        start = time.perf_counter()
+        recursive_forecast(eval_df, model_type, model)
+        return (time.perf_counter() - start) * 1e6 / len(eval_df)
+
+    record("lgb_recursive", "us/step", False, measure(
+        lambda: recursive("LightGBM", lgb_model), args.repeat
+    ))
+    record("nn_recursive", "us/step", False, measure(
+        lambda: recursive("NeuralNetwork", nn_model), args.repeat
+    ))
+
+    return results
+
+
+def get_commit() -> dict:
+    """
+    測定したコードの commit id を取得する関数
+
+    Returns
+    ----------
+    commit: dict
+        commit id と, 未 commit の変更があるかどうか
+    """
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+        status = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return {"commit": None, "dirty": None}
+
+    return {"commit": commit, "dirty": bool(status)}
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(
+    description="前処理, 学習, 予測の速度をデータの大きさごとに測定し, JSON に保存する"
+)
+parser.add_argument(
+    "--sizes", nargs="+", default=["downsized", "full", "synthetic"],
+    choices=["downsized", "full", "synthetic"], help="測定するデータの大きさ"
+)
+parser.add_argument("--synthetic-rows", type=int, default=2000000, help="人工の系列の長さ")
+parser.add_argument("--repeat", type=int, default=3, help="各項目を繰り返す回数")
+parser.add_argument("--rounds", type=int, default=50, help="LightGBM の学習のラウンド数")
+parser.add_argument("--predict-steps", type=int, default=200, help="再帰的に予測するステップ数")
+parser.add_argument("--out", default=None, help="結果の JSON のパス")
+args = parser.parse_args()
+
+git_info = get_commit()
+started = datetime.datetime.now()
+results = []
+
+print(f"{'size':>10} {'rows':>9} {'benchmark':>20} {'median':>14}")
+with tempfile.TemporaryDirectory() as tmp_dir:
+    for size in args.sizes:
+        if size == "synthetic":
+            data_path = os.path.join(tmp_dir, "synthetic.csv")
+            make_synthetic_data(args.synthetic_rows, data_path)
+        else:
+            data_path = DATA_PATHS[size]
+        results += run_size(size, data_path, args)
+
+report = {
+    "version": RESULT_VERSION,
+    "created_at": started.isoformat(timespec="seconds"),
+    "git": git_info,
+    "environment": {
+        **get_os_info(),
+        "CPU Count": os.cpu_count(),
+        "Torch Threads": torch.get_num_threads(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "torch": torch.__version__,
+        "lightgbm": lgb.__version__
+    },
+    "settings": vars(args),
+    "results": results
+}
+
+# 指定しない場合は results/<日時>_<commit id の先頭>.json に保存する
+out_path = args.out
+if out_path is None:
+    commit = (git_info["commit"] or "unknown")[:8]
+    out_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"{started:%Y%m%d_%H%M%S}_{commit}.json"
+    )
+os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+with open(out_path, "w") as f:
+    json.dump(report, f, indent=4)
+print(f"saved: {out_path}")
@@ -0,0 +1,73 @@
+import argparse
+import time
+
+import lightgbm as lgb
+import numpy as np
+
+from models.trees import compile_trees
+
+
+def measure(predict, X: np.ndarray, repeat: int) -> float:
+    """
+    予測にかかる時間を測定する関数
+
+    Parameters
+    ----------
+    predict:
+        説明変数を受け取り予測値を返す関数
+    X: np.ndarray
+        説明変数
+    repeat: int
+        繰り返す回数
+
+    Returns
+    ----------
+    elapsed: float
+        1 回の予測にかかった時間 (マイクロ秒) の中央値
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(X)
+        times.append(time.perf_counter() - start)
+
+    return float(np.median(times)) * 1e6
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(
+    description="Booster.predict と, 木を配列に変換した CompiledTrees の予測の速度を比較する"
+)
+parser.add_argument("--rows", type=int, nargs="+", default=[1, 16, 100, 1000, 10000])
+parser.add_argument("--features", type=int, default=11)
+parser.add_argument("--rounds", type=int, default=100)
+parser.add_argument("--num-leaves", type=int, default=31)
+args = parser.parse_args()
+
+# config/default/LightGBM.json と同じパラメータで, 人工データにモデルを学習させる
+rng = np.random.default_rng(0)
+X_train = rng.random((5000, args.features))
+y_train = np.sin(X_train @ rng.random(args.features)) + 0.1 * rng.standard_normal(5000)
+params = {
+    "objective": "regression", "num_leaves": args.num_leaves,
+    "learning_rate": 0.05, "feature_fraction": 0.9, "verbose": -1
+}
+model = lgb.train(params, lgb.Dataset(X_train, y_train), args.rounds)
+
+start = time.perf_counter()
+trees = compile_trees(model)
+print(
+    f"compiled {len(trees.roots)} trees, {len(trees.feature)} nodes, depth {trees.depth} "
+    f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+)
+
+print(f"{'rows':>8} {'Booster':>12} {'Compiled':>12} {'ratio':>7} {'max diff':>10}")
+for rows in args.rows:
+    X = rng.random((rows, args.features))
+    diff = np.abs(model.predict(X) - trees.predict(X)).max()
+    repeat = max(5, 2000 // rows)
+    base = measure(model.predict, X, repeat)
+    fast = measure(trees.predict, X, repeat)
+    print(
+        f"{rows:>8} {base:>10.0f}us {fast:>10.0f}us {base / fast:>6.2f}x {diff:>10.1e}"
+    )
@@ -0,0 +1,539 @@
+import copy
+import datetime
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+from typing import List, Optional, Sequence
+
+# 実験結果の出力先のディレクトリと, 実験の一覧を記録するデータベースのパス
+OUTPUT_DIR = "../outputs"
+INDEX_PATH = OUTPUT_DIR + "/runs.sqlite"
+
+# 実験の一覧のテーブル
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_dir TEXT PRIMARY KEY,
+    kind TEXT,
+    model_type TEXT,
+    status TEXT,
+    started_at TEXT,
+    duration REAL,
+    config_hash TEXT,
+    run_key TEXT,
+    git_commit TEXT,
+    data_path TEXT,
+    lag INTEGER,
+    best_score REAL,
+    best_iteration INTEGER,
+    final_train REAL,
+    final_valid REAL,
+    artifacts TEXT,
+    has_model INTEGER,
+    config TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_score ON runs (model_type, best_score);
+CREATE INDEX IF NOT EXISTS runs_config_hash ON runs (config_hash);
+"""
+
+# 列を追加した後に作成するインデックス
+COLUMN_INDEXES = """
+CREATE INDEX IF NOT EXISTS runs_run_key ON runs (run_key);
+CREATE INDEX IF NOT EXISTS runs_has_model ON runs (model_type, has_model, best_score);
+"""
+
+COLUMNS = [
+    "run_dir", "kind", "model_type", "status", "started_at", "duration",
+    "config_hash", "run_key", "git_commit", "data_path", "lag", "best_score",
+    "best_iteration", "final_train", "final_valid", "artifacts", "has_model",
+    "config"
+]
+
+
+def normalize_config(cfg: dict) -> dict:
+    """
+    実験の内容に関係しない値を config から除く関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験で参照する config データ
+
+    Returns
+    ----------
+    normalized: dict
+        log の出力先などを除いた config データ
+    """
+    normalized = copy.deepcopy(cfg)
+
+    # log の出力先は実験ごとに書き換えられるため除く
+    normalized.pop("log", None)
+
+    return normalized
+
+
+def get_config_hash(cfg: dict) -> str:
+    """
+    config のハッシュ値を求める関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験で参照する config データ
+
+    Returns
+    ----------
+    config_hash: str
+        キーを並べ替えた JSON 文字列の sha256
+    """
+    text = json.dumps(normalize_config(cfg), sort_keys=True)
+    config_hash = hashlib.sha256(text.encode()).hexdigest()
+
+    return config_hash
+
+
+def get_run_dir(cfg: dict) -> str:
+    """
+    実験結果のディレクトリを求める関数
+
+    Parameters
+    ----------
+    cfg: dict
+        get_directory で出力先を書き換えた config データ
+
+    Returns
+    ----------
+    run_dir: str
+        実験結果のディレクトリのパス
+    """
+    return os.path.dirname(cfg["log"]["log_file"])
+
+
+def get_run_key(
+        cfg: dict, kind: str, data_digest: str, git_commit: str,
+        diff_digest: str
+    ) -> str:
+    """
+    同じ実験かどうかを判断するためのキーを作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験で参照する config データ
+    kind: str
+        実験の種類, "train" もしくは "cv"
+    data_digest: str
+        データのハッシュ値
+    git_commit: str
+        実験に使うコードの commit id
+    diff_digest: str
+        commit されていない変更のハッシュ値
+
+    Returns
+    ----------
+    run_key: str
+        config, データ, コードが全て同じ実験で共通のキー
+    """
+    items = {
+        "kind": kind,
+        "config_hash": get_config_hash(cfg),
+        "data": data_digest,
+        "commit": git_commit,
+        "diff": diff_digest
+    }
+    text = json.dumps(items, sort_keys=True)
+    run_key = hashlib.sha256(text.encode()).hexdigest()
+
+    return run_key
+
+
+def write_run_info(
+        cfg: dict, date_time: datetime.datetime, run_key: Optional[str] = None
+    ) -> None:
+    """
+    実験の開始時に run.json を書き出す関数
+
+    Parameters
+    ----------
+    cfg: dict
+        get_directory で出力先を書き換えた config データ
+    date_time: datetime.datetime
+        実験を開始した時刻のインスタンス
+    run_key: Optional[str] = None
+        get_run_key で作成したキー
+
+    Returns
+    ----------
+    None
+    """
+    info = {
+        "started_at": date_time.isoformat(),
+        "config_hash": get_config_hash(cfg),
+        "run_key": run_key,
+        "config": cfg
+    }
+    with open(os.path.join(get_run_dir(cfg), "run.json"), "w") as f:
+        json.dump(info, f, indent=4)
+
+
+def finish_run(
+        cfg: dict, summary: dict, git_commit: Optional[str] = None,
+        kind: str = "train", pending: Optional[List[str]] = None,
+        index_path: str = INDEX_PATH
+    ) -> None:
+    """
+    実験の終了時に結果を run.json に追記し, 実験の一覧に登録する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        get_directory で出力先を書き換えた config データ
+    summary: dict
+        best_score, best_iteration, final_train, final_valid を含む辞書
+    git_commit: Optional[str] = None
+        実験に使ったコードの commit id
+    kind: str = "train"
+        実験の種類, "train" もしくは "cv"
+    pending: Optional[List[str]] = None
+        まだ保存されていないが, 実験の成果物となるファイルのパス
+    index_path: str = INDEX_PATH
+        実験の一覧を記録するデータベースのパス
+
+    Returns
+    ----------
+    None
+    """
+    run_dir = get_run_dir(cfg)
+    info_path = os.path.join(run_dir, "run.json")
+    with open(info_path) as f:
+        info = json.load(f)
+
+    info["ended_at"] = datetime.datetime.now().isoformat()
+    info["kind"] = kind
+    info["git_commit"] = git_commit
+    info["summary"] = {
+        key: summary.get(key)
+        for key in ["best_score", "best_iteration", "final_train", "final_valid"]
+    }
+
+    # 一時ファイルに書き込んでから名前を変更する
+    tmp_path = f"{info_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(info, f, indent=4)
+    os.replace(tmp_path, info_path)
+
+    index_run(run_dir, pending, index_path)
+
+
+def collect_run(
+        run_dir: str, output_dir: str = OUTPUT_DIR,
+        pending: Optional[List[str]] = None
+    ) -> Optional[dict]:
+    """
+    実験結果のディレクトリから実験の一覧に登録する値を集める関数
+
+    Parameters
+    ----------
+    run_dir: str
+        実験結果のディレクトリのパス
+    output_dir: str = OUTPUT_DIR
+        実験結果の出力先のディレクトリ
+    pending: Optional[List[str]] = None
+        まだ保存されていないが, 実験の成果物となるファイルのパス
+
+    Returns
+    ----------
+    row: Optional[dict]
+        テーブルの 1 行分の辞書, run.json が無い場合は None
+    """
+    info_path = os.path.join(run_dir, "run.json")
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path) as f:
+        info = json.load(f)
+
+    cfg = info["config"]
+    summary = info.get("summary", {})
+    started_at = datetime.datetime.fromisoformat(info["started_at"])
+
+    # 終了していない実験は metrics.jsonl の最後の行までを記録する
+    if "ended_at" in info:
+        status = "finished"
+        ended_at = datetime.datetime.fromisoformat(info["ended_at"])
+        duration = (ended_at - started_at).total_seconds()
+    else:
+        status = "incomplete"
+        duration = None
+        metrics_path = os.path.join(run_dir, "metrics.jsonl")
+        if os.path.exists(metrics_path):
+            with open(metrics_path) as f:
+                lines = f.read().splitlines()
+            if lines:
+                last = json.loads(lines[-1])
+                duration = last["time"] - started_at.timestamp()
+
+    # 描画中の画像などは, 実験結果のディレクトリにあるものだけを加える
+    artifacts = {
+        name for name in os.listdir(run_dir)
+        if not name.startswith(".") and ".tmp-" not in name
+    }
+    # ディレクトリが消えていても失敗しないよう, ファイルは参照せずにパスのみで比べる
+    for path in pending or []:
+        if os.path.abspath(os.path.dirname(path)) == os.path.abspath(run_dir):
+            artifacts.add(os.path.basename(path))
+    artifacts = sorted(artifacts)
+
+    row = {
+        "run_dir": os.path.relpath(run_dir, output_dir),
+        "kind": info.get("kind"),
+        "model_type": cfg["model_type"],
+        "status": status,
+        "started_at": info["started_at"],
+        "duration": duration,
+        "config_hash": info["config_hash"],
+        "run_key": info.get("run_key"),
+        "git_commit": info.get("git_commit"),
+        "data_path": cfg.get("data_path"),
+        "lag": cfg.get("lag"),
+        "best_score": summary.get("best_score"),
+        "best_iteration": summary.get("best_iteration"),
+        "final_train": summary.get("final_train"),
+        "final_valid": summary.get("final_valid"),
+        "artifacts": json.dumps(artifacts),
+        "has_model": int("model" in artifacts),
+        "config": json.dumps(normalize_config(cfg), sort_keys=True)
+    }
+
+    return row
+
+
+def connect(index_path: str = INDEX_PATH) -> sqlite3.Connection:
+    """
+    実験の一覧のデータベースに接続する関数
+
+    sweep では複数のプロセスから同時に書き込むため, WAL モードとし待ち時間を設ける.
+
+    Parameters
+    ----------
+    index_path: str = INDEX_PATH
+        実験の一覧を記録するデータベースのパス
+
+    Returns
+    ----------
+    conn: sqlite3.Connection
+        データベースへの接続
+    """
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    conn = sqlite3.connect(index_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    # 古いデータベースに後から追加した列を加える
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+    with conn:
+        for column in COLUMNS:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE runs ADD COLUMN {column}")
+        # has_model を追加した場合は, 登録済みの行の値を artifacts から埋める
+        if "has_model" not in existing:
+            conn.execute(
+                "UPDATE runs SET has_model = EXISTS ("
+                "SELECT 1 FROM json_each(runs.artifacts) WHERE value = 'model')"
+            )
+    conn.executescript(COLUMN_INDEXES)
+
+    return conn
+
+
+def upsert_rows(conn: sqlite3.Connection, rows: List[dict]) -> None:
+    """
+    実験の一覧に行を登録する関数, 同じディレクトリの行は上書きする
+
+    Parameters
+    ----------
+    conn: sqlite3.Connection
+        データベースへの接続
+    rows: List[dict]
+        collect_run で作成した辞書のリスト
+
+    Returns
+    ----------
+    None
+    """
+    placeholders = ", ".join("?" for _ in COLUMNS)
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO runs ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+            [[row[column] for column in COLUMNS] for row in rows]
+        )
+
+
+def index_run(
+        run_dir: str, pending: Optional[List[str]] = None,
+        index_path: str = INDEX_PATH
+    ) -> None:
+    """
+    1 つの実験を実験の一覧に登録する関数
+
+    Parameters
+    ----------
+    run_dir: str
+        実験結果のディレクトリのパス
+    pending: Optional[List[str]] = None
+        まだ保存されていないが, 実験の成果物となるファイルのパス
+    index_path: str = INDEX_PATH
+        実験の一覧を記録するデータベースのパス
+
+    Returns
+    ----------
+    None
+    """
+    output_dir = os.path.dirname(index_path)
+    row = collect_run(run_dir, output_dir, pending)
+    if row is None:
+        return
+
+    conn = connect(index_path)
+    try:
+        upsert_rows(conn, [row])
+    finally:
+        conn.close()
+
+
+def rebuild_index(index_path: str = INDEX_PATH) -> int:
+    """
+    出力先のディレクトリを走査して実験の一覧を作り直す関数
+
+    Parameters
+    ----------
+    index_path: str = INDEX_PATH
+        実験の一覧を記録するデータベースのパス
+
+    Returns
+    ----------
+    n_runs: int
+        登録した実験の数
+    """
+    # outputs/<model_type>/<date>/<time>/run.json を探す
+    output_dir = os.path.dirname(index_path)
+    rows = []
+    for info_path in sorted(glob.glob(os.path.join(output_dir, "*", "*", "*", "run.json"))):
+        row = collect_run(os.path.dirname(info_path), output_dir)
+        if row is not None:
+            rows.append(row)
+
+    conn = connect(index_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM runs")
+        upsert_rows(conn, rows)
+    finally:
+        conn.close()
+
+    return len(rows)
+
+
+def query_runs(
+        where: Optional[str] = None, params: Sequence = (),
+        order_by: str = "best_score", descending: bool = False,
+        limit: Optional[int] = 20, columns: Optional[List[str]] = None,
+        index_path: str = INDEX_PATH
+    ) -> List[dict]:
+    """
+    実験の一覧から条件に合う実験を取り出す関数
+
+    Parameters
+    ----------
+    where: Optional[str] = None
+        SQL の WHERE 句, config の値は json_extract(config, '$.params.lr') で参照できる
+        値は直接書き込まずに ? とし, params で渡す
+    params: Sequence = ()
+        where の ? に順に割り当てる値
+    order_by: str = "best_score"
+        並べ替えに使う列, COLUMNS のいずれか
+    descending: bool = False
+        降順に並べるかどうか
+    limit: Optional[int] = 20
+        取り出す実験の数, None の場合は全て取り出す
+    columns: Optional[List[str]] = None
+        取り出す列, 指定しない場合は config と artifacts 以外の列
+    index_path: str = INDEX_PATH
+        実験の一覧を記録するデータベースのパス
+
+    Returns
+    ----------
+    runs: List[dict]
+        取り出した実験の辞書のリスト
+    """
+    if columns is None:
+        columns = [
+            column for column in COLUMNS if column not in ["config", "artifacts"]
+        ]
+
+    # 列の名前は SQL に直接埋め込むため, テーブルの列のみを受け付ける
+    for column in columns + [order_by]:
+        if column not in COLUMNS:
+            raise ValueError(f"unknown column: {column}, expected one of {COLUMNS}")
+
+    sql = f"SELECT {', '.join(columns)} FROM runs"
+    if where:
+        sql += f" WHERE {where}"
+    sql += f" ORDER BY {order_by} IS NULL, {order_by} {'DESC' if descending else 'ASC'}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+
+    conn = connect(index_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        runs = [dict(row) for row in conn.execute(sql, tuple(params))]
+    finally:
+        conn.close()
+
+    return runs
+
+
+def find_run(run_key: str, index_path: str = INDEX_PATH) -> Optional[dict]:
+    """
+    同じキーで完了した実験を探す関数
+
+    成果物のファイルが消えている実験は使わない.
+
+    Parameters
+    ----------
+    run_key: str
+        get_run_key で作成したキー
+    index_path: str = INDEX_PATH
+        実験の一覧を記録するデータベースのパス
+
+    Returns
+    ----------
+    run: Optional[dict]
+        最も新しい実験の行の辞書, 見つからない場合は None
+    """
+    if not os.path.exists(index_path):
+        return None
+
+    conn = connect(index_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        rows = [
+            dict(row) for row in conn.execute(
+                "SELECT * FROM runs WHERE run_key = ? AND status = 'finished' "
+                "ORDER BY started_at DESC",
+                (run_key,)
+            )
+        ]
+    finally:
+        conn.close()
+
+    output_dir = os.path.dirname(index_path)
+    for row in rows:
+        run_dir = os.path.join(output_dir, row["run_dir"])
+        if all(
+            os.path.exists(os.path.join(run_dir, name))
+            for name in json.loads(row["artifacts"])
+        ):
+            return row
+
+    return None
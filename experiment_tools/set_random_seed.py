@@ -1,13 +1,23 @@
 import random
+import sys
+from typing import Optional
 
 import numpy as np
-import torch
+
+# fix_seed で指定されたシード値, torch を後から読み込んだ場合に seed_torch で適用する
+_seed: Optional[int] = None
+
+# torch に適用済みのシード値
+_torch_seed: Optional[int] = None
 
 
 def fix_seed(seed: int) -> None:
     """
     各種機械学習フレームワークの乱数シードを固定する関数
 
+    torch は読み込みに時間がかかるため, 既に読み込まれている場合のみここで固定する.
+    読み込まれていない場合はシード値を記録し, torch を使う関数が seed_torch で適用する.
+
     Parameters
     ----------
     seed: int
@@ -24,6 +34,30 @@ def fix_seed(seed: int) -> None:
     np.random.seed(seed)
 
     # PyTorch
-    torch.manual_seed(seed)
-    torch.cuda.manual_seed_all(seed)
+    global _seed, _torch_seed
+    _seed = seed
+    _torch_seed = None
+    if "torch" in sys.modules:
+        seed_torch()
+
+
+def seed_torch() -> None:
+    """
+    fix_seed で記録したシード値を torch に適用する関数
+
+    torch を読み込んだ後に呼ぶ. 同じシード値を適用済みの場合は, 乱数の状態を戻さないよう何もしない.
+
+    Returns
+    ----------
+    None
+    """
+    global _torch_seed
+    if _seed is None or _torch_seed == _seed:
+        return
+
+    import torch
+
+    torch.manual_seed(_seed)
+    torch.cuda.manual_seed_all(_seed)
     torch.backends.cudnn.deterministic = True
+    _torch_seed = _seed
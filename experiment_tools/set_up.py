@@ -1,12 +1,28 @@
 import datetime
+import functools
+import hashlib
+import importlib.metadata
+import json
 import logging
 import os
 import platform
 import subprocess
+import sys
+import threading
+from typing import Optional, Tuple
 
+from experiment_tools.run_index import (
+    OUTPUT_DIR, find_run, finish_run, get_run_key, write_run_info
+)
 from experiment_tools.set_random_seed import fix_seed
 from experiment_tools.start_logging import get_logger
 
+# 実験環境を log に記録しているスレッド
+_environment_thread = None
+
+# 実験環境を記録するスレッドが取得した Git の情報, 実験の終了時に使い回す
+_git_info = None
+
 
 def get_directory(cfg: dict, date_time: datetime.datetime) -> dict:
     """
@@ -29,19 +45,26 @@ def get_directory(cfg: dict, date_time: datetime.datetime) -> dict:
     model_output_dir = output_dir + "/" + cfg["model_type"]
 
     # config 内の "model_type" の値が存在しない場合はディレクトリを新たに作成する
-    if cfg["model_type"] not in os.listdir(output_dir):
-        os.mkdir(model_output_dir)
+    # 並列に実験を行う場合に備え, 既に作成されていても失敗しないようにする
+    os.makedirs(model_output_dir, exist_ok=True)
 
     # 同日に同じモデルで実験を行っていない場合は日付のディレクトリを新たに作成する
     date = str(date_time.date())
     date_dir = model_output_dir + "/" + date
-    if date not in os.listdir(model_output_dir):
-        os.mkdir(date_dir)
+    os.makedirs(date_dir, exist_ok=True)
 
     # 実験開始時刻のディレクトリを作成する
+    # 同時刻に開始した実験がある場合は連番を付けて区別する
     time = str(date_time.time()).split(".")[0].replace(":", "-")
     time_dir = date_dir + "/" + time
-    os.mkdir(time_dir)
+    suffix = 0
+    while True:
+        try:
+            os.mkdir(time_dir)
+            break
+        except FileExistsError:
+            suffix += 1
+            time_dir = date_dir + "/" + time + f"-{suffix}"
 
     # config データの出力先のディレクトリを上書きする
     cfg["log"]["log_file"] = time_dir + "/" + cfg["log"]["log_file"]
@@ -49,42 +72,157 @@ def get_directory(cfg: dict, date_time: datetime.datetime) -> dict:
     return cfg
 
 
-def get_git_info(logger: logging.Logger) -> logging.Logger:
+def get_git_info() -> dict:
     """
-    Gitの情報を取得し, 実験者環境を log ファイルに記録する関数
-
-    Parameters
-    ----------
-    logger: logging.Logger
-        実験の結果を記録する log データ
+    Git の情報を取得する関数
 
     Returns
     ----------
-    logger: logging.Logger
-        実験の結果を記録する log データ
+    git_info: dict
+        commit id と実験者名の辞書
     """
     # commit id を取得する
-    git_info = "commit id: "
-    git_info += subprocess.check_output(
+    commit = subprocess.check_output(
         ["git", "rev-parse", "HEAD"]
     ).decode().strip()
 
     # 実験者名を取得する
-    git_name = "username: "
-    git_name += subprocess.check_output(
+    username = subprocess.check_output(
         ["git", "config", "user.name"]
     ).decode().strip()
 
-    # 上で取得したデータを log に記録する
-    logger.info(git_info)
-    logger.info(git_name)
+    git_info = {"commit": commit, "username": username}
 
-    return logger
+    return git_info
+
+
+@functools.lru_cache(maxsize=None)
+def get_os_info() -> dict:
+    """
+    OS の情報を取得する関数, 同じプロセスでは結果を使い回す
+
+    Returns
+    ----------
+    os_info: dict
+        OS のスペックの辞書
+    """
+    os_info = {
+        "OS": f"{platform.system()} {platform.release()}",
+        "Processor": platform.processor(),
+        "Machine": platform.machine(),
+        "Node": platform.node(),
+        "Python Version": platform.python_version()
+    }
+
+    return os_info
 
 
-def get_os_info(logger: logging.Logger) -> logging.Logger:
+@functools.lru_cache(maxsize=None)
+def get_package_list() -> Tuple[str, ...]:
     """
-    OSの情報を取得し, 実験者環境を log ファイルに記録する関数
+    インストールされているライブラリの一覧を取得する関数
+
+    pip3 list を別プロセスで実行せず, importlib.metadata で同じプロセス内から取得する.
+    同じプロセスでは結果を使い回す.
+
+    Returns
+    ----------
+    packages: Tuple[str, ...]
+        "名前==バージョン" の形式で並べたライブラリの一覧
+    """
+    packages = {
+        f"{dist.metadata['Name']}=={dist.version}"
+        for dist in importlib.metadata.distributions()
+    }
+
+    return tuple(sorted(packages, key=str.lower))
+
+
+def get_environment_key(git_info: dict) -> str:
+    """
+    実験環境の記録を使い回すためのキーを作成する関数
+
+    インタプリタ, commit id, ライブラリのインストール先の更新時刻が同じであれば,
+    同じ実験環境とみなす.
+
+    Parameters
+    ----------
+    git_info: dict
+        get_git_info で取得した辞書
+
+    Returns
+    ----------
+    key: str
+        実験環境のキー
+    """
+    # ライブラリを追加・削除するとインストール先のディレクトリの更新時刻が変わる
+    site_dirs = [
+        path for path in sys.path
+        if os.path.isdir(path) and os.path.basename(path) in ["site-packages", "dist-packages"]
+    ]
+    items = {
+        "executable": sys.executable,
+        "python_version": platform.python_version(),
+        "commit": git_info["commit"],
+        "site_mtimes": {path: os.stat(path).st_mtime_ns for path in site_dirs}
+    }
+    text = json.dumps(items, sort_keys=True)
+    key = hashlib.sha256(text.encode()).hexdigest()[:16]
+
+    return key
+
+
+def record_environment(
+        git_info: Optional[dict] = None, output_dir: str = "../outputs"
+    ) -> str:
+    """
+    実験環境を JSON ファイルに書き出す関数
+
+    同じ実験環境のファイルが既にあれば書き出さずにそのパスを返す.
+    sweep では試行を始める前に 1 回だけ呼び, 各試行の log からはパスのみを参照する.
+
+    Parameters
+    ----------
+    git_info: Optional[dict] = None
+        get_git_info で取得した辞書, 指定しない場合は取得する
+    output_dir: str = "../outputs"
+        実験結果の出力先のディレクトリ
+
+    Returns
+    ----------
+    env_path: str
+        実験環境を書き出したファイルのパス
+    """
+    if git_info is None:
+        git_info = get_git_info()
+
+    env_dir = output_dir + "/env"
+    env_path = env_dir + "/" + get_environment_key(git_info) + ".json"
+    if os.path.exists(env_path):
+        return env_path
+
+    env = {
+        "git": git_info,
+        "os": get_os_info(),
+        "executable": sys.executable,
+        "packages": list(get_package_list())
+    }
+
+    # 並列に実験を行う場合に備え, 一時ファイルに書き込んでから名前を変更する
+    os.makedirs(env_dir, exist_ok=True)
+    tmp_path = f"{env_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w") as f:
+        json.dump(env, f, indent=4)
+    os.replace(tmp_path, env_path)
+
+    return env_path
+
+
+def log_environment(logger: logging.Logger) -> logging.Logger:
+    """
+    実験者の環境を log ファイルに記録する関数
+
+    ライブラリの一覧は record_environment で書き出したファイルのパスのみを記録する.
 
     Parameters
     ----------
@@ -96,78 +234,196 @@ def get_os_info(logger: logging.Logger) -> logging.Logger:
     logger: logging.Logger
         実験の結果を記録する log データ
     """
+    global _git_info
+
+    git_info = get_git_info()
+    _git_info = git_info
+    env_path = record_environment(git_info)
+
     # OS のスペックをまとめる
     os_info = "\n\n"
-    spec = [
-        f"\tOS: {platform.system()} {platform.release()}\n",
-        f"\tProcessor: {platform.processor()}\n",
-        f"\tMachine: {platform.machine()}\n",
-        f"\tNode: {platform.node()}\n",
-        f"\tPython Version: {platform.python_version()}\n",
-    ]
-    for item in spec:
-        os_info += item
+    for name, value in get_os_info().items():
+        os_info += f"\t{name}: {value}\n"
 
-    # 上でまとめたスペックを log に記録する
+    # 上で取得したデータを log に記録する
+    logger.info(f"commit id: {git_info['commit']}")
+    logger.info(f"username: {git_info['username']}")
     logger.info(f"OS infomation: {os_info}")
+    logger.info(f"environment: {env_path}")
 
     return logger
 
 
-def get_pip_list(logger: logging.Logger) -> logging.Logger:
+def get_code_state() -> Tuple[str, str]:
     """
-    使用ライブラリの情報を取得し, Pip リストを log ファイルに記録する関数
+    実験に使うコードの commit id と, commit されていない変更のハッシュ値を取得する関数
+
+    git diff は git status で変更が見つかった場合のみ実行する.
+
+    Returns
+    ----------
+    commit: str
+        commit id
+    diff_digest: str
+        commit されていない変更の sha256, 変更がない場合は空の差分の sha256
+    """
+    commit = subprocess.check_output(
+        ["git", "rev-parse", "HEAD"]
+    ).decode().strip()
+    status = subprocess.check_output(
+        ["git", "status", "--porcelain", "--untracked-files=no"]
+    )
+    diff = subprocess.check_output(["git", "diff", "HEAD"]) if status.strip() else b""
+
+    return commit, hashlib.sha256(diff).hexdigest()
+
+
+def compute_run_key(cfg: dict, kind: str = "train") -> str:
+    """
+    config, データ, コードから実験のキーを求める関数
+
+    commit されていない変更がある場合は, その差分もキーに含める.
+    データのハッシュ値は同じプロセスで使い回され, キャッシュのキーの作成でも共有される.
+    実験ごとに 1 回だけ呼び, 結果を find_completed_run と start_experiment に渡す.
 
     Parameters
     ----------
-    logger: logging.Logger
-        実験の結果を記録する log データ
+    cfg: dict
+        実験で参照する config データ
+    kind: str = "train"
+        実験の種類, "train" もしくは "cv"
 
     Returns
     ----------
-    logger: logging.Logger
-        実験の結果を記録する log データ
+    run_key: str
+        config, データ, コードが全て同じ実験で共通のキー
     """
-    # Pip リストを取得してまとめる
-    pip_list = "pip3 list:\n\n"
-    pip_list += subprocess.check_output(
-        ["pip3", "list"]
-    ).decode().strip()
-    pip_list += "\n"
+    from utils.cache import data_hash
 
-    # 上でまとめた Pip リストを log に記録する
-    logger.info(pip_list)
+    commit, diff_digest = get_code_state()
+    run_key = get_run_key(
+        cfg, kind, data_hash(cfg["data_path"]), commit, diff_digest
+    )
 
-    return logger
+    return run_key
 
 
-def start_experiment(cfg: dict) -> logging.Logger:
+def find_completed_run(run_key: str) -> Optional[dict]:
+    """
+    config, データ, コードが全て同じで完了した実験の結果を探す関数
+
+    Parameters
+    ----------
+    run_key: str
+        compute_run_key で求めたキー
+
+    Returns
+    ----------
+    summary: Optional[dict]
+        保存済みの実験の出力先のディレクトリと評価値, 見つからない場合は None
+    """
+    run = find_run(run_key)
+    if run is None:
+        return None
+
+    summary = {
+        "out_dir": os.path.join(OUTPUT_DIR, run["run_dir"], ""),
+        "best_score": run["best_score"],
+        "best_iteration": run["best_iteration"],
+        "final_train": run["final_train"],
+        "final_valid": run["final_valid"],
+        "reused": True
+    }
+
+    return summary
+
+
+def wait_environment() -> None:
+    """
+    実験環境の記録が終わるまで待つ関数
+
+    Returns
+    ----------
+    None
+    """
+    global _environment_thread
+    if _environment_thread is not None:
+        _environment_thread.join()
+        _environment_thread = None
+
+
+def start_experiment(cfg: dict, run_key: Optional[str] = None) -> logging.Logger:
     """
     実験の環境をまとめて, log の記録を開始する関数
 
+    実験環境の記録はバックグラウンドのスレッドで行い, 学習をすぐに始められるようにする.
+
     Parameters
     ----------
     cfg: dict
         実験で参照する config データ
+    run_key: Optional[str] = None
+        compute_run_key で求めたキー, 指定しない場合は同じ実験として使い回されない
 
     Returns
     ----------
     logger: logging.Logger
         実験の結果を記録する log データ
     """
+    global _environment_thread, _git_info
+
+    # 同じプロセスで前の実験の記録が残っている場合は, log を初期化する前に待つ
+    wait_environment()
+    _git_info = None
+
     # 実験開始時の時刻を取得し, 出力先のディレクトリを作成する
     date_time = datetime.datetime.now()
     cfg = get_directory(cfg, date_time)
 
+    # 実験の一覧を作り直せるように, 開始時刻と config を書き出す
+    write_run_info(cfg, date_time, run_key)
+
     # log の初期化を行う
     logger = get_logger(cfg)
 
     # 各種機械学習フレームワークの乱数シードを固定する
     fix_seed(cfg["seed"])
 
-    # 実験環境を log に記録する
-    logger = get_git_info(logger)
-    logger = get_os_info(logger)
-    logger = get_pip_list(logger)
+    # 実験環境をバックグラウンドで log に記録する
+    # スレッドは daemon にしないため, プロセスの終了時には記録が終わるまで待つ
+    _environment_thread = threading.Thread(
+        target=log_environment, args=(logger,), name="log_environment"
+    )
+    _environment_thread.start()
 
     return logger
+
+
+def finish_experiment(cfg: dict, summary: dict, kind: str = "train") -> None:
+    """
+    実験の結果を実験の一覧 (outputs/runs.sqlite) に登録する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験で参照する config データ
+    summary: dict
+        best_score, best_iteration, final_train, final_valid を含む辞書
+    kind: str = "train"
+        実験の種類, "train" もしくは "cv"
+
+    Returns
+    ----------
+    None
+    """
+    from utils.render import pending_paths
+
+    # 実験環境の記録を先に終わらせ, そこで取得した commit id を使う
+    wait_environment()
+    git_info = _git_info if _git_info is not None else get_git_info()
+
+    # 描画中の画像も成果物として登録する
+    finish_run(
+        cfg, summary, git_commit=git_info["commit"], kind=kind,
+        pending=pending_paths()
+    )
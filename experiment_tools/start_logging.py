@@ -1,11 +1,101 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import time
 from logging import FileHandler, Formatter, getLogger
+from logging.handlers import QueueHandler, QueueListener
+
+# logger の名前ごとに, ファイルへの書き込みを行うリスナー
+_listeners = {}
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    log の整形をリスナーのスレッドで行う QueueHandler
+
+    QueueHandler は呼び出し元のスレッドでメッセージを整形してからキューに入れるが,
+    同じプロセス内のスレッドに渡すだけであれば不要なため, そのまま渡す.
+    そのため引数として渡したオブジェクトは, log を記録した後に変更しないこと.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def start_listener(logger: logging.Logger, handler: logging.Handler) -> None:
+    """
+    logger の出力をキュー経由でリスナーのスレッドに渡すように設定する関数
+
+    Parameters
+    ----------
+    logger: logging.Logger
+        設定する logger
+    handler: logging.Handler
+        リスナーのスレッドで実際に書き込みを行う handler
+
+    Returns
+    ----------
+    None
+    """
+    # 同じプロセスで続けて実験を行う場合に備え, 前の実験の log を書き切ってから handler を外す
+    stop_listener(logger.name)
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
+        old_handler.close()
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    _listeners[logger.name] = listener
+
+
+def stop_listener(name: str) -> None:
+    """
+    キューに残った log を書き切り, リスナーを止める関数
+
+    Parameters
+    ----------
+    name: str
+        止めるリスナーの logger の名前
+
+    Returns
+    ----------
+    None
+    """
+    listener = _listeners.pop(name, None)
+    if listener is None:
+        return
+
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def stop_logging() -> None:
+    """
+    全てのリスナーを止める関数, プロセスの終了時に自動で呼ばれる
+
+    Returns
+    ----------
+    None
+    """
+    for name in list(_listeners):
+        stop_listener(name)
+
+
+atexit.register(stop_logging)
 
 
 def get_logger(cfg: dict) -> logging.Logger:
     """
     log の初期化を行う関数
 
+    ファイルへの書き込みとメッセージの整形はリスナーのスレッドで行い, 学習を止めない.
+    データフレームなどの大きなオブジェクトは f-string ではなく
+    logger.info("%s", df) の形で渡すと, 文字列への変換もリスナーのスレッドで行われる.
+
     Parameters
     ----------
     cfg: dict
@@ -24,6 +114,55 @@ def get_logger(cfg: dict) -> logging.Logger:
     handler = FileHandler(cfg["log"]["log_file"], mode="w")
     formatter = Formatter(cfg["log"]["log_formatter"])
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    start_listener(logger, handler)
 
     return logger
+
+
+def get_metrics_logger(cfg: dict) -> logging.Logger:
+    """
+    評価値を JSONL 形式で記録する logger を作成する関数
+
+    実験の log と同じディレクトリの metrics.jsonl に 1 行ずつ書き込み, 行ごとに flush する.
+    学習の途中でもファイルを読めば進み具合を確認できる.
+
+    Parameters
+    ----------
+    cfg: dict
+        実験で参照する config データ
+
+    Returns
+    ----------
+    metrics_logger: logging.Logger
+        評価値を記録する logger, log_metrics に渡して使う
+    """
+    metrics_logger = getLogger(f"{__name__}.metrics")
+    metrics_logger.setLevel(logging.INFO)
+
+    # 実験の log には書き込まないようにする
+    metrics_logger.propagate = False
+
+    out_dir = os.path.dirname(cfg["log"]["log_file"])
+    handler = FileHandler(os.path.join(out_dir, "metrics.jsonl"), mode="w")
+    handler.setFormatter(Formatter("%(message)s"))
+    start_listener(metrics_logger, handler)
+
+    return metrics_logger
+
+
+def log_metrics(metrics_logger: logging.Logger, metrics: dict) -> None:
+    """
+    評価値を JSONL 形式で 1 行記録する関数
+
+    Parameters
+    ----------
+    metrics_logger: logging.Logger
+        get_metrics_logger で作成した logger
+    metrics: dict
+        記録する評価値の辞書, 記録した時刻が "time" として追加される
+
+    Returns
+    ----------
+    None
+    """
+    metrics_logger.info(json.dumps({"time": time.time(), **metrics}))
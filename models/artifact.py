@@ -0,0 +1,245 @@
+import json
+import os
+from typing import TYPE_CHECKING, List
+
+import numpy as np
+
+from experiment_tools.run_index import normalize_config
+
+# lightgbm と torch は読み込みに時間がかかるため, 使う関数の中で読み込む
+if TYPE_CHECKING:
+    import lightgbm as lgb
+    from torch import nn
+
+# 成果物の形式のバージョン, 形式を変えた場合は上げる
+ARTIFACT_VERSION = 1
+
+# 重みの各 Tensor の先頭をそろえるバイト数
+ALIGNMENT = 64
+
+
+def write_manifest(artifact_dir: str, manifest: dict) -> None:
+    """
+    成果物の内容を記述した manifest.json を書き出す関数
+
+    Parameters
+    ----------
+    artifact_dir: str
+        成果物のディレクトリ
+    manifest: dict
+        成果物の内容を記述した辞書
+
+    Returns
+    ----------
+    None
+    """
+    with open(os.path.join(artifact_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=4)
+
+
+def save_lgb_artifact(
+        model: "lgb.Booster", cfg: dict, features: List[str], out_dir: str
+    ) -> str:
+    """
+    LightGBM のモデルを pickle を使わない形式で保存する関数
+
+    モデルは LightGBM のテキスト形式で, 最良のラウンドまでを保存する.
+
+    Parameters
+    ----------
+    model: lgb.Booster
+        学習させたモデルのインスタンス
+    cfg: dict
+        実験で参照した config データ
+    features: List[str]
+        説明変数の列名, 予測の際はこの順に並べる
+    out_dir: str
+        実験結果のディレクトリ
+
+    Returns
+    ----------
+    artifact_dir: str
+        成果物のディレクトリ
+    """
+    artifact_dir = os.path.join(out_dir, "model")
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    # best_iteration が設定されていれば, そのラウンドまでを保存する
+    model.save_model(os.path.join(artifact_dir, "model.txt"))
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "model_type": "LightGBM",
+        "features": list(features),
+        "best_iteration": model.best_iteration,
+        "model_file": "model.txt",
+        "config": normalize_config(cfg)
+    }
+    write_manifest(artifact_dir, manifest)
+
+    return artifact_dir
+
+
+def save_nn_artifact(
+        model: "nn.Module", cfg: dict, features: List[str], out_dir: str
+    ) -> str:
+    """
+    NeuralNetwork のモデルの重みを 1 つのバイナリファイルにまとめて保存する関数
+
+    各 Tensor は ALIGNMENT バイトにそろえて連続して書き込み,
+    位置と形状を manifest.json に記録する. 読み込む際はメモリマップで参照する.
+
+    Parameters
+    ----------
+    model: nn.Module
+        学習させたモデルのインスタンス
+    cfg: dict
+        実験で参照した config データ
+    features: List[str]
+        説明変数の列名, 予測の際はこの順に並べる
+    out_dir: str
+        実験結果のディレクトリ
+
+    Returns
+    ----------
+    artifact_dir: str
+        成果物のディレクトリ
+    """
+    artifact_dir = os.path.join(out_dir, "model")
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    tensors = []
+    offset = 0
+    with open(os.path.join(artifact_dir, "weights.bin"), "wb") as f:
+        for name, tensor in model.state_dict().items():
+            values = tensor.detach().cpu().contiguous().numpy()
+
+            # 先頭の位置をそろえるために 0 で埋める
+            padding = -offset % ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+
+            f.write(values.tobytes())
+            tensors.append({
+                "name": name,
+                "dtype": values.dtype.str,
+                "shape": list(values.shape),
+                "offset": offset
+            })
+            offset += values.nbytes
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "model_type": "NeuralNetwork",
+        "features": list(features),
+        "input_dim": len(features),
+        "output_dim": 1,
+        "weights_file": "weights.bin",
+        "tensors": tensors,
+        "config": normalize_config(cfg)
+    }
+    write_manifest(artifact_dir, manifest)
+
+    return artifact_dir
+
+
+class ModelArtifact():
+    """
+    保存した成果物から復元した, すぐに予測できるモデル
+
+    model は LightGBM の場合は lgb.Booster, NeuralNetwork の場合は評価モードの nn.Module であり,
+    recursive_forecast などの既存の関数にそのまま渡せる.
+    """
+    def __init__(self, manifest: dict, model):
+        self.manifest = manifest
+        self.model_type = manifest["model_type"]
+        self.features = manifest["features"]
+        self.config = manifest["config"]
+        self.model = model
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        説明変数から目的変数を予測するメソッド
+
+        Parameters
+        ----------
+        X: np.ndarray
+            features の順に列を並べた説明変数, 形状は (サンプル数, 特徴量の数)
+
+        Returns
+        ----------
+        y_preds: np.ndarray
+            目的変数の予測値, 形状は (サンプル数,)
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.features))
+        if self.model_type == "LightGBM":
+            return self.model.predict(X)
+
+        import torch
+
+        param = next(self.model.parameters())
+        with torch.inference_mode():
+            y_preds = self.model(torch.from_numpy(X).to(param))
+
+        return y_preds.reshape(-1).double().cpu().numpy()
+
+
+def load_artifact(artifact_dir: str, device: str = "cpu") -> ModelArtifact:
+    """
+    保存した成果物から予測できるモデルを復元する関数
+
+    pickle は使わず, LightGBM はテキスト形式から, NeuralNetwork は重みをメモリマップで参照して復元する.
+
+    Parameters
+    ----------
+    artifact_dir: str
+        成果物のディレクトリ
+    device: str = "cpu"
+        NeuralNetwork のモデルを置くデバイス, cpu の場合は重みをコピーしない
+
+    Returns
+    ----------
+    artifact: ModelArtifact
+        復元したモデル
+    """
+    with open(os.path.join(artifact_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest["version"] != ARTIFACT_VERSION:
+        raise ValueError(
+            f"unsupported artifact version: {manifest['version']}"
+        )
+
+    if manifest["model_type"] == "LightGBM":
+        import lightgbm as lgb
+
+        model = lgb.Booster(
+            model_file=os.path.join(artifact_dir, manifest["model_file"])
+        )
+        return ModelArtifact(manifest, model)
+
+    import torch
+
+    from models.networks import NeuralNetwork
+
+    # 重みはコピーせずにメモリマップで参照する, 書き込みはメモリ上でのみ反映される
+    buffer = np.memmap(
+        os.path.join(artifact_dir, manifest["weights_file"]), dtype=np.uint8, mode="c"
+    )
+    state_dict = {}
+    for item in manifest["tensors"]:
+        dtype = np.dtype(item["dtype"])
+        count = int(np.prod(item["shape"]))
+        values = np.frombuffer(
+            buffer, dtype=dtype, count=count, offset=item["offset"]
+        ).reshape(item["shape"])
+        state_dict[item["name"]] = torch.from_numpy(values)
+
+    # モデルの構造は config から作り, 重みは作り直さずに差し替える
+    with torch.device("meta"):
+        model = NeuralNetwork(
+            manifest["config"], manifest["input_dim"], manifest["output_dim"]
+        )
+    model.load_state_dict(state_dict, assign=True)
+    model = model.to(device).eval()
+
+    return ModelArtifact(manifest, model)
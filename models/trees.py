@@ -0,0 +1,305 @@
+from typing import TYPE_CHECKING, Optional, Union
+
+import numpy as np
+
+# lightgbm は読み込みに時間がかかるため, 型の注釈にのみ使う
+if TYPE_CHECKING:
+    import lightgbm as lgb
+
+# LightGBM が 0 とみなす値の範囲
+ZERO_THRESHOLD = 1e-35
+
+
+class UnsupportedModelError(ValueError):
+    """
+    配列に変換できない木を含むモデルを変換しようとした場合の例外
+    """
+
+
+class CompiledTrees():
+    """
+    LightGBM の全ての木を 1 つの配列にまとめ, NumPy で一度に辿って予測するクラス
+
+    各ノードは分岐に使う特徴量, 閾値, 左右の子ノードの位置, 葉の値を持つ.
+    葉は左右の子ノードを自分自身とし, 何度辿っても同じ葉に留まるようにする.
+    木は深い順に並べ, 各段ではまだ葉に到達していない可能性のある先頭の木のみを辿る.
+    """
+    def __init__(
+            self, feature: np.ndarray, threshold: np.ndarray,
+            left: np.ndarray, right: np.ndarray, value: np.ndarray,
+            default_left: np.ndarray, zero_missing: np.ndarray,
+            nan_missing: np.ndarray, roots: np.ndarray, depths: np.ndarray,
+            n_features: int, transform: Optional[str] = None, scale: float = 1.0
+        ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.default_left = default_left
+        self.zero_missing = zero_missing
+        self.nan_missing = nan_missing
+        # 木を深い順に並べ, 各段で辿る木の数を求めておく
+        order = np.argsort(-depths, kind="stable")
+        self.roots = roots[order]
+        self.depth = int(depths.max(initial=0))
+        self.active = [int((depths > level).sum()) for level in range(self.depth)]
+        self.n_features = n_features
+        self.transform = transform
+        self.scale = scale
+
+        # 左右の子ノードを交互に並べ, children[2 * node + 右に進むかどうか] で次のノードを引く
+        self.children = np.stack([left, right], axis=1).ravel()
+
+        # 欠損値を既定の方向に振り分けるノードがない場合は, 比較のみで辿れる
+        self.has_missing = bool(zero_missing.any() or nan_missing.any())
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """
+        各行が各木で到達する葉の位置を求めるメソッド
+
+        Parameters
+        ----------
+        X: np.ndarray
+            説明変数, 形状は (サンプル数, 特徴量の数)
+
+        Returns
+        ----------
+        nodes: np.ndarray
+            到達した葉のノードの位置, 形状は (サンプル数, 木の数)
+        """
+        # 行ごとの特徴量の先頭の位置, X を 1 次元にして特徴量を 1 回で取り出すために使う
+        X = np.ascontiguousarray(X)
+        base = (np.arange(len(X)) * X.shape[1])[:, None]
+        values = X.ravel()
+        nodes = np.tile(self.roots, (len(X), 1))
+
+        if not self.has_missing:
+            # 欠損値の扱いが "None" の場合, LightGBM は欠損値を 0 として比較する
+            values = np.nan_to_num(values, nan=0.0, posinf=np.inf, neginf=-np.inf)
+            for n_trees in self.active:
+                active = nodes[:, :n_trees]
+                go_right = values[base + self.feature[active]] > self.threshold[active]
+                nodes[:, :n_trees] = self.children[2 * active + go_right]
+
+            return nodes
+
+        for n_trees in self.active:
+            active = nodes[:, :n_trees]
+            x = values[base + self.feature[active]]
+            is_nan = np.isnan(x)
+            nan_missing = self.nan_missing[active]
+
+            # 欠損値を既定の方向に振り分けないノードでは, 欠損値を 0 として比較する
+            x = np.where(is_nan & ~nan_missing, 0.0, x)
+            use_default = (
+                (self.zero_missing[active] & (np.abs(x) <= ZERO_THRESHOLD))
+                | (nan_missing & is_nan)
+            )
+            go_right = np.where(
+                use_default, ~self.default_left[active], x > self.threshold[active]
+            )
+            nodes[:, :n_trees] = self.children[2 * active + go_right]
+
+        return nodes
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        説明変数から目的変数を予測するメソッド, Booster.predict と同じ値を返す
+
+        Parameters
+        ----------
+        X: np.ndarray
+            説明変数, 形状は (サンプル数, 特徴量の数)
+
+        Returns
+        ----------
+        y_preds: np.ndarray
+            目的変数の予測値, 形状は (サンプル数,)
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        y_preds = self.value[self.leaves(X)].sum(axis=1) * self.scale
+
+        if self.transform == "exp":
+            y_preds = np.exp(y_preds)
+        elif self.transform == "sigmoid":
+            y_preds = 1.0 / (1.0 + np.exp(-y_preds))
+
+        return y_preds
+
+
+class BoosterTrees():
+    """
+    配列に変換できないモデルについて, CompiledTrees と同じ呼び出し方で Booster.predict を使うクラス
+
+    カテゴリ変数による分岐, linear_tree, 多クラス分類のモデルに使う.
+    """
+    def __init__(
+            self, model: "lgb.Booster", num_iteration: Optional[int], reason: str
+        ):
+        self.model = model
+        self.num_iteration = num_iteration
+        self.reason = reason
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        説明変数から目的変数を予測するメソッド
+
+        Parameters
+        ----------
+        X: np.ndarray
+            説明変数, 形状は (サンプル数, 特徴量の数)
+
+        Returns
+        ----------
+        y_preds: np.ndarray
+            Booster.predict の予測値
+        """
+        return self.model.predict(X, num_iteration=self.num_iteration)
+
+
+def get_transform(objective: str) -> tuple:
+    """
+    目的関数から, 木の出力の合計に施す変換を求める関数
+
+    Parameters
+    ----------
+    objective: str
+        dump_model の "objective" の値 (例: "binary sigmoid:1")
+
+    Returns
+    ----------
+    transform: Optional[str]
+        変換の種類, 変換しない場合は None
+    sigmoid: float
+        sigmoid の係数, sigmoid を使わない場合は 1.0
+    """
+    name, *options = objective.split(" ")
+    options = dict(option.split(":", 1) for option in options if ":" in option)
+
+    if name in ["regression", "regression_l1", "huber", "fair", "quantile", "mape"]:
+        return None, 1.0
+    if name in ["poisson", "gamma", "tweedie"]:
+        return "exp", 1.0
+    if name == "binary":
+        return "sigmoid", float(options.get("sigmoid", 1.0))
+
+    raise UnsupportedModelError(f"unsupported objective: {objective}")
+
+
+def compile_trees(
+        model: "lgb.Booster", num_iteration: Optional[int] = None
+    ) -> Union[CompiledTrees, BoosterTrees]:
+    """
+    学習した LightGBM のモデルを CompiledTrees に変換する関数
+
+    数値の特徴量による分岐のみに対応し, カテゴリ変数や linear_tree, 多クラス分類のモデルは
+    変換せずに Booster.predict で予測する BoosterTrees を返す.
+
+    Parameters
+    ----------
+    model: lgb.Booster
+        学習させたモデルのインスタンス
+    num_iteration: Optional[int] = None
+        変換するラウンド数, 指定しない場合は best_iteration (なければ全てのラウンド) まで
+
+    Returns
+    ----------
+    trees: Union[CompiledTrees, BoosterTrees]
+        変換したモデル, 変換できない場合は Booster をそのまま使うモデル
+    """
+    dump = model.dump_model(num_iteration=num_iteration)
+    try:
+        return build_trees(dump)
+    except UnsupportedModelError as e:
+        return BoosterTrees(model, num_iteration, str(e))
+
+
+def build_trees(dump: dict) -> CompiledTrees:
+    """
+    dump_model の出力から木の配列を作成する関数
+
+    Parameters
+    ----------
+    dump: dict
+        Booster.dump_model の出力
+
+    Returns
+    ----------
+    trees: CompiledTrees
+        変換したモデル
+    """
+    if dump["num_tree_per_iteration"] != 1:
+        raise UnsupportedModelError("multiclass models are not supported")
+    transform, sigmoid = get_transform(dump["objective"])
+
+    feature = []
+    threshold = []
+    left = []
+    right = []
+    value = []
+    default_left = []
+    zero_missing = []
+    nan_missing = []
+    roots = []
+    depths = []
+
+    def add_node(node: dict, node_depth: int) -> int:
+        """
+        ノードとその子孫を配列に追加し, 追加したノードの位置を返す関数
+        """
+        index = len(feature)
+        feature.append(0)
+        threshold.append(0.0)
+        left.append(index)
+        right.append(index)
+        value.append(0.0)
+        default_left.append(False)
+        zero_missing.append(False)
+        nan_missing.append(False)
+
+        # 葉は左右の子ノードを自分自身のままとする
+        if "split_index" not in node:
+            if "leaf_coeff" in node:
+                raise UnsupportedModelError("linear trees are not supported")
+            value[index] = node["leaf_value"]
+            depths[-1] = max(depths[-1], node_depth)
+            return index
+
+        if node["decision_type"] != "<=":
+            raise UnsupportedModelError("categorical splits are not supported")
+        feature[index] = node["split_feature"]
+        threshold[index] = node["threshold"]
+        default_left[index] = node["default_left"]
+        zero_missing[index] = node["missing_type"] == "Zero"
+        nan_missing[index] = node["missing_type"] == "NaN"
+        left[index] = add_node(node["left_child"], node_depth + 1)
+        right[index] = add_node(node["right_child"], node_depth + 1)
+
+        return index
+
+    for tree in dump["tree_info"]:
+        depths.append(0)
+        roots.append(add_node(tree["tree_structure"], 0))
+
+    # random forest の場合, 木の出力は合計ではなく平均を取る
+    scale = 1.0 / max(len(roots), 1) if dump["average_output"] else 1.0
+
+    # sigmoid の係数は出力の合計に掛けてから変換する
+    scale *= sigmoid
+
+    return CompiledTrees(
+        feature=np.asarray(feature, dtype=np.intp),
+        threshold=np.asarray(threshold, dtype=np.float64),
+        left=np.asarray(left, dtype=np.intp),
+        right=np.asarray(right, dtype=np.intp),
+        value=np.asarray(value, dtype=np.float64),
+        default_left=np.asarray(default_left, dtype=bool),
+        zero_missing=np.asarray(zero_missing, dtype=bool),
+        nan_missing=np.asarray(nan_missing, dtype=bool),
+        roots=np.asarray(roots, dtype=np.intp),
+        depths=np.asarray(depths, dtype=np.intp),
+        n_features=dump["max_feature_idx"] + 1,
+        transform=transform,
+        scale=scale
+    )
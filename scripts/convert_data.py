@@ -0,0 +1,21 @@
+import argparse
+
+from utils.preprocessing import convert_to_columnar
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(
+    description="CSV を列ごとの .npy ファイルからなる形式に変換する"
+)
+parser.add_argument("csv_paths", nargs="+", help="変換する CSV ファイルのパス")
+parser.add_argument(
+    "--dtype", default="float32",
+    help="保存する際の型, none を指定すると CSV を読み込んだ型のままとする"
+)
+args = parser.parse_args()
+
+# 各 CSV ファイルを変換
+for csv_path in args.csv_paths:
+    dtype = None if args.dtype.lower() == "none" else args.dtype
+    out_dir = convert_to_columnar(csv_path, dtype=dtype)
+    print(f"{csv_path} -> {out_dir}")
@@ -0,0 +1,79 @@
+import argparse
+import os
+
+import pandas as pd
+
+from experiment_tools.set_up import (
+    compute_run_key, find_completed_run, finish_experiment, start_experiment
+)
+from utils.cfg_diff import get_config, get_diff
+from utils.cv import cross_validate_lgb, cross_validate_nn
+from utils.preprocessing import make_cv_splits
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(description="時系列の交差検証を行う")
+parser.add_argument(
+    "model_type", choices=["LightGBM", "NeuralNetwork"],
+    help="交差検証を行うモデルのタイプ"
+)
+parser.add_argument(
+    "--force", action="store_true",
+    help="同じ交差検証が完了していても学習し直す"
+)
+args = parser.parse_args()
+
+# torch は NeuralNetwork の場合のみ, 乱数シードを固定する前に読み込む
+if args.model_type == "NeuralNetwork":
+    import torch
+
+# config を取得
+default_filename = f"../config/default/{args.model_type}.json"
+exp_filename = f"../config/experiment/{args.model_type}.json"
+_, cfg, default_str, exp_str = get_config(default_filename, exp_filename)
+
+# config, データ, コードが全て同じ交差検証が完了していれば, 保存済みの結果を表示して終わる
+run_key = compute_run_key(cfg, kind="cv")
+if not args.force:
+    summary = find_completed_run(run_key)
+    if summary is not None:
+        print(f"reuse completed run: {summary['out_dir']}")
+        print(f"cv score: {summary['best_score']}")
+        raise SystemExit(0)
+
+# log を起動し config の差分を取得
+logger = start_experiment(cfg, run_key)
+logger = get_diff(default_str, exp_str, logger)
+
+# 交差検証に使うデータと fold の作成
+cv_out = make_cv_splits(cfg)
+logger.info(f"cv data records: {len(cv_out['cv_data'])}")
+for k, (train_idx, valid_idx) in enumerate(cv_out["folds"]):
+    logger.info(
+        f"fold {k + 1}: train [{train_idx[0]}, {train_idx[-1] + 1}), "
+        f"valid [{valid_idx[0]}, {valid_idx[-1] + 1})"
+    )
+
+# 各 fold を並列に学習
+if args.model_type == "LightGBM":
+    results = cross_validate_lgb(cfg, cv_out)
+else:
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    logger.info(f"device: {device}")
+    results = cross_validate_nn(cfg, cv_out, device)
+
+# 結果の出力先ディレクトリを指定
+out_dir = os.path.dirname(cfg["log"]["log_file"])
+
+# 各 fold の結果を保存
+results = pd.DataFrame(results)
+results.insert(0, "fold", range(1, len(results) + 1))
+results.to_csv(f"{out_dir}/cv_results.csv", index=False)
+logger.info("cv results:\n\n%s\n", results)
+logger.info(
+    f"cv score: {results['best_score'].mean()} "
+    f"(std {results['best_score'].std()})"
+)
+
+# 実験の一覧に登録
+finish_experiment(cfg, {"best_score": results["best_score"].mean()}, kind="cv")
@@ -0,0 +1,57 @@
+import argparse
+import time
+
+import pandas as pd
+
+from experiment_tools.run_index import COLUMNS, query_runs, rebuild_index
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(description="実験の一覧 (outputs/runs.sqlite) を検索する")
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+query_parser = subparsers.add_parser("query", help="条件に合う実験を表示する")
+query_parser.add_argument("--model-type", default=None, help="モデルのタイプで絞り込む")
+query_parser.add_argument(
+    "--where", default=None,
+    help="SQL の条件式 (例: \"json_extract(config, '$.params.learning_rate') < 0.1\")"
+)
+query_parser.add_argument(
+    "--order-by", default="best_score", choices=COLUMNS, help="並べ替えに使う列"
+)
+query_parser.add_argument("--desc", action="store_true", help="降順に並べる")
+query_parser.add_argument("--limit", type=int, default=20, help="表示する実験の数")
+query_parser.add_argument(
+    "--columns", nargs="+", default=None, choices=COLUMNS, help="表示する列"
+)
+
+subparsers.add_parser("rebuild", help="outputs を走査して実験の一覧を作り直す")
+args = parser.parse_args()
+
+if args.command == "rebuild":
+    start = time.perf_counter()
+    n_runs = rebuild_index()
+    print(f"indexed {n_runs} runs in {time.perf_counter() - start:.2f}s")
+else:
+    # 条件をまとめる
+    conditions = []
+    params = []
+    if args.model_type is not None:
+        conditions.append("model_type = ?")
+        params.append(args.model_type)
+    if args.where is not None:
+        conditions.append(f"({args.where})")
+
+    start = time.perf_counter()
+    runs = query_runs(
+        where=" AND ".join(conditions) or None,
+        params=params,
+        order_by=args.order_by,
+        descending=args.desc,
+        limit=args.limit,
+        columns=args.columns
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+
+    print(pd.DataFrame(runs).to_string(index=False))
+    print(f"\n{len(runs)} runs ({elapsed:.1f} ms)")
@@ -0,0 +1,48 @@
+import argparse
+
+from models.artifact import load_artifact
+from utils.serving import find_artifact_dir, make_server
+
+
+# 引数を取得
+parser = argparse.ArgumentParser(description="保存したモデルで予測を行う HTTP サーバーを起動する")
+parser.add_argument(
+    "run", nargs="?", default=None,
+    help="実験結果のディレクトリ (例: LightGBM/2024-01-01/00-00-00), "
+         "指定しない場合は実験の一覧から --model-type の最も評価値の良い実験を使う"
+)
+parser.add_argument(
+    "--model-type", default=None, choices=["LightGBM", "NeuralNetwork"],
+    help="run を指定しない場合に探すモデルのタイプ, run を指定しない場合は必須"
+)
+parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+parser.add_argument("--port", type=int, default=8000, help="待ち受けるポート")
+parser.add_argument("--max-batch-size", type=int, default=64, help="1 回の予測でまとめる最大の行数")
+parser.add_argument(
+    "--max-latency-ms", type=float, default=0.0,
+    help="最初の依頼から後続の依頼を待つ時間 (ミリ秒), 0 の場合は待たずに届いている分だけをまとめる"
+)
+args = parser.parse_args()
+
+# モデルのタイプごとに評価指標が異なるため, 実験の一覧から探す場合はタイプを指定させる
+if args.run is None and args.model_type is None:
+    parser.error("--model-type is required when run is not given")
+
+# モデルを読み込み, サーバーを起動する
+artifact_dir = find_artifact_dir(args.run, args.model_type)
+artifact = load_artifact(artifact_dir)
+server = make_server(
+    artifact, args.host, args.port, args.max_batch_size, args.max_latency_ms
+)
+print(
+    f"serving {artifact.model_type} from {artifact_dir} "
+    f"on http://{args.host}:{server.server_port}"
+)
+
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
+    server.batcher.close()
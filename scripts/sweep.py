@@ -0,0 +1,170 @@
+import datetime
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+from typing import Optional
+
+import pandas as pd
+
+from experiment_tools.set_up import record_environment
+from utils.cfg_diff import get_config
+from utils.preprocessing import make_splits
+from utils.scheduler import HyperbandScheduler, get_lgb_pruning_callback
+from utils.sweep import (
+    apply_overrides, attach_splits, get_preprocessing_key, get_trials,
+    release, share_splits
+)
+
+
+def run_trial(
+        model_type: str, default_str: str, trial_cfg: dict,
+        descriptor: dict, threads: int,
+        scheduler: Optional[HyperbandScheduler] = None, bracket: int = 0,
+        force: bool = False
+    ) -> dict:
+    """
+    子プロセスで 1 つの試行を行う関数
+
+    Parameters
+    ----------
+    model_type: str
+        実験するモデルのタイプ
+    default_str: str
+        デフォルト値の config データを文字列としたもの
+    trial_cfg: dict
+        試行に使う値の config データ
+    descriptor: dict
+        共有メモリに配置された分割済みのデータの情報
+    threads: int
+        試行ごとに使うスレッド数
+    scheduler: Optional[HyperbandScheduler] = None
+        途中で試行を打ち切るスケジューラー, 打ち切らない場合は None
+    bracket: int = 0
+        試行を割り当てた bracket の番号
+    force: bool = False
+        同じ実験が完了していても学習し直すかどうか
+
+    Returns
+    ----------
+    summary: dict
+        出力先のディレクトリと検証データでの最良の評価値
+    """
+    # 試行のモデルの学習に使うモジュールのみを読み込む
+    # 並列に動く試行同士でコアを取り合わないようにする
+    # 途中の評価値をスケジューラーに報告するコールバックを作成
+    callbacks = []
+    if model_type == "LightGBM":
+        import train_lgb as train_module
+
+        trial_cfg["params"]["num_threads"] = threads
+        if scheduler is not None:
+            callbacks.append(get_lgb_pruning_callback(scheduler, bracket))
+    else:
+        import torch
+
+        import train_nn as train_module
+        from trainers.callbacks import PruningCallback
+
+        torch.set_num_threads(threads)
+        if scheduler is not None:
+            callbacks.append(PruningCallback(scheduler, bracket))
+    exp_str = json.dumps(trial_cfg, indent=4)
+
+    # 共有メモリ上のデータをコピーせずに使って実験を行う
+    splits, handles = attach_splits(descriptor)
+    try:
+        summary = train_module.run(
+            trial_cfg, default_str, exp_str, splits, callbacks, force
+        )
+    finally:
+        del splits
+        release(handles)
+
+    # 打ち切られた予算を記録
+    summary["bracket"] = bracket
+    summary["pruned_at"] = callbacks[0].pruned_at if callbacks else None
+
+    return summary
+
+
+if __name__ == "__main__":
+    # sweep の config を取得
+    default_filename = "../config/default/Sweep.json"
+    exp_filename = "../config/experiment/Sweep.json"
+    _, sweep_cfg, _, _ = get_config(default_filename, exp_filename)
+    model_type = sweep_cfg["model_type"]
+
+    # 試行の元となる config を取得
+    default_filename = f"../config/default/{model_type}.json"
+    exp_filename = f"../config/experiment/{model_type}.json"
+    _, base_cfg, default_str, _ = get_config(default_filename, exp_filename)
+
+    # 実験環境は試行を始める前に 1 回だけ書き出し, 各試行の log からはパスを参照する
+    env_path = record_environment()
+    print(f"environment: {env_path}")
+
+    # 各試行の config を作成
+    overrides_list = get_trials(sweep_cfg)
+    trials = [apply_overrides(base_cfg, item) for item in overrides_list]
+
+    # 前処理の結果が同じ試行ごとに 1 回だけデータを作成し, 共有メモリに配置
+    descriptors = {}
+    handles = []
+    for trial_cfg in trials:
+        key = get_preprocessing_key(trial_cfg)
+        if key not in descriptors:
+            descriptors[key], shared = share_splits(make_splits(trial_cfg))
+            handles += shared
+
+    # successive halving / Hyperband のスケジューラーを作成
+    # 予算は LightGBM ではブースティングのラウンド数, NeuralNetwork ではエポック数とする
+    scheduler = None
+    scheduler_cfg = sweep_cfg.get("scheduler", {"type": None})
+    if scheduler_cfg["type"] is not None:
+        if model_type == "LightGBM":
+            max_budget = base_cfg["training"]["num_boost_round"]
+        else:
+            max_budget = base_cfg["params"]["epochs"]
+        if scheduler_cfg["type"] == "successive_halving":
+            n_brackets = 1
+        else:
+            n_brackets = scheduler_cfg["n_brackets"]
+        manager = Manager()
+        scheduler = HyperbandScheduler(
+            min_budget=scheduler_cfg["min_budget"],
+            max_budget=max_budget,
+            eta=scheduler_cfg["eta"],
+            rungs=manager.dict(),
+            lock=manager.Lock(),
+            n_brackets=n_brackets
+        )
+
+    # 各試行をプロセスプールで並列に行う
+    # 打ち切られた試行のプロセスには次の試行が割り当てられる
+    try:
+        with ProcessPoolExecutor(max_workers=sweep_cfg["n_workers"]) as executor:
+            futures = [
+                executor.submit(
+                    run_trial, model_type, default_str, trial_cfg,
+                    descriptors[get_preprocessing_key(trial_cfg)],
+                    sweep_cfg["threads_per_trial"], scheduler,
+                    scheduler.get_bracket(i) if scheduler is not None else 0,
+                    sweep_cfg.get("force", False)
+                )
+                for i, trial_cfg in enumerate(trials)
+            ]
+            summaries = [future.result() for future in futures]
+    finally:
+        release(handles, unlink=True)
+
+    # 試行の結果をまとめて保存
+    results = pd.DataFrame([
+        {**overrides, **summary}
+        for overrides, summary in zip(overrides_list, summaries)
+    ]).sort_values("best_score")
+    date_time = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    out_path = f"../outputs/{model_type}/sweep_{date_time}.csv"
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    results.to_csv(out_path, index=False)
+    print(results.to_string(index=False))
@@ -1,70 +1,166 @@
+import argparse
+from typing import Optional
+
 import lightgbm as lgb
-import pickle
 
-from experiment_tools.set_up import start_experiment
+from experiment_tools.set_up import (
+    compute_run_key, find_completed_run, finish_experiment, start_experiment
+)
+from experiment_tools.start_logging import get_metrics_logger
+from models.artifact import save_lgb_artifact
 from utils.cfg_diff import get_config, get_diff
+from utils.metrics import get_lgb_metrics_callback
 from utils.preprocessing import make_datasets
-from utils.result import extract_feature_importance, plot_data, predict
-
-
-# config を取得
-default_filename = "../config/default/LightGBM.json"
-exp_filename = "../config/experiment/LightGBM.json"
-_, cfg, default_str, exp_str = get_config(default_filename, exp_filename)
-
-# log を起動し config の差分を取得
-logger = start_experiment(cfg)
-logger = get_diff(default_str, exp_str, logger)
-
-# データセットの作成
-out = make_datasets(cfg)
-df = out["org_data"]
-train_df = out["train_data"]
-valid_df = out["valid_data"]
-eval_df = out["eval_data"]
-train_dataset = out["train_dataset"]
-valid_dataset = out["valid_dataset"]
-
-# データセットの記録
-logger.info(f"original data records: {len(df)}")
-logger.info(f"train data records: {len(train_df)}")
-logger.info(f"valid data records: {len(valid_df)}")
-logger.info(f"eval data records: {len(eval_df)}")
-logger.info(f"train raw data:\n\n{train_df}\n")
-
-# 評価指標のログを保存する辞書を用意
-training_data = {}
-
-# モデルの学習
-model = lgb.train(
-    cfg["params"],
-    train_dataset,
-    valid_sets=[train_dataset, valid_dataset],
-    valid_names=["Train", "Valid"],
-    num_boost_round=cfg["training"]["num_boost_round"],
-    callbacks=[
-        lgb.early_stopping(
-            stopping_rounds=cfg["training"]["early_stopping"]["stopping_rounds"],
-            verbose=cfg["training"]["early_stopping"]["verbose"]
-        ),
-        lgb.log_evaluation(cfg["training"]["verbose_eval"]),
-        lgb.record_evaluation(training_data)
-    ]
+from utils.result import (
+    backtest, extract_feature_importance, plot_data, predict,
+    summarize_backtest
 )
+from utils.sweep import get_pruned_at
+
+
+def run(
+        cfg: dict, default_str: str, exp_str: str,
+        splits: Optional[dict] = None, callbacks: Optional[list] = None,
+        force: bool = False
+    ) -> dict:
+    """
+    LightGBM モデルの実験を行う関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    default_str: str
+        デフォルト値の config データを文字列としたもの
+    exp_str: str
+        実験に使う値の config データを文字列としたもの
+    splits: Optional[dict] = None
+        分割済みのデータフレームの辞書, 指定しない場合はデータを読み込んで作成する
+    callbacks: Optional[list] = None
+        lgb.train に追加で渡すコールバックのリスト
+    force: bool = False
+        同じ実験が完了していても学習し直すかどうか
+
+    Returns
+    ----------
+    summary: dict
+        出力先のディレクトリと検証データでの最良の評価値
+    """
+    # config, データ, コードが全て同じ実験が完了していれば, 学習せずに保存済みの結果を使う
+    # 追加のコールバックは学習を途中で止める場合があるため, その場合はキーを求めず,
+    # 途中で止めた結果が同じ実験として使い回されないようにする
+    run_key = None
+    if not callbacks:
+        run_key = compute_run_key(cfg)
+        summary = None if force else find_completed_run(run_key)
+        if summary is not None:
+            print(f"reuse completed run: {summary['out_dir']}")
+            return summary
+
+    # log を起動し config の差分を取得
+    logger = start_experiment(cfg, run_key)
+    logger = get_diff(default_str, exp_str, logger)
+    metrics_logger = get_metrics_logger(cfg)
+
+    # データセットの作成
+    out = make_datasets(cfg, splits)
+    df = out["org_data"]
+    train_df = out["train_data"]
+    valid_df = out["valid_data"]
+    eval_df = out["eval_data"]
+    train_dataset = out["train_dataset"]
+    valid_dataset = out["valid_dataset"]
+
+    # データセットの記録
+    logger.info(f"original data records: {len(df)}")
+    logger.info(f"train data records: {len(train_df)}")
+    logger.info(f"valid data records: {len(valid_df)}")
+    logger.info(f"eval data records: {len(eval_df)}")
+    logger.info("train raw data:\n\n%s\n", train_df)
+
+    # 評価指標のログを保存する辞書を用意
+    training_data = {}
+
+    # モデルの学習
+    model = lgb.train(
+        cfg["params"],
+        train_dataset,
+        valid_sets=[train_dataset, valid_dataset],
+        valid_names=["Train", "Valid"],
+        num_boost_round=cfg["training"]["num_boost_round"],
+        callbacks=[
+            lgb.early_stopping(
+                stopping_rounds=cfg["training"]["early_stopping"]["stopping_rounds"],
+                verbose=cfg["training"]["early_stopping"]["verbose"]
+            ),
+            lgb.log_evaluation(cfg["training"]["verbose_eval"]),
+            lgb.record_evaluation(training_data),
+            get_lgb_metrics_callback(metrics_logger)
+        ] + (callbacks or [])
+    )
+
+    # 結果の出力先ディレクトリを指定
+    out_dir = cfg["log"]["log_file"].replace("LightGBM.log", "")
+
+    # 検証データでの最良の評価値をまとめる
+    metric = cfg["params"]["metric"]
+    summary = {
+        "out_dir": out_dir,
+        "best_score": model.best_score["Valid"][metric],
+        "best_iteration": model.best_iteration,
+        "final_train": training_data["Train"][metric][-1],
+        "final_valid": training_data["Valid"][metric][-1]
+    }
+
+    # sweep で打ち切られた試行は, 成果物の保存や評価を行わずに評価値のみを返す
+    pruned_at = get_pruned_at(callbacks)
+    if pruned_at is not None:
+        logger.info(f"pruned at round {pruned_at}, best iteration: {model.best_iteration}")
+        summary["reused"] = False
+        return summary
+
+    # モデルの保存
+    save_lgb_artifact(model, cfg, list(eval_df.drop("y", axis=1).columns), out_dir)
+
+    # 学習過程のロスを描画
+    plot_data(cfg, training_data, out_dir, "LightGBM")
+
+    # 特徴量の重要度を描画
+    extract_feature_importance(model, out_dir)
+
+    # 予測結果を描画
+    predict(eval_df, "LightGBM", out_dir, model)
+
+    # 評価データの複数の時点を起点とした予測を評価
+    if "backtest" in cfg:
+        result = backtest(
+            eval_df, "LightGBM", model,
+            cfg["backtest"]["horizon"], cfg["backtest"]["stride"], logger
+        )
+        backtest_summary = summarize_backtest(result, out_dir)
+        logger.info(f"backtest origins: {len(result['origins'])}")
+        logger.info("backtest metrics:\n\n%s\n", backtest_summary)
+
+    # 実験の一覧に登録
+    finish_experiment(cfg, summary)
+    summary["reused"] = False
 
-# 結果の出力先ディレクトリを指定
-out_dir = cfg["log"]["log_file"].replace("LightGBM.log", "")
+    return summary
 
-# モデルの保存
-filename = "lgb_model.pkl"
-with open(f"{out_dir}/{filename}", "wb") as f:
-    pickle.dump(model, f)
 
-# 学習過程のロスを描画
-plot_data(cfg, training_data, out_dir, "LightGBM")
+if __name__ == "__main__":
+    # 引数を取得
+    parser = argparse.ArgumentParser(description="LightGBM モデルの実験を行う")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="同じ実験が完了していても学習し直す"
+    )
+    args = parser.parse_args()
 
-# 特徴量の重要度を描画
-extract_feature_importance(model, out_dir)
+    # config を取得
+    default_filename = "../config/default/LightGBM.json"
+    exp_filename = "../config/experiment/LightGBM.json"
+    _, cfg, default_str, exp_str = get_config(default_filename, exp_filename)
 
-# 予測結果を描画
-predict(eval_df, "LightGBM", out_dir, model)
+    # 実験を行う
+    run(cfg, default_str, exp_str, force=args.force)
@@ -1,111 +1,253 @@
+import argparse
+from typing import Optional
+
 import torch
 from torch.utils.data import DataLoader
 
-from experiment_tools.set_up import start_experiment
+from experiment_tools.set_up import (
+    compute_run_key, find_completed_run, finish_experiment, start_experiment
+)
+from experiment_tools.start_logging import get_metrics_logger
+from models.artifact import save_nn_artifact
 from models.networks import NeuralNetwork
+from trainers.callbacks import EarlyStopping, MetricsLogger, get_callbacks
+from trainers.distributed import (
+    get_init_method, get_threads_per_process, get_world_size, init_distributed,
+    launch_workers, shutdown, wrap_model
+)
+from trainers.execution import get_execution_mode
+from trainers.loader import get_dataloader
 from trainers.loop import train_nn
 from trainers.opt import options
 from utils.cfg_diff import get_config, get_diff
 from utils.preprocessing import make_datasets_for_nn
-from utils.result import plot_data, predict
-
-
-# config を取得
-default_filename = "../config/default/NeuralNetwork.json"
-exp_filename = "../config/experiment/NeuralNetwork.json"
-_, cfg, default_str, exp_str = get_config(default_filename, exp_filename)
-
-# log を起動し config の差分を取得
-logger = start_experiment(cfg)
-logger = get_diff(default_str, exp_str, logger)
-
-# プロセッサーの指定
-device = "cuda" if torch.cuda.is_available() else "cpu"
-logger.info(f"device: {device}")
-
-# データセットの作成
-out = make_datasets_for_nn(cfg)
-df = out["org_data"]
-train_df = out["train_data"]
-valid_df = out["valid_data"]
-eval_df = out["eval_data"]
-train_dataset = out["train_dataset"]
-valid_dataset = out["valid_dataset"]
-
-# データセットの記録
-logger.info(f"original data records: {len(df)}")
-logger.info(f"train data records: {len(train_df)}")
-logger.info(f"valid data records: {len(valid_df)}")
-logger.info(f"eval data records: {len(eval_df)}")
-logger.info(f"train raw data:\n\n{train_df}\n")
-
-# 各 DataLoader の作成
-train_dataloader = DataLoader(
-    dataset=out["train_dataset"],
-    batch_size=cfg["dataloader_params"]["batch_size"],
-    shuffle=cfg["dataloader_params"]["shuffle"],
-    sampler=cfg["dataloader_params"]["sampler"],
-    batch_sampler=cfg["dataloader_params"]["batch_sampler"],
-    num_workers=cfg["dataloader_params"]["num_workers"],
-    collate_fn=cfg["dataloader_params"]["collate_fn"],
-    pin_memory=cfg["dataloader_params"]["pin_memory"],
-    drop_last=cfg["dataloader_params"]["drop_last"],
-    timeout=cfg["dataloader_params"]["timeout"],
-    worker_init_fn=cfg["dataloader_params"]["worker_init_fn"],
-    prefetch_factor=cfg["dataloader_params"]["prefetch_factor"],
-    persistent_workers=cfg["dataloader_params"]["persistent_workers"],
-    pin_memory_device=cfg["dataloader_params"]["pin_memory_device"]
-)
-valid_dataloader = DataLoader(
-    dataset=out["valid_dataset"],
-    batch_size=cfg["dataloader_params"]["batch_size"],
-    shuffle=cfg["dataloader_params"]["shuffle"],
-    sampler=cfg["dataloader_params"]["sampler"],
-    batch_sampler=cfg["dataloader_params"]["batch_sampler"],
-    num_workers=cfg["dataloader_params"]["num_workers"],
-    collate_fn=cfg["dataloader_params"]["collate_fn"],
-    pin_memory=cfg["dataloader_params"]["pin_memory"],
-    drop_last=cfg["dataloader_params"]["drop_last"],
-    timeout=cfg["dataloader_params"]["timeout"],
-    worker_init_fn=cfg["dataloader_params"]["worker_init_fn"],
-    prefetch_factor=cfg["dataloader_params"]["prefetch_factor"],
-    persistent_workers=cfg["dataloader_params"]["persistent_workers"],
-    pin_memory_device=cfg["dataloader_params"]["pin_memory_device"]
-)
-
-# モデルの構築
-input_dim = cfg["lag"] + 1
-output_dim = 1
-model = NeuralNetwork(cfg, input_dim, output_dim).to(device=device)
-logger.info(f"model architecture:\n\n{model}\n")
-
-# 最適化器の設定
-opt = options(cfg, model)
-optimizer = opt.getter()
-
-# エポック数の取得
-epochs = cfg["params"]["epochs"]
-
-# モデルの学習
-model, training_data = train_nn(
-    epochs=epochs,
-    train_dataloader=train_dataloader,
-    valid_dataloader=valid_dataloader,
-    model=model,
-    optimizer=optimizer,
-    batch_size=cfg["dataloader_params"]["batch_size"],
-    device=device,
-    cfg=cfg
-)
-
-# 結果の出力先ディレクトリを指定
-out_dir = cfg["log"]["log_file"].replace("NeuralNetwork.log", "")
-
-# モデルの保存
-torch.save(model.state_dict(), f"{out_dir}model_weight.pth")
-
-# 学習過程のロスを描画
-plot_data(cfg, training_data, out_dir, "NeuralNetwork")
-
-# 予測結果を描画
-predict(eval_df, "NeuralNetwork", out_dir, model)
+from utils.streaming import make_streaming_datasets_for_nn
+from utils.result import backtest, plot_data, predict, summarize_backtest
+from utils.sweep import get_pruned_at
+
+
+def run(
+        cfg: dict, default_str: str, exp_str: str,
+        splits: Optional[dict] = None, callbacks: Optional[list] = None,
+        force: bool = False
+    ) -> dict:
+    """
+    NeuralNetwork モデルの実験を行う関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    default_str: str
+        デフォルト値の config データを文字列としたもの
+    exp_str: str
+        実験に使う値の config データを文字列としたもの
+    splits: Optional[dict] = None
+        分割済みのデータフレームの辞書, 指定しない場合はデータを読み込んで作成する
+    callbacks: Optional[list] = None
+        Trainer に追加で渡すコールバックのリスト
+    force: bool = False
+        同じ実験が完了していても学習し直すかどうか
+
+    Returns
+    ----------
+    summary: dict
+        出力先のディレクトリと検証データでの最良の評価値
+    """
+    # config, データ, コードが全て同じ実験が完了していれば, 学習せずに保存済みの結果を使う
+    # 追加のコールバックは学習を途中で止める場合があるため, その場合はキーを求めず,
+    # 途中で止めた結果が同じ実験として使い回されないようにする
+    run_key = None
+    if not callbacks:
+        run_key = compute_run_key(cfg)
+        summary = None if force else find_completed_run(run_key)
+        if summary is not None:
+            print(f"reuse completed run: {summary['out_dir']}")
+            return summary
+
+    # log を起動し config の差分を取得
+    logger = start_experiment(cfg, run_key)
+    logger = get_diff(default_str, exp_str, logger)
+    metrics_logger = get_metrics_logger(cfg)
+
+    # データ並列で学習するプロセス数, gloo バックエンドで CPU の複数のプロセスに分けて学習する
+    world_size = get_world_size(cfg)
+
+    # データを少しずつ読み込むかどうか
+    streaming = cfg.get("streaming", {"enable": False})["enable"]
+    if world_size > 1 and streaming:
+        raise ValueError("distributed training does not support streaming datasets")
+
+    # プロセッサーの指定
+    if world_size > 1:
+        device = "cpu"
+    else:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    logger.info(f"device: {device}")
+
+    # データセットの作成
+    if streaming:
+        out = make_streaming_datasets_for_nn(cfg)
+    else:
+        out = make_datasets_for_nn(cfg, splits)
+    eval_df = out["eval_data"]
+    train_dataset = out["train_dataset"]
+    valid_dataset = out["valid_dataset"]
+
+    # データセットの記録
+    if streaming:
+        logger.info(f"original data records: {out['num_records']}")
+        logger.info(f"train data records: {len(train_dataset)}")
+        logger.info(f"valid data records: {len(valid_dataset)}")
+        logger.info(
+            f"eval data records: {len(eval_df)} (of {out['num_eval_records']})"
+        )
+    else:
+        logger.info(f"original data records: {len(out['org_data'])}")
+        logger.info(f"train data records: {len(out['train_data'])}")
+        logger.info(f"valid data records: {len(out['valid_data'])}")
+        logger.info(f"eval data records: {len(eval_df)}")
+        logger.info("train raw data:\n\n%s\n", out["train_data"])
+
+    # データ並列で学習する場合は rank 1 以降のプロセスを起動し, このプロセスを rank 0 とする
+    # log の記録と結果の保存は rank 0 のみで行う
+    workers = None
+    if world_size > 1:
+        init_method = get_init_method()
+        workers = launch_workers(cfg, train_dataset, valid_dataset, init_method)
+        init_distributed(cfg, 0, init_method, workers)
+        logger.info(
+            f"distributed: {world_size} processes, "
+            f"{get_threads_per_process(cfg)} threads per process"
+        )
+
+    # 各 DataLoader の作成
+    # データ並列で学習する場合は, 学習データを rank ごとに分けて取り出す
+    # 検証データは繰り返しを含まないよう分けずに取り出し, rank 0 のみで検証する
+    if streaming:
+        # ミニバッチはデータセット側で作成されるため, そのまま取り出す
+        train_dataloader = DataLoader(dataset=train_dataset, batch_size=None)
+        valid_dataloader = DataLoader(dataset=valid_dataset, batch_size=None)
+    else:
+        train_dataloader = get_dataloader(cfg, train_dataset)
+        valid_dataloader = get_dataloader(cfg, valid_dataset, shard=False)
+
+    # モデルの構築
+    input_dim = cfg["lag"] + 1
+    output_dim = 1
+    model = NeuralNetwork(cfg, input_dim, output_dim).to(device=device)
+    logger.info(f"model architecture:\n\n{model}\n")
+
+    # 最適化器の設定
+    opt = options(cfg, model)
+    optimizer = opt.getter()
+
+    # 実行モードの設定
+    # データ並列の場合は, backward の際に勾配を全てのプロセスで平均するモデルを使う
+    if world_size > 1:
+        train_model = wrap_model(model)
+        autocast_dtype = None
+        logger.info("execution mode: distributed data parallel, precision: fp32")
+    else:
+        sample_inputs, _ = next(iter(train_dataloader))
+        train_model, autocast_dtype = get_execution_mode(
+            cfg, model, sample_inputs, device, logger
+        )
+
+    # エポック数の取得
+    epochs = cfg["params"]["epochs"]
+
+    # early stopping などのコールバックを作成
+    callbacks = get_callbacks(cfg) + [MetricsLogger(metrics_logger)] + (callbacks or [])
+
+    # モデルの学習
+    # コンパイルしたモデルは元のモデルとパラメータを共有するため, 保存や予測には元のモデルを使う
+    try:
+        _, training_data = train_nn(
+            epochs=epochs,
+            train_dataloader=train_dataloader,
+            valid_dataloader=valid_dataloader,
+            model=train_model,
+            optimizer=optimizer,
+            batch_size=cfg["dataloader_params"]["batch_size"],
+            device=device,
+            cfg=cfg,
+            autocast_dtype=autocast_dtype,
+            callbacks=callbacks
+        )
+    except BaseException:
+        shutdown(workers, logger, failed=True)
+        raise
+
+    # データ並列の場合は, 他のプロセスの終了を待ってから結果を保存する
+    if world_size > 1:
+        shutdown(workers, logger)
+
+    # early stopping の結果を記録
+    for callback in callbacks:
+        if isinstance(callback, EarlyStopping):
+            logger.info(f"best epoch: {callback.best_epoch}")
+            logger.info(f"best valid loss: {callback.best_score}")
+
+    # 結果の出力先ディレクトリを指定
+    out_dir = cfg["log"]["log_file"].replace("NeuralNetwork.log", "")
+
+    # 検証データでの最良の評価値をまとめる
+    valid_loss = training_data["Valid"][cfg["criterion"]]
+    summary = {
+        "out_dir": out_dir,
+        "best_score": min(valid_loss),
+        "best_iteration": valid_loss.index(min(valid_loss)) + 1,
+        "final_train": training_data["Train"][cfg["criterion"]][-1],
+        "final_valid": valid_loss[-1]
+    }
+
+    # sweep で打ち切られた試行は, 成果物の保存や評価を行わずに評価値のみを返す
+    pruned_at = get_pruned_at(callbacks)
+    if pruned_at is not None:
+        logger.info(f"pruned at epoch {pruned_at}, best epoch: {summary['best_iteration']}")
+        summary["reused"] = False
+        return summary
+
+    # モデルの保存
+    save_nn_artifact(model, cfg, list(eval_df.drop("y", axis=1).columns), out_dir)
+
+    # 学習過程のロスを描画
+    plot_data(cfg, training_data, out_dir, "NeuralNetwork")
+
+    # 予測結果を描画
+    predict(eval_df, "NeuralNetwork", out_dir, model)
+
+    # 評価データの複数の時点を起点とした予測を評価
+    if "backtest" in cfg:
+        result = backtest(
+            eval_df, "NeuralNetwork", model,
+            cfg["backtest"]["horizon"], cfg["backtest"]["stride"], logger
+        )
+        backtest_summary = summarize_backtest(result, out_dir)
+        logger.info(f"backtest origins: {len(result['origins'])}")
+        logger.info("backtest metrics:\n\n%s\n", backtest_summary)
+
+    # 実験の一覧に登録
+    finish_experiment(cfg, summary)
+    summary["reused"] = False
+
+    return summary
+
+
+if __name__ == "__main__":
+    # 引数を取得
+    parser = argparse.ArgumentParser(description="NeuralNetwork モデルの実験を行う")
+    parser.add_argument(
+        "--force", action="store_true",
+        help="同じ実験が完了していても学習し直す"
+    )
+    args = parser.parse_args()
+
+    # config を取得
+    default_filename = "../config/default/NeuralNetwork.json"
+    exp_filename = "../config/experiment/NeuralNetwork.json"
+    _, cfg, default_str, exp_str = get_config(default_filename, exp_filename)
+
+    # 実験を行う
+    run(cfg, default_str, exp_str, force=args.force)
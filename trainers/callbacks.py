@@ -0,0 +1,115 @@
+import logging
+
+from tqdm import tqdm
+
+from experiment_tools.start_logging import log_metrics
+from trainers.trainer import Callback, Trainer
+from utils.scheduler import HyperbandScheduler
+
+
+class EarlyStopping(Callback):
+    """
+    検証データの損失が改善しなくなった時点で学習を止めるコールバック
+
+    最も損失が小さかったエポックの重みをメモリ上に保持し, 学習の終わりに復元する.
+    """
+    def __init__(self, stopping_rounds: int, verbose: bool = True):
+        self.stopping_rounds = stopping_rounds
+        self.verbose = verbose
+
+    def on_train_begin(self, trainer: Trainer) -> None:
+        self.best_score = float("inf")
+        self.best_epoch = 0
+        self.best_state = None
+        self.wait = 0
+
+    def on_epoch_end(self, trainer: Trainer, epoch: int, logs: dict) -> None:
+        # 損失が改善した場合は重みの複製を保持する
+        if logs["Valid"] < self.best_score:
+            self.best_score = logs["Valid"]
+            self.best_epoch = epoch + 1
+            self.best_state = {
+                key: value.detach().clone()
+                for key, value in trainer.model.state_dict().items()
+            }
+            self.wait = 0
+            return
+
+        # 改善しないエポックが続いた場合は学習を止める
+        self.wait += 1
+        if self.wait >= self.stopping_rounds:
+            trainer.stop_training = True
+
+    def on_train_end(self, trainer: Trainer) -> None:
+        if self.best_state is None:
+            return
+
+        # 最も損失が小さかったエポックの重みを復元する
+        trainer.model.load_state_dict(self.best_state)
+
+        if self.verbose:
+            tqdm.write(
+                f"Early stopping, best epoch is: [{self.best_epoch}] "
+                f"Valid's loss: {self.best_score:g}"
+            )
+
+
+class MetricsLogger(Callback):
+    """
+    各エポックの損失を JSONL 形式で記録するコールバック
+    """
+    def __init__(self, metrics_logger: logging.Logger):
+        self.metrics_logger = metrics_logger
+
+    def on_epoch_end(self, trainer: Trainer, epoch: int, logs: dict) -> None:
+        log_metrics(self.metrics_logger, {"epoch": epoch + 1, **logs})
+
+
+class PruningCallback(Callback):
+    """
+    Trainer の学習の途中で試行を打ち切るコールバック
+    """
+    def __init__(self, scheduler: HyperbandScheduler, bracket: int):
+        self.scheduler = scheduler
+        self.bracket = bracket
+        self.budgets = set(scheduler.get_budgets(bracket))
+        self.pruned_at = None
+
+    def on_epoch_end(self, trainer: Trainer, epoch: int, logs: dict) -> None:
+        budget = epoch + 1
+        if budget not in self.budgets:
+            return
+
+        # 上位に入らない場合は学習を止める
+        if not self.scheduler.report(self.bracket, budget, logs["Valid"]):
+            self.pruned_at = budget
+            trainer.stop_training = True
+
+
+def get_callbacks(cfg: dict) -> list:
+    """
+    config で指定されたコールバックを作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    callbacks: list
+        作成したコールバックのリスト
+    """
+    callbacks = []
+
+    # early stopping を行う場合
+    training = cfg.get("training", {})
+    if "early_stopping" in training:
+        callbacks.append(
+            EarlyStopping(
+                stopping_rounds=training["early_stopping"]["stopping_rounds"],
+                verbose=training["early_stopping"]["verbose"]
+            )
+        )
+
+    return callbacks
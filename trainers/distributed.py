@@ -0,0 +1,307 @@
+import datetime
+import logging
+import os
+import socket
+import threading
+from typing import Optional
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch import nn
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import TensorDataset
+
+from experiment_tools.set_random_seed import fix_seed
+from models.networks import NeuralNetwork
+from trainers.callbacks import get_callbacks
+from trainers.loader import get_dataloader
+from trainers.loop import train_nn
+from trainers.opt import options
+
+
+def get_world_size(cfg: dict) -> int:
+    """
+    config で指定された, データ並列で学習するプロセス数を取得する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    world_size: int
+        学習するプロセス数, データ並列で学習しない場合は 1
+    """
+    distributed = cfg.get("distributed", {"enable": False})
+    if not distributed["enable"]:
+        return 1
+
+    return max(int(distributed["world_size"]), 1)
+
+
+def get_threads_per_process(cfg: dict) -> int:
+    """
+    プロセスごとに使うスレッド数を取得する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    threads: int
+        プロセスごとのスレッド数, 指定しない場合はコア数をプロセス数で割った値
+    """
+    threads = cfg["distributed"].get("threads_per_process")
+    if threads is None:
+        threads = (os.cpu_count() or 1) // get_world_size(cfg)
+
+    return max(int(threads), 1)
+
+
+def is_main_process() -> bool:
+    """
+    log の記録や結果の保存を行うプロセス (rank 0) かどうかを判定する関数
+
+    Returns
+    ----------
+    is_main: bool
+        データ並列で学習していない場合, もしくは rank 0 の場合は True
+    """
+    return not dist.is_initialized() or dist.get_rank() == 0
+
+
+def get_init_method() -> str:
+    """
+    プロセス同士が接続するためのアドレスを作成する関数, 空いているポートを使う
+
+    Returns
+    ----------
+    init_method: str
+        init_process_group に渡すアドレス
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    return f"tcp://127.0.0.1:{port}"
+
+
+def init_distributed(
+        cfg: dict, rank: int, init_method: str,
+        context: Optional[mp.ProcessContext] = None
+    ) -> None:
+    """
+    gloo バックエンドでプロセスグループを初期化する関数
+
+    rank 0 では launch_workers で起動したプロセスを渡し, 接続を待つ間もプロセスが
+    終了していないかを確認する. 起動や読み込みに失敗したプロセスがあれば, timeout まで待たずに
+    そのプロセスの例外を送出する.
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    rank: int
+        このプロセスの番号
+    init_method: str
+        プロセス同士が接続するためのアドレス
+    context: Optional[mp.ProcessContext] = None
+        rank 0 で起動したプロセス, 指定した場合は接続を待つ間に終了を確認する
+
+    Returns
+    ----------
+    None
+    """
+    # コアを取り合わないよう, プロセスごとのスレッド数を制限する
+    torch.set_num_threads(get_threads_per_process(cfg))
+
+    params = {
+        "backend": "gloo",
+        "init_method": init_method,
+        "rank": rank,
+        "world_size": get_world_size(cfg),
+        "timeout": datetime.timedelta(seconds=cfg["distributed"].get("timeout", 300))
+    }
+    if context is None:
+        dist.init_process_group(**params)
+        return
+
+    # 接続は別のスレッドで待ち, その間に起動したプロセスの終了を確認する
+    errors = []
+
+    def connect() -> None:
+        try:
+            dist.init_process_group(**params)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=connect, daemon=True)
+    thread.start()
+    while thread.is_alive():
+        thread.join(0.5)
+        # 異常終了したプロセスがあれば, 残りのプロセスを止めてその例外を送出する
+        context.join(timeout=0)
+    if errors:
+        raise errors[0]
+
+
+def wrap_model(model: nn.Module) -> DistributedDataParallel:
+    """
+    backward の際に勾配を全てのプロセスで平均するようにモデルを包む関数
+
+    Parameters
+    ----------
+    model: nn.Module
+        学習させるモデル
+
+    Returns
+    ----------
+    train_model: DistributedDataParallel
+        学習に使うモデル, 元のモデルとパラメータを共有する
+    """
+    # 作成時に rank 0 のパラメータが全てのプロセスに配られる
+    return DistributedDataParallel(model)
+
+
+def worker(
+        index: int, cfg: dict, train_dataset: TensorDataset,
+        valid_dataset: TensorDataset, init_method: str
+    ) -> None:
+    """
+    rank 1 以降のプロセスで学習を行う関数
+
+    rank 0 と同じ手順で学習するが, log の記録や結果の保存は行わない.
+
+    Parameters
+    ----------
+    index: int
+        起動したプロセスの番号, rank は index + 1 となる
+    cfg: dict
+        実験に使う値の config データ
+    train_dataset: TensorDataset
+        学習データ, 共有メモリを介して rank 0 と共有する
+    valid_dataset: TensorDataset
+        検証データ, 共有メモリを介して rank 0 と共有する
+    init_method: str
+        プロセス同士が接続するためのアドレス
+
+    Returns
+    ----------
+    None
+    """
+    fix_seed(cfg["seed"])
+    init_distributed(cfg, index + 1, init_method)
+    try:
+        train_dataloader = get_dataloader(cfg, train_dataset)
+        valid_dataloader = get_dataloader(cfg, valid_dataset, shard=False)
+
+        input_dim = cfg["lag"] + 1
+        output_dim = 1
+        model = NeuralNetwork(cfg, input_dim, output_dim)
+        optimizer = options(cfg, model).getter()
+        train_model = wrap_model(model)
+
+        # early stopping は全てのプロセスで同じ判定になるが, 表示は rank 0 のみで行う
+        callbacks = get_callbacks(cfg)
+        for callback in callbacks:
+            if hasattr(callback, "verbose"):
+                callback.verbose = False
+
+        train_nn(
+            epochs=cfg["params"]["epochs"],
+            train_dataloader=train_dataloader,
+            valid_dataloader=valid_dataloader,
+            model=train_model,
+            optimizer=optimizer,
+            batch_size=cfg["dataloader_params"]["batch_size"],
+            device="cpu",
+            cfg=cfg,
+            callbacks=callbacks
+        )
+    finally:
+        dist.destroy_process_group()
+
+
+def launch_workers(
+        cfg: dict, train_dataset: TensorDataset, valid_dataset: TensorDataset,
+        init_method: str
+    ) -> Optional[mp.ProcessContext]:
+    """
+    rank 1 以降のプロセスを起動する関数, 呼び出したプロセスが rank 0 となる
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    train_dataset: TensorDataset
+        学習データ
+    valid_dataset: TensorDataset
+        検証データ
+    init_method: str
+        プロセス同士が接続するためのアドレス
+
+    Returns
+    ----------
+    context: Optional[mp.ProcessContext]
+        起動したプロセス, 起動するプロセスがない場合は None
+    """
+    n_workers = get_world_size(cfg) - 1
+    if n_workers == 0:
+        return None
+
+    # データセットの Tensor は共有メモリに移して渡し, プロセスごとに複製しない
+    for dataset in [train_dataset, valid_dataset]:
+        for tensor in dataset.tensors:
+            tensor.share_memory_()
+
+    return mp.start_processes(
+        worker,
+        args=(cfg, train_dataset, valid_dataset, init_method),
+        nprocs=n_workers,
+        join=False,
+        start_method="spawn"
+    )
+
+
+def shutdown(
+        context: Optional[mp.ProcessContext], logger: logging.Logger,
+        failed: bool = False
+    ) -> None:
+    """
+    プロセスグループを破棄し, rank 1 以降のプロセスの終了を待つ関数
+
+    Parameters
+    ----------
+    context: Optional[mp.ProcessContext]
+        launch_workers で起動したプロセス
+    logger: logging.Logger
+        実験の結果を記録する log データ
+    failed: bool = False
+        rank 0 の学習が失敗したかどうか, 失敗した場合は他のプロセスを止める
+
+    Returns
+    ----------
+    None
+    """
+    if dist.is_initialized():
+        dist.destroy_process_group()
+    if context is None:
+        return
+
+    # rank 0 が失敗した場合, 他のプロセスは通信を待ち続けるため止める
+    if failed:
+        for process in context.processes:
+            if process.is_alive():
+                process.terminate()
+
+    try:
+        while not context.join():
+            pass
+    except Exception as e:
+        logger.warning(f"distributed worker failed: {e}")
+        if not failed:
+            raise
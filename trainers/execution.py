@@ -0,0 +1,108 @@
+import logging
+from typing import Optional, Tuple
+
+import torch
+from torch import nn
+
+
+# config で指定できる自動混合精度の型
+AUTOCAST_DTYPES = {
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16
+}
+
+
+def probe(
+        model: nn.Module, inputs: torch.Tensor, device: str,
+        autocast_dtype: Optional[torch.dtype]
+    ) -> None:
+    """
+    指定した実行モードで順伝播と逆伝播が行えるかを確かめる関数
+
+    Parameters
+    ----------
+    model: nn.Module
+        確認するモデル
+    inputs: torch.Tensor
+        確認に使う入力データ
+    device: str
+        計算に使うデバイス
+    autocast_dtype: Optional[torch.dtype]
+        自動混合精度の型, 使わない場合は None
+
+    Returns
+    ----------
+    None
+    """
+    device_type = torch.device(device).type
+    with torch.autocast(
+        device_type=device_type, dtype=autocast_dtype,
+        enabled=autocast_dtype is not None
+    ):
+        outputs = model(inputs.to(device))
+    outputs.float().sum().backward()
+
+    # 確認で溜まった勾配を破棄する
+    model.zero_grad(set_to_none=True)
+
+
+def get_execution_mode(
+        cfg: dict, model: nn.Module, inputs: torch.Tensor, device: str,
+        logger: logging.Logger
+    ) -> Tuple[nn.Module, Optional[torch.dtype]]:
+    """
+    config に応じてコンパイルと自動混合精度の実行モードを決める関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    model: nn.Module
+        学習させるモデル
+    inputs: torch.Tensor
+        実行モードの確認に使う入力データ
+    device: str
+        計算に使うデバイス
+    logger: logging.Logger
+        実験の結果を記録する log データ
+
+    Returns
+    ----------
+    train_model: nn.Module
+        学習に使うモデル, コンパイルした場合は元のモデルとパラメータを共有する
+    autocast_dtype: Optional[torch.dtype]
+        自動混合精度の型, 使わない場合は None
+    """
+    execution = cfg.get("execution", {"compile": False, "autocast": None})
+
+    # 自動混合精度が使えるかを確かめ, 使えない場合は fp32 で計算する
+    autocast_dtype = None
+    if execution["autocast"] is not None:
+        try:
+            autocast_dtype = AUTOCAST_DTYPES[execution["autocast"]]
+            probe(model, inputs, device, autocast_dtype)
+        except Exception as e:
+            logger.warning(
+                f"autocast {execution['autocast']} is not supported, "
+                f"falling back to fp32: {e}"
+            )
+            autocast_dtype = None
+
+    # コンパイルできるかを確かめ, できない場合はそのまま実行する
+    train_model = model
+    if execution["compile"]:
+        try:
+            train_model = torch.compile(model)
+            probe(train_model, inputs, device, autocast_dtype)
+        except Exception as e:
+            logger.warning(
+                f"torch.compile is not supported, falling back to eager: {e}"
+            )
+            train_model = model
+
+    # 選ばれた実行モードを記録する
+    mode = "compiled" if train_model is not model else "eager"
+    precision = execution["autocast"] if autocast_dtype is not None else "fp32"
+    logger.info(f"execution mode: {mode}, precision: {precision}")
+
+    return train_model, autocast_dtype
@@ -0,0 +1,171 @@
+from typing import Iterator, Tuple, Union
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import DataLoader, DistributedSampler, TensorDataset
+
+from experiment_tools.set_random_seed import seed_torch
+
+
+class TensorLoader():
+    """
+    メモリ上の Tensor からミニバッチを直接切り出すローダー
+
+    DataLoader のようにサンプルを 1 つずつ取り出して結合することはせず,
+    シャッフルする場合もエポックごとに 1 回並べ替えてから連続した範囲を切り出す.
+
+    num_replicas を 2 以上にすると, DistributedSampler と同様にデータを rank ごとに分けて取り出す.
+    全ての rank で同じ並べ替えを行い, ミニバッチの数がそろうよう先頭のサンプルを繰り返して補う.
+    """
+    def __init__(
+            self, dataset: TensorDataset, batch_size: int,
+            shuffle: bool = False, drop_last: bool = False,
+            num_replicas: int = 1, rank: int = 0, seed: int = 0
+        ):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """
+        エポックの番号を設定するメソッド, データを分ける場合の並べ替えに使う
+
+        Parameters
+        ----------
+        epoch: int
+            エポックの番号
+
+        Returns
+        ----------
+        None
+        """
+        self.epoch = epoch
+
+    def num_samples(self) -> int:
+        """
+        この rank が 1 エポックで取り出すサンプル数を求めるメソッド
+
+        Returns
+        ----------
+        n: int
+            取り出すサンプル数
+        """
+        n = len(self.dataset)
+        if self.num_replicas == 1:
+            return n
+        if self.drop_last:
+            return n // self.num_replicas
+        return (n + self.num_replicas - 1) // self.num_replicas
+
+    def __len__(self) -> int:
+        n = self.num_samples()
+        if self.drop_last:
+            return n // self.batch_size
+        return (n + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, ...]]:
+        tensors = self.dataset.tensors
+
+        # データを分ける場合は, 全ての rank で同じ順番に並べた上で rank ごとに 1 つおきに取り出す
+        if self.num_replicas > 1:
+            if self.shuffle:
+                generator = torch.Generator().manual_seed(self.seed + self.epoch)
+                index = torch.randperm(len(self.dataset), generator=generator)
+            else:
+                index = torch.arange(len(self.dataset))
+            total = self.num_samples() * self.num_replicas
+            if total > len(index):
+                index = index.repeat(-(-total // len(index)))
+            index = index[:total][self.rank::self.num_replicas]
+            tensors = [tensor[index] for tensor in tensors]
+
+        # シャッフルする場合はエポックの最初にまとめて並べ替える
+        elif self.shuffle:
+            index = torch.randperm(len(self.dataset))
+            tensors = [tensor[index] for tensor in tensors]
+
+        # 連続した範囲をそのままミニバッチとして切り出す
+        n = self.num_samples()
+        stop = n // self.batch_size * self.batch_size if self.drop_last else n
+        for i in range(0, stop, self.batch_size):
+            yield tuple(tensor[i:i + self.batch_size] for tensor in tensors)
+
+
+def get_dataloader(
+        cfg: dict, dataset: TensorDataset, shard: bool = True
+    ) -> Union[DataLoader, TensorLoader]:
+    """
+    config で指定されたローダーを作成する関数
+
+    データ並列で学習している場合は, データを rank ごとに分けて取り出すローダーを作成する.
+    rank ごとに分けるとサンプル数をそろえるために一部のサンプルが繰り返されるため,
+    検証データは shard=False とし, 全てのサンプルを 1 回ずつ取り出す.
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    dataset: TensorDataset
+        ミニバッチを取り出すデータセット
+    shard: bool = True
+        データ並列で学習している場合に, データを rank ごとに分けるかどうか
+
+    Returns
+    ----------
+    dataloader: Union[DataLoader, TensorLoader]
+        作成したローダー
+    """
+    # fix_seed の時点で torch が読み込まれていなかった場合は, シャッフルの前にシードを固定する
+    seed_torch()
+
+    params = cfg["dataloader_params"]
+    distributed = shard and dist.is_initialized()
+    num_replicas = dist.get_world_size() if distributed else 1
+    rank = dist.get_rank() if distributed else 0
+
+    # Tensor から直接切り出すローダーを作成する
+    if cfg.get("loader_type", "DataLoader") == "TensorLoader":
+        return TensorLoader(
+            dataset=dataset,
+            batch_size=params["batch_size"],
+            shuffle=params["shuffle"],
+            drop_last=params["drop_last"],
+            num_replicas=num_replicas,
+            rank=rank,
+            seed=cfg["seed"]
+        )
+
+    # データ並列で学習する場合は, シャッフルも DistributedSampler で行う
+    sampler = params["sampler"]
+    shuffle = params["shuffle"]
+    if distributed:
+        sampler = DistributedSampler(
+            dataset, num_replicas=num_replicas, rank=rank,
+            shuffle=shuffle, seed=cfg["seed"], drop_last=params["drop_last"]
+        )
+        shuffle = False
+
+    # PyTorch の DataLoader を作成する
+    dataloader = DataLoader(
+        dataset=dataset,
+        batch_size=params["batch_size"],
+        shuffle=shuffle,
+        sampler=sampler,
+        batch_sampler=params["batch_sampler"],
+        num_workers=params["num_workers"],
+        collate_fn=params["collate_fn"],
+        pin_memory=params["pin_memory"],
+        drop_last=params["drop_last"],
+        timeout=params["timeout"],
+        worker_init_fn=params["worker_init_fn"],
+        prefetch_factor=params["prefetch_factor"],
+        persistent_workers=params["persistent_workers"],
+        pin_memory_device=params["pin_memory_device"]
+    )
+
+    return dataloader
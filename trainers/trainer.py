@@ -0,0 +1,221 @@
+from typing import List, Optional, Tuple
+
+import torch
+import torch.distributed as dist
+from torch import nn
+from torch.nn.parallel import DistributedDataParallel
+from tqdm import tqdm
+
+
+def get_criterion(cfg: dict) -> nn.Module:
+    """
+    config で指定された損失関数を作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    criterion: nn.Module
+        損失関数のインスタンス
+    """
+    criteria = {
+        "mse": nn.MSELoss,
+        "ce": nn.CrossEntropyLoss
+    }
+    criterion = criteria[cfg["criterion"]]()
+
+    return criterion
+
+
+class Callback():
+    """
+    Trainer の学習ループに処理を差し込むための基底クラス
+
+    必要なメソッドだけを上書きして使う.
+    """
+    def on_train_begin(self, trainer: "Trainer") -> None:
+        pass
+
+    def on_batch_end(
+            self, trainer: "Trainer", phase: str, batch: int,
+            loss: torch.Tensor
+        ) -> None:
+        # loss はデバイス上の Tensor のままであり, 値を取り出すと同期が発生する
+        pass
+
+    def on_epoch_end(self, trainer: "Trainer", epoch: int, logs: dict) -> None:
+        pass
+
+    def on_train_end(self, trainer: "Trainer") -> None:
+        pass
+
+
+class Trainer():
+    """
+    深層学習モデルの学習ループを管理するクラス
+
+    エポック内の損失はデバイス上で合計し, エポックの終わりに 1 回だけ値を取り出す.
+    コールバックの中で stop_training を True にすると, そのエポックで学習を終える.
+    データ並列で学習している場合は, 損失の合計と学習を止めるかどうかを全てのプロセスでそろえる.
+    検証は rank 0 のみで全ての検証データに対して行い, 1 プロセスで学習した場合と同じ損失とする.
+    """
+    def __init__(
+            self, cfg: dict, model: nn.Module, optimizer, device: str,
+            batch_size: int, callbacks: Optional[List[Callback]] = None,
+            autocast_dtype: Optional[torch.dtype] = None
+        ):
+        self.cfg = cfg
+        self.model = model
+        self.optimizer = optimizer
+        self.device = device
+        self.batch_size = batch_size
+        self.callbacks = callbacks if callbacks is not None else []
+        self.autocast_dtype = autocast_dtype
+
+        # 損失関数は学習の最初に 1 回だけ作成する
+        self.criterion = get_criterion(cfg)
+
+        self.stop_training = False
+        self.history = {"Train": [], "Valid": []}
+
+    def run_epoch(self, phase: str, dataloader) -> torch.Tensor:
+        """
+        1 エポック分の学習, もしくは検証を行うメソッド
+
+        Parameters
+        ----------
+        phase: str
+            "Train" もしくは "Valid"
+        dataloader:
+            ミニバッチを取り出すローダー
+
+        Returns
+        ----------
+        epoch_loss: torch.Tensor
+            エポック内の損失の合計, デバイス上の Tensor のまま返す
+        """
+        if phase == "Train":
+            self.model.train()
+        else:
+            self.model.eval()
+
+        device_type = torch.device(self.device).type
+        epoch_loss = torch.zeros((), device=self.device)
+
+        # 検証では勾配を同期しないため, データ並列の場合も元のモデルで予測する
+        model = self.model
+        if phase != "Train" and isinstance(model, DistributedDataParallel):
+            model = model.module
+
+        for batch, (inputs, label) in enumerate(dataloader):
+            inputs = inputs.to(self.device)
+            label = label.to(self.device)
+
+            with torch.set_grad_enabled(phase == "Train"):
+                with torch.autocast(
+                    device_type=device_type, dtype=self.autocast_dtype,
+                    enabled=self.autocast_dtype is not None
+                ):
+                    output = model(inputs)
+                loss = self.criterion(output.float(), label)
+
+                if phase == "Train":
+                    self.optimizer.zero_grad(set_to_none=True)
+                    loss.backward()
+                    self.optimizer.step()
+
+            # 損失はデバイス上で合計し, ここでは同期しない
+            epoch_loss += loss.detach()
+
+            for callback in self.callbacks:
+                callback.on_batch_end(self, phase, batch, loss.detach())
+
+        return epoch_loss
+
+    def fit(
+            self, epochs: int, train_dataloader, valid_dataloader
+        ) -> Tuple[nn.Module, dict]:
+        """
+        学習を行うメソッド
+
+        Parameters
+        ----------
+        epochs: int
+            最大のエポック数
+        train_dataloader:
+            学習データのローダー
+        valid_dataloader:
+            検証データのローダー
+
+        Returns
+        ----------
+        model: nn.Module
+            学習させたモデル
+        training_data: dict
+            学習過程のロスのデータ
+        """
+        dataloader_dict = {"Train": train_dataloader, "Valid": valid_dataloader}
+
+        for callback in self.callbacks:
+            callback.on_train_begin(self)
+
+        distributed = dist.is_initialized()
+        is_main = not distributed or dist.get_rank() == 0
+
+        with tqdm(range(epochs), disable=not is_main) as pbar_epoch:
+            for epoch in pbar_epoch:
+                pbar_epoch.set_description(f"epoch : {epoch + 1}")
+
+                # データを分けて取り出すローダーは, エポックごとに並べ替えを変える
+                for dataloader in dataloader_dict.values():
+                    sampler = getattr(dataloader, "sampler", dataloader)
+                    if hasattr(sampler, "set_epoch"):
+                        sampler.set_epoch(epoch)
+
+                # 各フェーズの損失の合計を求め, まとめて 1 回だけ値を取り出す
+                # データ並列の場合, 検証は rank 0 のみで行い, 他のプロセスの損失は 0 とする
+                sums = [
+                    self.run_epoch(phase, dataloader_dict[phase])
+                    if phase == "Train" or is_main
+                    else torch.zeros((), device=self.device)
+                    for phase in ["Train", "Valid"]
+                ]
+                sums = torch.stack(sums)
+
+                # データ並列の場合は全てのプロセスの損失を合計する
+                if distributed:
+                    dist.all_reduce(sums)
+                sums = sums.tolist()
+
+                logs = {}
+                for phase, epoch_loss in zip(["Train", "Valid"], sums):
+                    n = len(dataloader_dict[phase].dataset)
+                    epoch_loss /= n * self.batch_size
+                    self.history[phase].append(epoch_loss)
+                    logs[phase] = epoch_loss
+
+                for callback in self.callbacks:
+                    callback.on_epoch_end(self, epoch, logs)
+
+                # いずれかのプロセスで止める場合は, 全てのプロセスで止める
+                if distributed:
+                    stop = torch.tensor(float(self.stop_training))
+                    dist.all_reduce(stop, op=dist.ReduceOp.MAX)
+                    self.stop_training = bool(stop.item())
+
+                if self.stop_training:
+                    break
+
+        for callback in self.callbacks:
+            callback.on_train_end(self)
+
+        metric = self.cfg["criterion"]
+        training_data = {
+            "Train": {metric: self.history["Train"]},
+            "Valid": {metric: self.history["Valid"]}
+        }
+
+        return self.model, training_data
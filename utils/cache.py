@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# キャッシュの形式を変更した際に古いキャッシュを無効化するためのバージョン
+CACHE_VERSION = 1
+
+# キャッシュとして保存する分割データの名前
+SPLIT_NAMES = ["org_data", "train_data", "valid_data", "eval_data"]
+
+# LightGBM のデータセットの構築 (ビンの作成) に影響するパラメータと, その別名
+LGB_DATASET_PARAMS = {
+    "max_bin": ["max_bins"],
+    "max_bin_by_feature": [],
+    "min_data_in_bin": [],
+    "bin_construct_sample_cnt": ["subsample_for_bin"],
+    "data_random_seed": ["data_seed"],
+    "feature_pre_filter": [],
+    "min_data_in_leaf": [
+        "min_data", "min_samples_leaf", "min_child_samples", "min_data_per_leaf"
+    ],
+    "min_sum_hessian_in_leaf": [
+        "min_hessian", "min_sum_hessian", "min_child_weight", "min_sum_hessian_per_leaf"
+    ],
+    "linear_tree": ["linear_trees"],
+    "use_missing": [],
+    "zero_as_missing": [],
+    "enable_bundle": ["is_enable_bundle", "bundle"],
+    "is_enable_sparse": ["is_sparse", "enable_sparse", "sparse"],
+    "categorical_feature": [
+        "cat_feature", "categorical_column", "cat_column", "categorical_features"
+    ],
+    "forcedbins_filename": [],
+    "seed": ["random_seed", "random_state"]
+}
+
+# 同じプロセスで計算したデータのハッシュ値
+# パス, サイズ, 更新時刻が同じであれば再計算しない
+_data_hash_memo = {}
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    ファイルの内容からハッシュ値を計算する関数
+
+    Parameters
+    ----------
+    path: str
+        ハッシュ値を計算するファイルのパス
+    chunk_size: int = 1 << 20
+        一度に読み込むバイト数
+
+    Returns
+    ----------
+    digest: str
+        ファイル内容の SHA-256 ハッシュ値
+    """
+    # ファイルを少しずつ読み込んでハッシュ値を更新する
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    return digest
+
+
+def data_hash(path: str) -> str:
+    """
+    データのハッシュ値を計算する関数
+
+    Parameters
+    ----------
+    path: str
+        CSV ファイル, もしくは列ごとの .npy ファイルからなるディレクトリのパス
+
+    Returns
+    ----------
+    digest: str
+        データの SHA-256 ハッシュ値
+    """
+    # 変更されていないデータであれば前回の値を使う
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _data_hash_memo:
+        return _data_hash_memo[memo_key]
+
+    # ファイルであればそのままハッシュ値を求める
+    if not os.path.isdir(path):
+        digest = file_hash(path)
+        _data_hash_memo[memo_key] = digest
+        return digest
+
+    # ディレクトリであれば各ファイルのハッシュ値を名前順にまとめる
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        h.update(name.encode())
+        h.update(file_hash(os.path.join(path, name)).encode())
+    digest = h.hexdigest()
+    _data_hash_memo[memo_key] = digest
+
+    return digest
+
+
+def get_cache_key(cfg: dict) -> str:
+    """
+    データと前処理の config からキャッシュのキーを作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    key: str
+        キャッシュのキー
+    """
+    # 前処理の結果を決める値だけをまとめる
+    items = {
+        "version": CACHE_VERSION,
+        "data": data_hash(cfg["data_path"]),
+        "lag": cfg["lag"],
+        "sampling_rate": cfg["sampling_rate"]
+    }
+
+    # 並び順を固定した文字列からハッシュ値を求める
+    text = json.dumps(items, sort_keys=True)
+    key = hashlib.sha256(text.encode()).hexdigest()
+
+    return key
+
+
+def normalize_lgb_params(params: dict) -> dict:
+    """
+    データセットの構築に影響するパラメータを, 別名を正式な名前に直して取り出す関数
+
+    同じパラメータを別名で指定した場合も, 同じキャッシュを使うようにする.
+    正式な名前と別名の両方がある場合は, LightGBM と同様に正式な名前の値を使う.
+    複数の別名がある場合は, LGB_DATASET_PARAMS の順で先にある別名の値を使う.
+
+    Parameters
+    ----------
+    params: dict
+        LightGBM のパラメータ
+
+    Returns
+    ----------
+    items: dict
+        正式な名前をキーとした, データセットの構築に影響するパラメータ
+    """
+    items = {}
+    for name, aliases in LGB_DATASET_PARAMS.items():
+        for key in [name] + aliases:
+            if key in params:
+                items[name] = params[key]
+                break
+
+    return items
+
+
+def get_lgb_dataset_paths(cfg: dict) -> Tuple[str, str]:
+    """
+    LightGBM のデータセットをバイナリ形式で保存するパスを求める関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    train_path: str
+        学習データのデータセットのパス
+    valid_path: str
+        検証データのデータセットのパス
+    """
+    # データセットの構築に影響するパラメータからハッシュ値を求める
+    items = normalize_lgb_params(cfg["params"])
+    text = json.dumps(items, sort_keys=True)
+    suffix = hashlib.sha256(text.encode()).hexdigest()[:16]
+
+    # 分割済みのデータと同じ場所に保存し, まとめて削除されるようにする
+    entry_dir = os.path.join(cfg["cache"]["cache_dir"], get_cache_key(cfg))
+    train_path = os.path.join(entry_dir, f"lgb_{suffix}_train.bin")
+    valid_path = os.path.join(entry_dir, f"lgb_{suffix}_valid.bin")
+
+    return train_path, valid_path
+
+
+def get_dir_size(path: str) -> int:
+    """
+    ディレクトリ内のファイルの合計サイズを求める関数
+
+    Parameters
+    ----------
+    path: str
+        サイズを求めるディレクトリのパス
+
+    Returns
+    ----------
+    size: int
+        合計サイズ (バイト)
+    """
+    size = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            size += entry.stat().st_size
+
+    return size
+
+
+def load_splits(cache_dir: str, key: str) -> Optional[dict]:
+    """
+    キャッシュから分割済みのデータを読み込む関数
+
+    Parameters
+    ----------
+    cache_dir: str
+        キャッシュを保存するディレクトリのパス
+    key: str
+        キャッシュのキー
+
+    Returns
+    ----------
+    splits: Optional[dict]
+        分割済みのデータフレームの辞書, キャッシュが無い場合は None
+    """
+    # キャッシュが存在しない場合は何もしない
+    entry_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    # 配列をメモリマップで読み込み, コピーせずにデータフレームにする
+    splits = {}
+    for name in SPLIT_NAMES:
+        path = os.path.join(entry_dir, f"{name}.npy")
+        try:
+            values = np.load(path, mmap_mode="c")
+        except ValueError:
+            # 空の配列はメモリマップできないため通常通り読み込む
+            values = np.load(path)
+        splits[name] = pd.DataFrame(
+            values, columns=meta["columns"][name], copy=False
+        )
+
+    # 最近使ったキャッシュとして更新時刻を記録する
+    os.utime(entry_dir)
+
+    return splits
+
+
+def save_splits(
+        cache_dir: str, key: str, splits: dict, max_size_mb: float
+    ) -> None:
+    """
+    分割済みのデータをキャッシュに保存する関数
+
+    Parameters
+    ----------
+    cache_dir: str
+        キャッシュを保存するディレクトリのパス
+    key: str
+        キャッシュのキー
+    splits: dict
+        分割済みのデータフレームの辞書
+    max_size_mb: float
+        キャッシュ全体の上限サイズ (MB)
+
+    Returns
+    ----------
+    None
+    """
+    # 数値だけのデータフレームでなければ保存しない
+    for name in SPLIT_NAMES:
+        if not all(
+            pd.api.types.is_numeric_dtype(dtype)
+            for dtype in splits[name].dtypes
+        ):
+            return
+
+    # 一時ディレクトリに書き込んでから名前を変更し, 途中の状態を見せない
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-")
+    meta = {"columns": {}}
+    for name in SPLIT_NAMES:
+        # float32 のデータは float32 のまま保存し, 読み込んだ配列をそのまま Tensor にできるようにする
+        dtype = np.result_type(np.float32, *splits[name].dtypes)
+        np.save(
+            os.path.join(tmp_dir, f"{name}.npy"),
+            splits[name].to_numpy(dtype=dtype)
+        )
+        meta["columns"][name] = list(splits[name].columns)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # 他の実験が同時に保存していた場合はそちらを使う
+    try:
+        os.rename(tmp_dir, os.path.join(cache_dir, key))
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # 上限サイズを超えた分を古い順に削除する
+    evict(cache_dir, int(max_size_mb * 1024 * 1024))
+
+
+def evict(cache_dir: str, max_bytes: int) -> None:
+    """
+    最も長く使われていないキャッシュから順に削除する関数
+
+    Parameters
+    ----------
+    cache_dir: str
+        キャッシュを保存するディレクトリのパス
+    max_bytes: int
+        キャッシュ全体の上限サイズ (バイト)
+
+    Returns
+    ----------
+    None
+    """
+    # 各キャッシュの最終使用時刻とサイズを取得する
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_dir() and not entry.name.startswith("."):
+            entries.append(
+                (entry.stat().st_mtime, get_dir_size(entry.path), entry.path)
+            )
+
+    # 上限に収まるまで古いものから削除する
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
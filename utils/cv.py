@@ -0,0 +1,221 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+
+from utils.preprocessing import to_torch
+from utils.sweep import attach_splits, release, share_splits
+
+
+def get_threads_per_fold(n_jobs: int) -> int:
+    """
+    fold ごとに使うスレッド数を求める関数
+
+    Parameters
+    ----------
+    n_jobs: int
+        並列に学習する fold の数
+
+    Returns
+    ----------
+    threads: int
+        fold ごとに使うスレッド数
+    """
+    return max((os.cpu_count() or 1) // n_jobs, 1)
+
+
+def cross_validate_lgb(cfg: dict, cv_out: dict) -> List[dict]:
+    """
+    LightGBM モデルの時系列の交差検証を行う関数
+
+    特徴量のビンの境界は全体のデータセットで 1 回だけ作成し,
+    各 fold はその subset として作成することでヒストグラムの構築をやり直さない.
+    lgb.train は GIL を解放するため, fold はスレッドで並列に学習する.
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    cv_out: dict
+        make_cv_splits で作成した辞書
+
+    Returns
+    ----------
+    results: List[dict]
+        各 fold の検証データでの最良の評価値のリスト
+    """
+    import lightgbm as lgb
+
+    cv_df = cv_out["cv_data"]
+    n_jobs = cfg["cv"]["n_jobs"]
+    params = dict(cfg["params"], num_threads=get_threads_per_fold(n_jobs))
+
+    # 全体のデータセットを 1 回だけ構築する
+    full_dataset = lgb.Dataset(
+        cv_df.drop("y", axis=1), cv_df["y"],
+        params=params, free_raw_data=False
+    ).construct()
+
+    # 各 fold のデータセットを全体の subset として事前に構築する
+    fold_datasets = []
+    for train_idx, valid_idx in cv_out["folds"]:
+        train_dataset = full_dataset.subset(train_idx, params=params)
+        valid_dataset = full_dataset.subset(valid_idx, params=params)
+        fold_datasets.append(
+            (train_dataset.construct(), valid_dataset.construct())
+        )
+
+    def train_fold(datasets: tuple) -> dict:
+        train_dataset, valid_dataset = datasets
+        model = lgb.train(
+            params,
+            train_dataset,
+            valid_sets=[valid_dataset],
+            valid_names=["Valid"],
+            num_boost_round=cfg["training"]["num_boost_round"],
+            callbacks=[
+                lgb.early_stopping(
+                    stopping_rounds=cfg["training"]["early_stopping"]["stopping_rounds"],
+                    verbose=False
+                )
+            ]
+        )
+        result = {
+            "best_score": model.best_score["Valid"][cfg["params"]["metric"]],
+            "best_iteration": model.best_iteration
+        }
+        return result
+
+    # 各 fold を並列に学習する
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(train_fold, fold_datasets))
+
+    return results
+
+
+def train_nn_fold(
+        cfg: dict, descriptor: dict, train_idx: np.ndarray,
+        valid_idx: np.ndarray, device: str, threads: int
+    ) -> dict:
+    """
+    子プロセスで NeuralNetwork モデルの 1 つの fold を学習する関数
+
+    fold ごとにプロセスを分けることで, 乱数の状態とスレッド数を他の fold と共有しない.
+    各 fold は config のシード値から始めるため, 結果は fold を学習する順番によらない.
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    descriptor: dict
+        共有メモリに配置された交差検証のデータの情報
+    train_idx: np.ndarray
+        学習データの行の位置
+    valid_idx: np.ndarray
+        検証データの行の位置
+    device: str
+        計算に使うデバイス
+    threads: int
+        fold ごとに使うスレッド数
+
+    Returns
+    ----------
+    result: dict
+        検証データでの最良の評価値とそのエポック
+    """
+    # torch を使うモジュールは NeuralNetwork の交差検証でのみ読み込む
+    import torch
+    from torch.utils.data import TensorDataset
+
+    from experiment_tools.set_random_seed import fix_seed
+    from models.networks import NeuralNetwork
+    from trainers.callbacks import get_callbacks
+    from trainers.loader import get_dataloader
+    from trainers.opt import options
+    from trainers.trainer import Trainer
+
+    # 並列に動く fold 同士でコアを取り合わないようにする
+    torch.set_num_threads(threads)
+    fix_seed(cfg["seed"])
+
+    # 共有メモリ上のデータから fold のデータセットを作成する
+    splits, handles = attach_splits(descriptor)
+    try:
+        cv_df = splits["cv_data"]
+        X, y = to_torch(
+            cv_df.drop("y", axis=1).to_numpy(), cv_df["y"].to_numpy(),
+            torch_type=cfg["torch_type"]
+        )
+        train_idx = torch.from_numpy(train_idx)
+        valid_idx = torch.from_numpy(valid_idx)
+        train_dataset = TensorDataset(X[train_idx], y[train_idx])
+        valid_dataset = TensorDataset(X[valid_idx], y[valid_idx])
+        del cv_df, splits, X, y
+    finally:
+        release(handles)
+
+    model = NeuralNetwork(cfg, train_dataset.tensors[0].shape[1], 1).to(device=device)
+    optimizer = options(cfg, model).getter()
+    trainer = Trainer(
+        cfg=cfg,
+        model=model,
+        optimizer=optimizer,
+        device=device,
+        batch_size=cfg["dataloader_params"]["batch_size"],
+        callbacks=get_callbacks(cfg)
+    )
+    _, training_data = trainer.fit(
+        cfg["params"]["epochs"],
+        get_dataloader(cfg, train_dataset),
+        get_dataloader(cfg, valid_dataset)
+    )
+    valid_loss = training_data["Valid"][cfg["criterion"]]
+    result = {
+        "best_score": min(valid_loss),
+        "best_iteration": int(np.argmin(valid_loss)) + 1
+    }
+
+    return result
+
+
+def cross_validate_nn(cfg: dict, cv_out: dict, device: str) -> List[dict]:
+    """
+    NeuralNetwork モデルの時系列の交差検証を行う関数
+
+    torch の乱数の状態とスレッド数はプロセス全体で共有されるため, sweep と同様に
+    fold はプロセスで並列に学習し, データは共有メモリを介してコピーせずに渡す.
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    cv_out: dict
+        make_cv_splits で作成した辞書
+    device: str
+        計算に使うデバイス
+
+    Returns
+    ----------
+    results: List[dict]
+        各 fold の検証データでの最良の評価値のリスト
+    """
+    n_jobs = cfg["cv"]["n_jobs"]
+    threads = get_threads_per_fold(n_jobs)
+    descriptor, handles = share_splits({"cv_data": cv_out["cv_data"]})
+
+    # 各 fold を並列に学習する
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [
+                executor.submit(
+                    train_nn_fold, cfg, descriptor, train_idx, valid_idx,
+                    device, threads
+                )
+                for train_idx, valid_idx in cv_out["folds"]
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        release(handles, unlink=True)
+
+    return results
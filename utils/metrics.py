@@ -0,0 +1,30 @@
+import logging
+from typing import Callable
+
+from experiment_tools.start_logging import log_metrics
+
+
+def get_lgb_metrics_callback(metrics_logger: logging.Logger) -> Callable:
+    """
+    lgb.train の各ラウンドの評価値を JSONL 形式で記録するコールバックを作成する関数
+
+    Parameters
+    ----------
+    metrics_logger: logging.Logger
+        get_metrics_logger で作成した logger
+
+    Returns
+    ----------
+    callback: Callable
+        lgb.train に渡すコールバック
+    """
+    def callback(env) -> None:
+        metrics = {"iteration": env.iteration + 1}
+        for data_name, eval_name, score, _ in env.evaluation_result_list:
+            metrics.setdefault(data_name, {})[eval_name] = score
+        log_metrics(metrics_logger, metrics)
+
+    # record_evaluation と同じく, early stopping で止まるラウンドも記録されるようにする
+    callback.order = 20
+
+    return callback
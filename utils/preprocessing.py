@@ -1,9 +1,110 @@
-from typing import Literal, Tuple
+import json
+import os
+import warnings
+from typing import TYPE_CHECKING, List, Literal, Optional, Tuple, Union
 
-import lightgbm as lgb
+import numpy as np
 import pandas as pd
-import torch
-from torch.utils.data import TensorDataset
+
+from utils.cache import (
+    get_cache_key, get_lgb_dataset_paths, load_splits, save_splits
+)
+
+# lightgbm と torch は読み込みに時間がかかるため, 使う関数の中で読み込む
+# これにより LightGBM の実験で torch を, NeuralNetwork の実験で lightgbm を読み込まずに済む
+if TYPE_CHECKING:
+    import lightgbm as lgb
+    import torch
+
+
+def convert_to_columnar(
+        csv_path: str, out_dir: Optional[str] = None,
+        dtype: Optional[str] = "float32"
+    ) -> str:
+    """
+    CSV ファイルを列ごとの .npy ファイルからなる形式に変換する関数
+
+    Parameters
+    ----------
+    csv_path: str
+        変換する CSV ファイルのパス
+    out_dir: Optional[str] = None
+        出力先のディレクトリのパス, 指定しない場合は拡張子を .columnar に置き換える
+    dtype: Optional[str] = "float32"
+        保存する際の型, None の場合は CSV を読み込んだ型のままとする
+        float32 で保存すると, NeuralNetwork の学習では型を変換せずに Tensor にできる
+
+    Returns
+    ----------
+    out_dir: str
+        出力先のディレクトリのパス
+    """
+    if out_dir is None:
+        out_dir = os.path.splitext(csv_path)[0] + ".columnar"
+
+    # CSV を読み込んで列ごとに .npy ファイルとして保存する
+    df = pd.read_csv(csv_path)
+    os.makedirs(out_dir, exist_ok=True)
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if dtype is not None:
+            values = values.astype(dtype)
+        np.save(os.path.join(out_dir, f"{col}.npy"), values)
+
+    # 列の並び順を記録する
+    with open(os.path.join(out_dir, "columns.json"), "w") as f:
+        json.dump(list(df.columns), f)
+
+    return out_dir
+
+
+def load_columns(path: str) -> dict:
+    """
+    列ごとの .npy ファイルからなるデータをメモリマップで読み込む関数
+
+    Parameters
+    ----------
+    path: str
+        convert_to_columnar で作成したディレクトリのパス
+
+    Returns
+    ----------
+    columns: dict
+        列名をキー, メモリマップされた配列を値とする辞書
+    """
+    with open(os.path.join(path, "columns.json")) as f:
+        names = json.load(f)
+
+    # 書き込み時にだけコピーされるモードで読み込み, ページキャッシュを共有する
+    columns = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="c")
+        for name in names
+    }
+
+    return columns
+
+
+def read_data(path: str) -> pd.DataFrame:
+    """
+    データを読み込んで Pandas のデータフレームにする関数
+
+    Parameters
+    ----------
+    path: str
+        CSV ファイル, もしくは convert_to_columnar で作成したディレクトリのパス
+
+    Returns
+    ----------
+    df: pd.DataFrame
+        読み込んだデータフレーム
+    """
+    # 列ごとの形式であればメモリマップした配列をコピーせずに使う
+    if os.path.isdir(path):
+        df = pd.DataFrame(load_columns(path), copy=False)
+    else:
+        df = pd.read_csv(path)
+
+    return df
 
 
 def df_index_resetter(df: pd.DataFrame) -> pd.DataFrame:
@@ -57,9 +158,71 @@ def data_split(
     return front, back
 
 
-def make_datasets(cfg: dict) -> dict:
+def make_lag_matrix(y: np.ndarray, lag: int) -> np.ndarray:
     """
-    LightGBMの実験で使用するデータセットを作成する関数
+    系列からラグ特徴量の行列を一括で作成する関数
+
+    Parameters
+    ----------
+    y: np.ndarray
+        ラグを取る 1 次元の系列
+    lag: int
+        作成するラグの数
+
+    Returns
+    ----------
+    lag_matrix: np.ndarray
+        i 列目が i + 1 ステップ前の値となる (len(y), lag) の行列
+        先頭の参照できない部分は NaN とする, 型は y が浮動小数点数であればそのまま, それ以外は float64
+    """
+    # float32 のデータは float32 のまま扱い, 後で型を変換しないようにする
+    y = np.asarray(y)
+    if not np.issubdtype(y.dtype, np.floating):
+        y = y.astype(np.float64)
+    if lag == 0:
+        return np.empty((len(y), 0), dtype=y.dtype)
+
+    # 先頭に lag 個の NaN を付加した系列を用意する
+    padded = np.concatenate([np.full(lag, np.nan, dtype=y.dtype), y])
+
+    # 長さ lag の窓をストライドで一度に切り出し, 新しい順に並べ替える
+    windows = np.lib.stride_tricks.sliding_window_view(padded, lag)
+    lag_matrix = np.ascontiguousarray(windows[:len(y), ::-1])
+
+    return lag_matrix
+
+
+def add_lag_features(df: pd.DataFrame, lag: int) -> pd.DataFrame:
+    """
+    データフレームにラグ特徴量の列を付加する関数
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        目的変数 "y" を含むデータフレーム
+    lag: int
+        作成するラグの数
+
+    Returns
+    ----------
+    pre_df: pd.DataFrame
+        "y_{i}_shift" 列を付加したデータフレーム
+    """
+    # ラグ行列を作成し, 1 回の結合で列を付加する
+    lag_matrix = make_lag_matrix(df["y"].to_numpy(), lag)
+    lag_df = pd.DataFrame(
+        lag_matrix,
+        columns=[f"y_{i + 1}_shift" for i in range(lag)],
+        index=df.index
+    )
+    pre_df = pd.concat([df, lag_df], axis=1)
+
+    return pre_df
+
+
+def build_splits(cfg: dict) -> dict:
+    """
+    データを読み込み, ラグ特徴量を付加して学習・検証・評価用に分割する関数
 
     Parameters
     ----------
@@ -68,18 +231,17 @@ def make_datasets(cfg: dict) -> dict:
 
     Returns
     ----------
-    out: dict
-        データセットの辞書
+    splits: dict
+        元データと分割後のデータフレームの辞書
     """
     # データを読み込んで Pandas のデータフレームにする
-    df = pd.read_csv(cfg["data_path"])
-    pre_df = df.copy()
+    df = read_data(cfg["data_path"])
 
     # config の lag を参照して入力データを整形
-    for i in range(cfg["lag"]):
-        tmp_col = f"y_{i + 1}_shift"
-        pre_df[tmp_col] = pre_df["y"].shift(i + 1)
-    
+    # 目的変数は末尾の列とし, キャッシュから読み込んだ際に説明変数を配列の連続した範囲として参照できるようにする
+    pre_df = add_lag_features(df, cfg["lag"])
+    pre_df = pre_df[[col for col in pre_df.columns if col != "y"] + ["y"]]
+
     # データフレームを学習用とテスト用に分割する
     train_df, test_df = data_split(
         cfg["sampling_rate"]["train"], pre_df
@@ -94,6 +256,228 @@ def make_datasets(cfg: dict) -> dict:
         cfg["sampling_rate"]["valid"], test_df
     )
 
+    # データを辞書型にまとめる
+    splits = {
+        "org_data": df,
+        "train_data": train_df,
+        "valid_data": valid_df,
+        "eval_data": eval_df
+    }
+
+    return splits
+
+
+def make_splits(cfg: dict) -> dict:
+    """
+    分割済みのデータをキャッシュから取得し, 無い場合は作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    splits: dict
+        元データと分割後のデータフレームの辞書
+    """
+    # キャッシュを使わない場合はそのまま作成する
+    cache_cfg = cfg.get("cache", {"enable": False})
+    if not cache_cfg["enable"]:
+        return build_splits(cfg)
+
+    # データと前処理の config が同じキャッシュがあれば読み込む
+    key = get_cache_key(cfg)
+    splits = load_splits(cache_cfg["cache_dir"], key)
+    if splits is not None:
+        return splits
+
+    # キャッシュが無い場合は作成して保存する
+    splits = build_splits(cfg)
+    save_splits(
+        cache_cfg["cache_dir"], key, splits, cache_cfg["max_size_mb"]
+    )
+
+    return splits
+
+
+def rolling_origin_folds(
+        n_rows: int, n_folds: int,
+        mode: Literal["expanding", "sliding"] = "expanding",
+        valid_size: Optional[int] = None, train_size: Optional[int] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    時系列の起点をずらしながら学習用と検証用の行番号を作成する関数
+
+    Parameters
+    ----------
+    n_rows: int
+        分割するデータの行数
+    n_folds: int
+        fold の数
+    mode: Literal["expanding", "sliding"] = "expanding"
+        "expanding" は学習範囲を先頭から広げ, "sliding" は一定の長さでずらす
+    valid_size: Optional[int] = None
+        各 fold の検証データの行数, 指定しない場合は n_rows // (n_folds + 1)
+    train_size: Optional[int] = None
+        "sliding" の場合の学習データの行数, 指定しない場合は最初の fold の長さとする
+
+    Returns
+    ----------
+    folds: List[Tuple[np.ndarray, np.ndarray]]
+        各 fold の学習用と検証用の行番号のリスト
+    """
+    if valid_size is None:
+        valid_size = n_rows // (n_folds + 1)
+
+    # 検証データは末尾から n_folds 個の連続した区間とする
+    first_valid = n_rows - n_folds * valid_size
+    if train_size is None:
+        train_size = first_valid
+    if first_valid <= 0:
+        raise ValueError("valid_size * n_folds must be smaller than n_rows")
+
+    folds = []
+    for k in range(n_folds):
+        valid_start = first_valid + k * valid_size
+        if mode == "expanding":
+            train_start = 0
+        else:
+            train_start = max(valid_start - train_size, 0)
+        folds.append((
+            np.arange(train_start, valid_start),
+            np.arange(valid_start, valid_start + valid_size)
+        ))
+
+    return folds
+
+
+def make_cv_splits(cfg: dict, splits: Optional[dict] = None) -> dict:
+    """
+    時系列の交差検証に使うデータと fold を作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    splits: Optional[dict] = None
+        分割済みのデータフレームの辞書, 指定しない場合はデータを読み込んで作成する
+
+    Returns
+    ----------
+    out: dict
+        交差検証に使うデータフレーム, fold, 評価用のデータフレームの辞書
+    """
+    # データを読み込み, ラグ特徴量を付加して分割する
+    if splits is None:
+        splits = make_splits(cfg)
+
+    # 評価データ以外を繋げて交差検証に使う
+    cv_df = pd.concat(
+        [splits["train_data"], splits["valid_data"]], ignore_index=True
+    )
+
+    # config を参照して fold を作成する
+    folds = rolling_origin_folds(
+        len(cv_df),
+        n_folds=cfg["cv"]["n_folds"],
+        mode=cfg["cv"]["mode"],
+        valid_size=cfg["cv"]["valid_size"],
+        train_size=cfg["cv"]["train_size"]
+    )
+
+    out = {
+        "cv_data": cv_df,
+        "folds": folds,
+        "eval_data": splits["eval_data"]
+    }
+
+    return out
+
+
+def load_lgb_datasets(
+        cfg: dict, X_train: pd.DataFrame, y_train: pd.Series,
+        X_valid: pd.DataFrame, y_valid: pd.Series
+    ) -> Tuple["lgb.Dataset", "lgb.Dataset"]:
+    """
+    構築済みの LightGBM のデータセットをバイナリ形式のキャッシュから読み込む関数
+
+    キャッシュが無い場合は構築してバイナリ形式で保存する.
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    X_train: pd.DataFrame
+        学習データの説明変数
+    y_train: pd.Series
+        学習データの目的変数
+    X_valid: pd.DataFrame
+        検証データの説明変数
+    y_valid: pd.Series
+        検証データの目的変数
+
+    Returns
+    ----------
+    train_dataset: lgb.Dataset
+        学習データのデータセット
+    valid_dataset: lgb.Dataset
+        検証データのデータセット
+    """
+    import lightgbm as lgb
+
+    train_path, valid_path = get_lgb_dataset_paths(cfg)
+
+    # バイナリ形式のキャッシュがあれば, ビンを作り直さずに読み込む
+    if os.path.exists(train_path) and os.path.exists(valid_path):
+        train_dataset = lgb.Dataset(train_path, params=cfg["params"])
+        valid_dataset = lgb.Dataset(
+            valid_path, reference=train_dataset, params=cfg["params"]
+        )
+        return train_dataset, valid_dataset
+
+    # データセットを構築する
+    train_dataset = lgb.Dataset(X_train, y_train, params=cfg["params"])
+    valid_dataset = lgb.Dataset(
+        X_valid, label=y_valid, reference=train_dataset, params=cfg["params"]
+    )
+    train_dataset.construct()
+    valid_dataset.construct()
+
+    # 一時ファイルに書き込んでから名前を変更し, 途中の状態を見せない
+    os.makedirs(os.path.dirname(train_path), exist_ok=True)
+    for dataset, path in [(train_dataset, train_path), (valid_dataset, valid_path)]:
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        dataset.save_binary(tmp_path)
+        os.replace(tmp_path, path)
+
+    return train_dataset, valid_dataset
+
+
+def make_datasets(cfg: dict, splits: Optional[dict] = None) -> dict:
+    """
+    LightGBMの実験で使用するデータセットを作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+    splits: Optional[dict] = None
+        分割済みのデータフレームの辞書, 指定しない場合はデータを読み込んで作成する
+
+    Returns
+    ----------
+    out: dict
+        データセットの辞書
+    """
+    # データを読み込み, ラグ特徴量を付加して分割する
+    if splits is None:
+        splits = make_splits(cfg)
+    df = splits["org_data"]
+    train_df = splits["train_data"]
+    valid_df = splits["valid_data"]
+    eval_df = splits["eval_data"]
+
     # 学習データの変数分離
     X_train = train_df.drop("y", axis=1)
     y_train = train_df["y"]
@@ -103,8 +487,18 @@ def make_datasets(cfg: dict) -> dict:
     y_valid = valid_df["y"]
 
     # 学習・検証データのデータセットを作成
-    train_dataset = lgb.Dataset(X_train, y_train)
-    valid_dataset = lgb.Dataset(X_valid, label=y_valid, reference=train_dataset)
+    cache_cfg = cfg.get("cache", {"enable": False})
+    if cache_cfg["enable"]:
+        train_dataset, valid_dataset = load_lgb_datasets(
+            cfg, X_train, y_train, X_valid, y_valid
+        )
+    else:
+        import lightgbm as lgb
+
+        train_dataset = lgb.Dataset(X_train, y_train)
+        valid_dataset = lgb.Dataset(
+            X_valid, label=y_valid, reference=train_dataset
+        )
 
     # データを辞書型にまとめる
     out = {
@@ -120,19 +514,19 @@ def make_datasets(cfg: dict) -> dict:
 
 
 def to_torch(
-        X: pd.DataFrame,
-        y: pd.DataFrame,
+        X: Union[pd.DataFrame, np.ndarray],
+        y: Union[pd.DataFrame, np.ndarray],
         torch_type: Literal["Float", "Long"] = "Float",
-    ) -> Tuple[torch.Tensor, torch.Tensor]:
+    ) -> Tuple["torch.Tensor", "torch.Tensor"]:
     """
     データを Tensor 型に変換するする関数
 
     Parameters
     ----------
-    X: pd.DataFrame
-        説明変数のデータフレーム
-    y: pd.DataFrame
-        目的変数のデータフレーム
+    X: Union[pd.DataFrame, np.ndarray]
+        説明変数のデータフレーム, もしくは配列
+    y: Union[pd.DataFrame, np.ndarray]
+        目的変数のデータフレーム, もしくは配列
     torch_type: Literal["Float", "Long"] = "Float"
         PyTorch で計算できる型
 
@@ -143,22 +537,36 @@ def to_torch(
     y_data: torch.Tensor
         Tensor 型に変換した目的変数のデータ
     """
-    # Tensor 型に変換するために一旦 NumPy に直す
-    X_data = X.to_numpy()
-    y_data = y.to_numpy()
-
-    # PyTorch で計算できる型に変換する
-    if torch_type == "Float":
-        X_data = torch.from_numpy(X_data).float()
-        y_data = torch.from_numpy(y_data).float()
-    else:
-        X_data = torch.from_numpy(X_data).long()
-        y_data = torch.from_numpy(y_data).long()
+    import torch
+
+    from experiment_tools.set_random_seed import seed_torch
+
+    # fix_seed の時点で torch が読み込まれていなかった場合は, ここでシードを固定する
+    seed_torch()
+
+    # PyTorch で計算できる型の配列にし, Tensor とメモリを共有する
+    dtype = np.float32 if torch_type == "Float" else np.int64
+    tensors = []
+    for values in [X, y]:
+        # 型の変換によるコピーはここで 1 回だけ行う
+        # データ (列ごとの形式やキャッシュ) が float32 であればコピーせず, 元の配列を参照する
+        values = np.asarray(values, dtype=dtype)
+
+        # pandas の Copy-on-Write により読み取り専用となった配列は, 書き込み可能にすると
+        # 元のデータフレームの保護が外れるため, 読み取り専用のまま Tensor で参照する
+        # Tensor は学習と予測で読み出すのみであり, 書き込まないため警告はここでのみ抑える
+        with warnings.catch_warnings():
+            warnings.filterwarnings(
+                "ignore", message="The given NumPy array is not writable",
+                category=UserWarning
+            )
+            tensors.append(torch.from_numpy(values))
+    X_data, y_data = tensors
 
     return X_data, y_data
 
 
-def make_datasets_for_nn(cfg: dict) -> dict:
+def make_datasets_for_nn(cfg: dict, splits: Optional[dict] = None) -> dict:
     """
     ニューラルネットワーク系の実験で使用するデータセットを作成する関数
 
@@ -166,34 +574,21 @@ def make_datasets_for_nn(cfg: dict) -> dict:
     ----------
     cfg: dict
         実験に使う値の config データ
+    splits: Optional[dict] = None
+        分割済みのデータフレームの辞書, 指定しない場合はデータを読み込んで作成する
 
     Returns
     ----------
     out: dict
         データセットの辞書
     """
-    # データを読み込んで Pandas のデータフレームにする
-    df = pd.read_csv(cfg["data_path"])
-    pre_df = df.copy()
-
-    # config の lag を参照して入力データを整形
-    for i in range(cfg["lag"]):
-        tmp_col = f"y_{i + 1}_shift"
-        pre_df[tmp_col] = pre_df["y"].shift(i + 1)
-    
-    # データフレームを学習用とテスト用に分割する
-    train_df, test_df = data_split(
-        cfg["sampling_rate"]["train"], pre_df
-    )
-
-    # 学習データの欠損部分を削除する
-    train_df = train_df.dropna(how="any")
-    train_df = df_index_resetter(train_df)
-
-    # テスト用データフレームを検証用と評価用に分割する
-    valid_df, eval_df = data_split(
-        cfg["sampling_rate"]["valid"], test_df
-    )
+    # データを読み込み, ラグ特徴量を付加して分割する
+    if splits is None:
+        splits = make_splits(cfg)
+    df = splits["org_data"]
+    train_df = splits["train_data"]
+    valid_df = splits["valid_data"]
+    eval_df = splits["eval_data"]
 
     # 学習データの変数分離
     X_train = train_df.drop("y", axis=1)
@@ -204,6 +599,8 @@ def make_datasets_for_nn(cfg: dict) -> dict:
     y_valid = valid_df["y"]
 
     # 学習・検証データのデータセットを作成
+    from torch.utils.data import TensorDataset
+
     X_train, y_train = to_torch(X_train, y_train, torch_type=cfg["torch_type"])
     X_valid, y_valid = to_torch(X_valid, y_valid, torch_type=cfg["torch_type"])
     train_dataset = TensorDataset(X_train, y_train)
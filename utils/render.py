@@ -0,0 +1,304 @@
+import os
+import pickle
+import subprocess
+import sys
+import traceback
+from logging import getLogger
+from multiprocessing import util
+from typing import List, Optional
+
+import numpy as np
+
+# 実験の logger の子とし, 描画の失敗を実験の log に記録する
+logger = getLogger("experiment_tools.start_logging.render")
+
+# 図の描画を行うプロセス, プロセスごとに最初の描画の際に起動する
+_renderer: Optional[subprocess.Popen] = None
+
+# 描画のプロセスを起動したプロセスの id, fork で引き継いだものを区別するために使う
+_renderer_pid: Optional[int] = None
+
+# 描画を依頼した画像のパス
+_pending: List[str] = []
+
+
+def start_renderer() -> None:
+    """
+    描画を行うプロセスを起動する関数
+
+    Returns
+    ----------
+    None
+    """
+    global _renderer, _renderer_pid
+    # 呼び出し元のスクリプトを読み込み直さないよう, multiprocessing は使わずに起動する
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_path = os.pathsep.join(
+        [root_dir] + [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p]
+    )
+    env = dict(os.environ, PYTHONPATH=python_path, MPLBACKEND="Agg")
+    _renderer = subprocess.Popen(
+        [sys.executable, "-m", "utils.render"],
+        stdin=subprocess.PIPE, env=env
+    )
+    _renderer_pid = os.getpid()
+
+    # プロセスの終了時に描画の完了を待つ
+    # atexit は multiprocessing の子プロセスでは呼ばれないため, sweep の試行でも呼ばれる Finalize を使う
+    # 子プロセスの開始時に Finalize の登録は消されるため, 起動したプロセスで登録する
+    util.Finalize(None, wait_renderer, exitpriority=10)
+
+
+def submit(kind: str, out_path: str, **arrays) -> None:
+    """
+    描画をバックグラウンドのプロセスに依頼する関数
+
+    描画の完了は待たずにすぐに戻る.
+    依頼した描画はプロセスの終了時, もしくは wait_renderer を呼んだ時点で全て完了する.
+    描画のプロセスが終了していた場合は 1 度だけ起動し直し, それでも渡せない場合は描画を諦める.
+
+    Parameters
+    ----------
+    kind: str
+        描画する図の種類, "loss_curve", "feature_importance", "prediction" のいずれか
+    out_path: str
+        画像を保存するパス
+    **arrays:
+        描画に使うデータ, モデルなどは渡さず配列やリストのみを渡す
+
+    Returns
+    ----------
+    None
+    """
+    global _renderer
+    for _ in range(2):
+        if _renderer is None or _renderer_pid != os.getpid():
+            start_renderer()
+
+        try:
+            pickle.dump(
+                (kind, out_path, arrays), _renderer.stdin, protocol=pickle.HIGHEST_PROTOCOL
+            )
+            _renderer.stdin.flush()
+        except OSError as e:
+            # 描画のプロセスが落ちていても, 実験は止めずに続ける
+            logger.warning(f"renderer is not available ({e}), restarting")
+            _renderer.kill()
+            _renderer.wait()
+            _renderer = None
+            continue
+
+        _pending.append(out_path)
+        return
+
+    logger.warning(f"renderer failed twice, skipping {kind}: {out_path}")
+
+
+def pending_paths() -> List[str]:
+    """
+    描画を依頼した画像のパスを取り出す関数
+
+    実験の終了時にはまだ画像が保存されていない場合があるため, 実験の一覧への登録に使う.
+    sweep のように 1 つのプロセスで複数の実験を行う場合に前の実験のパスを渡さないよう,
+    取り出したパスは一覧から消す.
+
+    Returns
+    ----------
+    paths: List[str]
+        前回取り出してから描画を依頼した画像のパスのリスト
+    """
+    paths = list(_pending)
+    _pending.clear()
+
+    return paths
+
+
+def wait_renderer() -> None:
+    """
+    依頼した描画が全て完了するまで待つ関数
+
+    Returns
+    ----------
+    None
+    """
+    global _renderer
+    if _renderer is None:
+        return
+
+    # fork で引き継いだ場合は親プロセスが待つため, 参照を外すだけにする
+    _pending.clear()
+    if _renderer_pid != os.getpid():
+        _renderer = None
+        return
+
+    # 入力を閉じると, 描画のプロセスは残りの描画を終えてから終了する
+    try:
+        _renderer.stdin.close()
+    except OSError:
+        pass
+    _renderer.wait()
+    _renderer = None
+
+
+def render_loss_curve(
+        out_path: str, train_y: np.ndarray, valid_y: np.ndarray
+    ) -> None:
+    """
+    学習過程のロスの遷移を描画する関数
+
+    Parameters
+    ----------
+    out_path: str
+        画像を保存するパス
+    train_y: np.ndarray
+        学習データのロス
+    valid_y: np.ndarray
+        検証データのロス
+
+    Returns
+    ----------
+    None
+    """
+    import matplotlib.pyplot as plt
+
+    x = np.arange(1, len(train_y) + 1)
+
+    # 画像のスタイルを指定する
+    fig, ax = plt.subplots(figsize=(18, 12))
+    ax.set_title("Loss comparison", size=15, color="red")
+    ax.grid()
+
+    # データのプロットをする
+    ax.plot(x, train_y, label="Train")
+    ax.plot(x, valid_y, label="Valid")
+    ax.set_xlabel("Epoch")
+    ax.set_ylabel("Loss")
+
+    # 画像を保存し, 図を閉じる
+    ax.legend(bbox_to_anchor=(1.01, 1), loc="upper left", borderaxespad=0.)
+    fig.savefig(out_path)
+    plt.close(fig)
+
+
+def render_feature_importance(
+        out_path: str, names: list, importance: np.ndarray
+    ) -> None:
+    """
+    特徴量の重要度を描画する関数
+
+    lgb.plot_importance と同じく, 重要度が 0 の特徴量を除いて昇順に並べる.
+
+    Parameters
+    ----------
+    out_path: str
+        画像を保存するパス
+    names: list
+        特徴量の名前
+    importance: np.ndarray
+        特徴量の重要度
+
+    Returns
+    ----------
+    None
+    """
+    import matplotlib.pyplot as plt
+
+    # 重要度が 0 の特徴量を除いて並べ替える
+    items = sorted(
+        [(value, name) for name, value in zip(names, importance) if value > 0]
+    )
+    values = [value for value, _ in items]
+    labels = [name for _, name in items]
+    ylocs = np.arange(len(values))
+
+    # 画像のスタイルを指定する
+    fig, ax = plt.subplots(figsize=(18, 12))
+    ax.set_title("LightGBM Feature Importance", size=15, color="red")
+    ax.grid()
+
+    # 特徴量の重要度を描画する
+    ax.barh(ylocs, values, align="center", height=0.2)
+    for x, y in zip(values, ylocs):
+        ax.text(x + 1, y, str(x), va="center")
+    ax.set_yticks(ylocs)
+    ax.set_yticklabels(labels)
+    ax.set_xlabel("Feature importance")
+    ax.set_ylabel("Features")
+
+    # 画像を保存し, 図を閉じる
+    fig.savefig(out_path)
+    plt.close(fig)
+
+
+def render_prediction(
+        out_path: str, x: np.ndarray, y_true: np.ndarray, y_preds: np.ndarray
+    ) -> None:
+    """
+    予測結果を描画する関数
+
+    Parameters
+    ----------
+    out_path: str
+        画像を保存するパス
+    x: np.ndarray
+        説明変数 x の値
+    y_true: np.ndarray
+        目的変数の真値
+    y_preds: np.ndarray
+        目的変数の予測値
+
+    Returns
+    ----------
+    None
+    """
+    import matplotlib.pyplot as plt
+
+    # 画像のスタイルを指定する
+    fig, ax = plt.subplots(figsize=(18, 12))
+    ax.set_title("Prediction", size=15, color="red")
+    ax.grid()
+
+    # データのプロットをする
+    ax.scatter(x, y_true, label="True")
+    ax.plot(x, y_preds, label="Preds", color="orange")
+
+    # 画像を保存し, 図を閉じる
+    ax.legend(bbox_to_anchor=(1.01, 1), loc="upper left", borderaxespad=0.)
+    fig.savefig(out_path)
+    plt.close(fig)
+
+
+RENDERERS = {
+    "loss_curve": render_loss_curve,
+    "feature_importance": render_feature_importance,
+    "prediction": render_prediction
+}
+
+
+def serve() -> None:
+    """
+    描画の依頼を受け取り, 順番に描画する関数, 描画のプロセスで実行される
+
+    Returns
+    ----------
+    None
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+    stdin = sys.stdin.buffer
+    while True:
+        try:
+            kind, out_path, arrays = pickle.load(stdin)
+        except EOFError:
+            break
+
+        # 1 つの描画に失敗しても残りの描画は続ける
+        try:
+            RENDERERS[kind](out_path, **arrays)
+        except Exception:
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    serve()
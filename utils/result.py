@@ -1,7 +1,15 @@
-import lightgbm as lgb
-import matplotlib.pyplot as plt
+import logging
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
 import pandas as pd
-import torch
+
+from utils.render import submit
+
+# lightgbm, torch は読み込みに時間がかかるため, 使う関数の中で読み込む
+# matplotlib は描画のプロセスでのみ読み込む
+if TYPE_CHECKING:
+    import lightgbm as lgb
 
 
 def plot_data(
@@ -31,32 +39,18 @@ def plot_data(
         metric = cfg["params"]["metric"]
     else:
         metric = cfg["criterion"]
-    train_y = [
-        item for item in training_data["Train"][metric]
-    ]
-    valid_y = [
-        item for item in training_data["Valid"][metric]
-    ]
-    x = [i + 1 for i in range(len(train_y))]
-
-    # 画像のスタイルを指定する
-    plt.figure(figsize=(18, 12))
-    plt.title("Loss comparison", size=15, color="red")
-    plt.grid()
-
-    # データのプロットをする
-    plt.plot(x, train_y, label="Train")
-    plt.plot(x, valid_y, label="Valid")
-    plt.xlabel("Epoch")
-    plt.ylabel("Loss")
-
-    # 画像を保存する
-    plt.legend(bbox_to_anchor=(1.01, 1), loc="upper left", borderaxespad=0.)
-    plt.savefig(f"{out_dir}/loss_curve.png")
+    train_y = np.asarray(training_data["Train"][metric])
+    valid_y = np.asarray(training_data["Valid"][metric])
+
+    # 描画はバックグラウンドのプロセスで行う
+    submit(
+        "loss_curve", f"{out_dir}/loss_curve.png",
+        train_y=train_y, valid_y=valid_y
+    )
 
 
 def extract_feature_importance(
-        model: lgb.basic.Booster, out_dir: str
+        model: "lgb.basic.Booster", out_dir: str
     ) -> None:
     """
     特徴量の重要度を表示する関数
@@ -72,22 +66,239 @@ def extract_feature_importance(
     ----------
     None
     """
-    # 画像のスタイルを指定する
-    plt.figure(figsize=(18, 12))
-    plt.title("LightGBM Feature Importance", size=15, color="red")
-    plt.grid()
+    # モデルは渡さず, 特徴量の名前と重要度のみを描画のプロセスに渡す
+    submit(
+        "feature_importance", f"{out_dir}/feature_importance.png",
+        names=model.feature_name(), importance=model.feature_importance()
+    )
+
+
+def recursive_forecast(
+        eval_df: pd.DataFrame, model_type: str, model
+    ) -> np.ndarray:
+    """
+    評価データの先頭から再帰的に予測する関数
+
+    Parameters
+    ----------
+    eval_df: pd.DataFrame
+        評価用のデータフレーム
+    model_type: str
+        実験で学習させたモデルのタイプ
+    model:
+        実験で学習させたモデルのインスタンス
+
+    Returns
+    ----------
+    y_preds: np.ndarray
+        各ステップの予測値
+    """
+    # データの準備をする
+    x = eval_df["x"].to_numpy(dtype=np.float64)
+    y_data = eval_df.drop(["x", "y"], axis=1).iloc[0].to_numpy()
+    n = len(eval_df)
+    lag = len(y_data)
+
+    # 予測値を後ろから前へ書き込むバッファを確保する
+    # i ステップ目の入力は buf[n - i - 1:n - i + lag] の連続した領域となる
+    # 先頭に x[i] を書き込んで入力とし, 予測後は同じ位置を予測値で上書きする
+    if model_type == "LightGBM":
+        buf = np.empty(n + lag, dtype=np.float64)
+        buf[n:] = y_data
+
+        for i in range(n):
+            pos = n - i - 1
+            buf[pos] = x[i]
+            buf[pos] = model.predict(
+                buf[pos:pos + lag + 1].reshape(1, -1),
+                num_iteration=model.best_iteration
+            )[0]
+
+        y_preds = buf[:n][::-1].copy()
+    else:
+        import torch
+
+        param = next(model.parameters())
+        buf = torch.empty(n + lag, dtype=param.dtype, device=param.device)
+        # pandas の Copy-on-Write により読み取り専用のビューとなるため, 変換時にコピーする
+        buf[n:] = torch.tensor(y_data, dtype=buf.dtype, device=buf.device)
+        x_data = torch.tensor(x, dtype=buf.dtype, device=buf.device)
+
+        model.eval()
+        with torch.inference_mode():
+            for i in range(n):
+                pos = n - i - 1
+                buf[pos] = x_data[i]
+                buf[pos] = model(buf[pos:pos + lag + 1].unsqueeze(0))[0, 0]
+
+        y_preds = buf[:n].flip(0).cpu().numpy().astype(np.float64)
+
+    return y_preds
+
+
+def backtest(
+        eval_df: pd.DataFrame, model_type: str, model, horizon: int,
+        stride: int = 1, logger: Optional[logging.Logger] = None
+    ) -> dict:
+    """
+    評価データの複数の時点を起点として再帰的な予測をまとめて行う関数
+
+    horizon が評価データの行数より大きい場合は, 評価データの行数に縮めて先頭のみを起点とする.
+
+    Parameters
+    ----------
+    eval_df: pd.DataFrame
+        評価用のデータフレーム
+    model_type: str
+        実験で学習させたモデルのタイプ
+    model:
+        実験で学習させたモデルのインスタンス
+    horizon: int
+        各起点から予測するステップ数
+    stride: int = 1
+        起点の間隔
+    logger: Optional[logging.Logger] = None
+        horizon を縮めた場合に警告を記録する log データ
+
+    Returns
+    ----------
+    result: dict
+        起点, 予測値, 真値, 予測ステップごとの評価指標の辞書
+    """
+    # データの準備をする
+    x = eval_df["x"].to_numpy(dtype=np.float64)
+    y = eval_df["y"].to_numpy(dtype=np.float64)
+    y_data = eval_df.drop(["x", "y"], axis=1).to_numpy(dtype=np.float64)
+    lag = y_data.shape[1]
 
-    # 特徴量の重要度を描画する
-    lgb.plot_importance(model)
+    if horizon < 1 or stride < 1:
+        raise ValueError(f"horizon and stride must be positive: {horizon}, {stride}")
+    if len(eval_df) == 0:
+        raise ValueError("eval data is empty, backtest needs at least one row")
 
-    # 画像を保存する
-    plt.savefig(f"{out_dir}/feature_importance.png")
+    # 評価データより長い範囲は予測できないため, 評価データの行数に縮める
+    if horizon > len(eval_df):
+        if logger is not None:
+            logger.warning(
+                f"backtest horizon {horizon} is longer than the eval data "
+                f"({len(eval_df)} rows), using {len(eval_df)}"
+            )
+        horizon = len(eval_df)
+
+    # 予測範囲が評価データに収まる起点を選ぶ
+    origins = np.arange(0, len(eval_df) - horizon + 1, stride)
+    steps = origins[:, None] + np.arange(horizon)
+
+    # recursive_forecast と同様に, 各行のバッファへ後ろから前へ書き込む
+    # 全ての起点を 1 つの行列として, 予測ステップごとに 1 回だけモデルを呼ぶ
+    if model_type == "LightGBM":
+        buf = np.empty((len(origins), horizon + lag), dtype=np.float64)
+        buf[:, horizon:] = y_data[origins]
+
+        for h in range(horizon):
+            pos = horizon - h - 1
+            buf[:, pos] = x[origins + h]
+            buf[:, pos] = model.predict(
+                buf[:, pos:pos + lag + 1],
+                num_iteration=model.best_iteration
+            )
+
+        y_preds = buf[:, :horizon][:, ::-1].copy()
+    else:
+        import torch
+
+        param = next(model.parameters())
+        buf = torch.empty(
+            (len(origins), horizon + lag),
+            dtype=param.dtype, device=param.device
+        )
+        buf[:, horizon:] = torch.from_numpy(y_data[origins]).to(buf)
+        x_data = torch.from_numpy(x[steps]).to(buf)
+
+        model.eval()
+        with torch.inference_mode():
+            for h in range(horizon):
+                pos = horizon - h - 1
+                buf[:, pos] = x_data[:, h]
+                buf[:, pos] = model(buf[:, pos:pos + lag + 1])[:, 0]
+
+        y_preds = buf[:, :horizon].flip(1).cpu().numpy().astype(np.float64)
+
+    # 予測ステップごとの評価指標をまとめて求める
+    y_true = y[steps]
+    error = y_preds - y_true
+    result = {
+        "origins": origins,
+        "predictions": y_preds,
+        "truth": y_true,
+        "rmse": np.sqrt(np.mean(error ** 2, axis=0)),
+        "mae": np.mean(np.abs(error), axis=0)
+    }
+
+    return result
+
+
+def summarize_backtest(result: dict, out_dir: str) -> pd.DataFrame:
+    """
+    予測ステップごとの評価指標をまとめて保存する関数
+
+    Parameters
+    ----------
+    result: dict
+        backtest で得られた結果の辞書
+    out_dir: str
+        結果を保存するディレクトリのパス
+
+    Returns
+    ----------
+    summary: pd.DataFrame
+        予測ステップごとの評価指標のデータフレーム
+    """
+    # 予測ステップごとの評価指標をデータフレームにまとめる
+    summary = pd.DataFrame({
+        "horizon": np.arange(1, len(result["rmse"]) + 1),
+        "rmse": result["rmse"],
+        "mae": result["mae"]
+    })
+
+    # CSV として保存する
+    summary.to_csv(f"{out_dir}/backtest.csv", index=False)
+
+    return summary
+
+
+def plot_prediction(
+        x: np.ndarray, y_true: np.ndarray, y_preds: np.ndarray, out_dir: str
+    ) -> None:
+    """
+    予測結果を表示する関数
+
+    Parameters
+    ----------
+    x: np.ndarray
+        説明変数 x の値
+    y_true: np.ndarray
+        目的変数の真値
+    y_preds: np.ndarray
+        目的変数の予測値
+    out_dir: str
+        結果を保存するディレクトリのパス
+
+    Returns
+    ----------
+    None
+    """
+    # 描画はバックグラウンドのプロセスで行う
+    submit(
+        "prediction", f"{out_dir}/prediction.png",
+        x=np.asarray(x), y_true=np.asarray(y_true), y_preds=np.asarray(y_preds)
+    )
 
 
 def predict(
         eval_df: pd.DataFrame, model_type: str, out_dir: str,
         model
-    ) -> None:
+    ) -> np.ndarray:
     """
     データの予測をする関数
 
@@ -96,7 +307,7 @@ def predict(
     eval_df: pd.DataFrame
         評価用のデータフレーム
     model_type: str
-        実験で学習させたモデルのタイプ￥
+        実験で学習させたモデルのタイプ
     out_dir: str
         結果を保存するディレクトリのパス
     model:
@@ -104,40 +315,15 @@ def predict(
 
     Returns
     ----------
-    None
+    y_preds: np.ndarray
+        各ステップの予測値
     """
-    # データの準備をする
-    x = eval_df["x"].to_list()
-    y_true = eval_df["y"]
-    y_data = list(eval_df.drop(["x", "y"], axis=1).iloc[0])
-
     # 再帰的に予測する
-    y_preds = []
-    for i in range(len(eval_df)):
-        tmp_dataset = [x[i]] + y_data
-        if model_type == "LightGBM":
-            y_pred = model.predict(
-                [tmp_dataset], num_iteration=model.best_iteration
-            )[0]
-            y_preds.append(y_pred)
-            y_data = [y_pred] + y_data[:-1]
-        else:
-            tmp_dataset = torch.tensor(
-                [tmp_dataset]
-            ).reshape(1, -1).to("cpu")
-            y_pred = model(tmp_dataset)[0]
-            y_preds.append(float(y_pred))
-            y_data = [float(y_pred)] + y_data[:-1]
-    
-    # 画像のスタイルを指定する
-    plt.figure(figsize=(18, 12))
-    plt.title("Prediction", size=15, color="red")
-    plt.grid()
-
-    # データのプロットをする
-    plt.scatter(x, y_true, label="True")
-    plt.plot(x, y_preds, label="Preds", color="orange")
-
-    # 画像を保存する
-    plt.legend(bbox_to_anchor=(1.01, 1), loc="upper left", borderaxespad=0.)
-    plt.savefig(f"{out_dir}/prediction.png")
+    y_preds = recursive_forecast(eval_df, model_type, model)
+
+    # 予測結果を描画する
+    plot_prediction(
+        eval_df["x"].to_numpy(), eval_df["y"].to_numpy(), y_preds, out_dir
+    )
+
+    return y_preds
@@ -0,0 +1,160 @@
+import math
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+# lightgbm と torch は読み込みに時間がかかるため, 使う関数の中で読み込む
+# NeuralNetwork の試行を打ち切るコールバックは trainers.callbacks の PruningCallback を使う
+if TYPE_CHECKING:
+    import lightgbm as lgb
+
+
+class HyperbandScheduler():
+    """
+    successive halving / Hyperband による試行の打ち切りを判断するクラス
+
+    各試行は予算 (ブースティングのラウンド数やエポック数) が段 (rung) に達するたびに
+    検証データの評価値を報告し, その段に達した試行の上位 1 / eta に入らない場合は打ち切る.
+    打ち切られた試行のプロセスは次の試行に割り当てられる.
+    rungs と lock は multiprocessing.Manager で作成したものを渡し, プロセス間で共有する.
+    """
+    def __init__(
+            self, min_budget: int, max_budget: int, eta: int,
+            rungs, lock, n_brackets: Optional[int] = None
+        ):
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.eta = eta
+        self.rungs = rungs
+        self.lock = lock
+
+        # 最小予算を変えた bracket の数, 1 の場合は successive halving と同じになる
+        s_max = int(math.log(max_budget / min_budget, eta) + 1e-9)
+        if n_brackets is None:
+            n_brackets = s_max + 1
+        self.n_brackets = min(n_brackets, s_max + 1)
+
+    def get_bracket(self, trial_index: int) -> int:
+        """
+        試行を割り当てる bracket を決めるメソッド
+
+        Parameters
+        ----------
+        trial_index: int
+            試行の番号
+
+        Returns
+        ----------
+        bracket: int
+            割り当てる bracket の番号
+        """
+        return trial_index % self.n_brackets
+
+    def get_budgets(self, bracket: int) -> List[int]:
+        """
+        bracket ごとに評価値を報告する予算を求めるメソッド
+
+        Parameters
+        ----------
+        bracket: int
+            bracket の番号
+
+        Returns
+        ----------
+        budgets: List[int]
+            最大予算より小さい段の予算のリスト
+        """
+        budgets = []
+        budget = self.min_budget * self.eta ** bracket
+        while budget < self.max_budget:
+            budgets.append(int(budget))
+            budget *= self.eta
+
+        return budgets
+
+    def report(self, bracket: int, budget: int, score: float) -> bool:
+        """
+        段に達した試行の評価値を記録し, 続けるかどうかを判断するメソッド
+
+        Parameters
+        ----------
+        bracket: int
+            試行の bracket の番号
+        budget: int
+            試行が達した段の予算
+        score: float
+            検証データでの評価値, 小さいほど良いものとする
+
+        Returns
+        ----------
+        keep: bool
+            試行を続ける場合は True
+        """
+        key = f"{bracket}-{budget}"
+        with self.lock:
+            scores = list(self.rungs.get(key, [])) + [score]
+            self.rungs[key] = scores
+
+        # その段に達した試行のうち上位 1 / eta に入っていれば続ける
+        n_keep = max(len(scores) // self.eta, 1)
+        keep = score <= sorted(scores)[n_keep - 1]
+
+        return keep
+
+
+def get_lgb_pruning_callback(
+        scheduler: HyperbandScheduler, bracket: int
+    ) -> Callable:
+    """
+    lgb.train の途中で試行を打ち切るコールバックを作成する関数
+
+    打ち切った予算はコールバックの pruned_at 属性に書き込む.
+
+    Parameters
+    ----------
+    scheduler: HyperbandScheduler
+        打ち切りを判断するスケジューラー
+    bracket: int
+        試行の bracket の番号
+
+    Returns
+    ----------
+    callback: Callable
+        lgb.train に渡すコールバック
+    """
+    import lightgbm as lgb
+
+    budgets = set(scheduler.get_budgets(bracket))
+
+    # 打ち切った際にモデルに残す, これまでで最良のラウンドとその評価値
+    best = {"score": math.inf, "iteration": 0, "results": None}
+
+    def callback(env: "lgb.callback.CallbackEnv") -> None:
+        # 検証データの評価値を取り出す
+        for data_name, _, score, is_higher_better in env.evaluation_result_list:
+            if data_name == "Valid":
+                break
+        if is_higher_better:
+            score = -score
+        if score < best["score"]:
+            best.update(
+                score=score, iteration=env.iteration,
+                results=env.evaluation_result_list
+            )
+
+        budget = env.iteration + 1
+        if budget not in budgets:
+            return
+
+        # 上位に入らない場合は early stopping と同じ方法で学習を止める
+        # best_iteration と best_score は打ち切ったラウンドではなく最良のラウンドの値とする
+        if not scheduler.report(bracket, budget, score):
+            callback.pruned_at = budget
+            raise lgb.callback.EarlyStopException(
+                best["iteration"], best["results"]
+            )
+
+    callback.pruned_at = None
+
+    # early stopping などの後に呼ばれるようにする
+    callback.order = 40
+
+    return callback
@@ -0,0 +1,363 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import numpy as np
+
+from experiment_tools.run_index import OUTPUT_DIR, query_runs
+from models.artifact import ModelArtifact
+
+
+def find_artifact_dir(
+        run: Optional[str] = None, model_type: Optional[str] = None,
+        output_dir: str = OUTPUT_DIR
+    ) -> str:
+    """
+    予測に使う成果物のディレクトリを探す関数
+
+    Parameters
+    ----------
+    run: Optional[str] = None
+        実験結果のディレクトリ, outputs からの相対パスでもよい
+        指定しない場合は, 実験の一覧から model_type の最も評価値の良い実験を使う
+    model_type: Optional[str] = None
+        run を指定しない場合に探すモデルのタイプ, run を指定しない場合は必須
+        モデルのタイプごとに評価指標が異なり, 評価値を比べられないため
+    output_dir: str = OUTPUT_DIR
+        実験結果を保存するディレクトリ
+
+    Returns
+    ----------
+    artifact_dir: str
+        成果物のディレクトリ
+    """
+    if run is None:
+        if model_type is None:
+            raise ValueError("model_type is required when run is not given")
+        runs = query_runs(
+            where="status = 'finished' AND has_model = 1 AND model_type = ?",
+            params=[model_type], limit=1,
+            columns=["run_dir"],
+            index_path=os.path.join(output_dir, "runs.sqlite")
+        )
+        if not runs:
+            raise FileNotFoundError(f"no finished run with a model: {model_type}")
+        run = runs[0]["run_dir"]
+
+    for run_dir in [run, os.path.join(output_dir, run)]:
+        for artifact_dir in [run_dir, os.path.join(run_dir, "model")]:
+            if os.path.exists(os.path.join(artifact_dir, "manifest.json")):
+                return artifact_dir
+
+    raise FileNotFoundError(f"no model artifact in {run}")
+
+
+class MicroBatcher():
+    """
+    同時に届いた予測の依頼をまとめ, 1 回の予測で処理するクラス
+
+    最初の依頼が届いてから max_latency_ms ミリ秒の間, もしくは max_batch_size 行に達するまで
+    後続の依頼を待ち, まとめてモデルに渡す. 予測は 1 つのスレッドで行うため,
+    モデルを複数のスレッドから同時に呼び出すことはない.
+    """
+    def __init__(
+            self, artifact: ModelArtifact, max_batch_size: int = 64,
+            max_latency_ms: float = 0.0
+        ):
+        self.artifact = artifact
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.n_batches = 0
+        self.n_rows = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, X: np.ndarray) -> Future:
+        """
+        予測を依頼するメソッド
+
+        Parameters
+        ----------
+        X: np.ndarray
+            説明変数, 形状は (行数, 特徴量の数)
+
+        Returns
+        ----------
+        future: Future
+            予測値 (形状は (行数,)) を受け取る Future
+        """
+        future = Future()
+        self._queue.put((X, future))
+
+        return future
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        予測を依頼し, 結果が得られるまで待つメソッド
+
+        Parameters
+        ----------
+        X: np.ndarray
+            説明変数, 形状は (行数, 特徴量の数)
+
+        Returns
+        ----------
+        y_preds: np.ndarray
+            目的変数の予測値, 形状は (行数,)
+        """
+        return self.submit(X).result()
+
+    def stats(self) -> dict:
+        """
+        これまでに処理したバッチの統計を取得するメソッド
+
+        Returns
+        ----------
+        stats: dict
+            バッチ数, 行数, 1 バッチあたりの平均行数
+        """
+        return {
+            "batches": self.n_batches,
+            "rows": self.n_rows,
+            "mean_batch_size": self.n_rows / self.n_batches if self.n_batches else 0.0
+        }
+
+    def close(self) -> None:
+        """
+        予測のスレッドを止めるメソッド, 受け付け済みの依頼は処理してから止まる
+
+        Returns
+        ----------
+        None
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        """
+        最初の依頼から一定時間の間に届いた依頼をまとめるメソッド
+
+        Parameters
+        ----------
+        first: tuple
+            最初に届いた依頼
+
+        Returns
+        ----------
+        batch: List[tuple]
+            まとめた依頼のリスト, 末尾の None は停止の合図を表す
+        """
+        batch = [first]
+        n_rows = len(first[0])
+        deadline = time.perf_counter() + self.max_latency
+        while n_rows < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            batch.append(item)
+            if item is None:
+                break
+            n_rows += len(item[0])
+
+        return batch
+
+    def _run(self) -> None:
+        """
+        依頼をまとめて予測し, 結果を各依頼に返すメソッド, 予測のスレッドで実行される
+
+        Returns
+        ----------
+        None
+        """
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = self._collect(first)
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+
+            # 全ての依頼の行を縦につなげて 1 回で予測し, 依頼ごとに切り分けて返す
+            try:
+                X = np.concatenate([X for X, _ in batch])
+                y_preds = self.artifact.predict(X)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                start = 0
+                for X, future in batch:
+                    future.set_result(y_preds[start:start + len(X)])
+                    start += len(X)
+                self.n_batches += 1
+                self.n_rows += len(y_preds)
+
+            if stop:
+                return
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    予測の依頼を受け付ける HTTP のハンドラー
+
+    POST /predict に {"features": [...]} (1 行) もしくは {"instances": [[...], ...]} (複数行) を送ると,
+    {"predictions": [...]} を返す. 各行は特徴量の配列, もしくは列名をキーとした辞書で指定する.
+    GET /health はモデルの情報とバッチの統計を返す.
+    """
+    # 接続を使い回せるようにし, 依頼ごとの接続のコストを省く
+    protocol_version = "HTTP/1.1"
+
+    # ヘッダーと本文を分けて書き込むため, Nagle アルゴリズムで応答が遅れないようにする
+    disable_nagle_algorithm = True
+
+    # make_server で設定する
+    batcher: MicroBatcher = None
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self.send_json(404, {"error": f"not found: {self.path}"})
+            return
+
+        artifact = self.batcher.artifact
+        self.send_json(200, {
+            "model_type": artifact.model_type,
+            "features": artifact.features,
+            **self.batcher.stats()
+        })
+
+    def do_POST(self) -> None:
+        if self.path != "/predict":
+            self.send_json(404, {"error": f"not found: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+            X = self.parse_rows(body)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        try:
+            y_preds = self.batcher.predict(X)
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+            return
+
+        self.send_json(200, {"predictions": y_preds.tolist()})
+
+    def parse_rows(self, body: dict) -> np.ndarray:
+        """
+        依頼の本文から説明変数を作成するメソッド
+
+        Parameters
+        ----------
+        body: dict
+            依頼の本文
+
+        Returns
+        ----------
+        X: np.ndarray
+            説明変数, 形状は (行数, 特徴量の数)
+        """
+        features = self.batcher.artifact.features
+        rows = [body["features"]] if "features" in body else body["instances"]
+
+        # 辞書で指定された行は, 学習時の列の順に並べ替える
+        rows = [
+            [row[name] for name in features] if isinstance(row, dict) else row
+            for row in rows
+        ]
+        X = np.asarray(rows, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(features):
+            raise ValueError(
+                f"expected rows of {len(features)} features, got shape {X.shape}"
+            )
+
+        return X
+
+    def send_json(self, status: int, body: dict) -> None:
+        """
+        JSON を返すメソッド
+
+        Parameters
+        ----------
+        status: int
+            HTTP のステータスコード
+        body: dict
+            返す内容
+
+        Returns
+        ----------
+        None
+        """
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        # 依頼ごとの log は出力しない
+        pass
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """
+    接続ごとにスレッドで依頼を受け付ける HTTP サーバー
+    """
+    # 多数のクライアントが同時に接続しても拒否しないよう, 接続の待ち行列を長くする
+    request_queue_size = 128
+
+    # 終了時に接続中のスレッドを待たない
+    daemon_threads = True
+
+
+def make_server(
+        artifact: ModelArtifact, host: str = "127.0.0.1", port: int = 8000,
+        max_batch_size: int = 64, max_latency_ms: float = 0.0
+    ) -> PredictionServer:
+    """
+    予測を行う HTTP サーバーを作成する関数
+
+    接続ごとにスレッドで依頼を受け付け, 予測は MicroBatcher でまとめて行う.
+
+    Parameters
+    ----------
+    artifact: ModelArtifact
+        予測に使うモデル
+    host: str = "127.0.0.1"
+        待ち受けるアドレス
+    port: int = 8000
+        待ち受けるポート
+    max_batch_size: int = 64
+        1 回の予測でまとめる最大の行数
+    max_latency_ms: float = 0.0
+        最初の依頼から後続の依頼を待つ時間 (ミリ秒)
+
+    Returns
+    ----------
+    server: PredictionServer
+        作成したサーバー, serve_forever で起動する
+    """
+    # 最初の依頼だけ遅くならないよう, 起動時に 1 度予測しておく
+    artifact.predict(np.zeros((1, len(artifact.features))))
+
+    batcher = MicroBatcher(artifact, max_batch_size, max_latency_ms)
+    handler = type("Handler", (PredictionHandler,), {"batcher": batcher})
+    server = PredictionServer((host, port), handler)
+    server.batcher = batcher
+
+    return server
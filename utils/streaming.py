@@ -0,0 +1,305 @@
+import os
+from typing import Iterator, Literal, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import IterableDataset
+
+from utils.preprocessing import load_columns, make_lag_matrix, to_torch
+
+
+def count_rows(path: str, chunk_size: int = 1 << 20) -> int:
+    """
+    データ全体を読み込まずに行数を数える関数
+
+    Parameters
+    ----------
+    path: str
+        CSV ファイル, もしくは列ごとの .npy ファイルからなるディレクトリのパス
+    chunk_size: int = 1 << 20
+        一度に読み込むバイト数
+
+    Returns
+    ----------
+    n_rows: int
+        ヘッダーを除いたデータの行数
+    """
+    # 列ごとの形式であれば配列の長さを参照する
+    if os.path.isdir(path):
+        columns = load_columns(path)
+        return len(next(iter(columns.values())))
+
+    # CSV であれば改行の数を少しずつ数える
+    n_lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            n_lines += chunk.count(b"\n")
+            last = chunk[-1:]
+
+    # 末尾に改行が無い場合は最後の行を加え, ヘッダーの行を除く
+    if last != b"\n":
+        n_lines += 1
+    n_rows = n_lines - 1
+
+    return n_rows
+
+
+def find_row_offset(path: str, row: int, chunk_size: int = 1 << 20) -> int:
+    """
+    CSV の指定した行の先頭のバイト位置を求める関数
+
+    行を解析せずに改行の数だけを数えるため, 読み飛ばす行の分のメモリを使わない.
+
+    Parameters
+    ----------
+    path: str
+        CSV ファイルのパス
+    row: int
+        ヘッダーを除いて 0 から数えた行の番号
+    chunk_size: int = 1 << 20
+        一度に読み込むバイト数
+
+    Returns
+    ----------
+    offset: int
+        行の先頭のバイト位置, 行が無い場合はファイルの末尾
+    """
+    # ヘッダーを含めて row + 1 個目の改行の直後が行の先頭となる
+    target = row + 1
+    n_lines = 0
+    offset = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            count = chunk.count(b"\n")
+            if n_lines + count >= target:
+                pos = -1
+                for _ in range(target - n_lines):
+                    pos = chunk.index(b"\n", pos + 1)
+                return offset + pos + 1
+            n_lines += count
+            offset += len(chunk)
+
+    return offset
+
+
+def iter_chunks(
+        path: str, chunksize: int, start: int = 0
+    ) -> Iterator[pd.DataFrame]:
+    """
+    データを先頭から少しずつ読み込む関数
+
+    Parameters
+    ----------
+    path: str
+        CSV ファイル, もしくは列ごとの .npy ファイルからなるディレクトリのパス
+    chunksize: int
+        一度に読み込む行数
+    start: int = 0
+        読み込みを始める行
+
+    Returns
+    ----------
+    chunk: Iterator[pd.DataFrame]
+        読み込んだ部分のデータフレーム
+    """
+    # 列ごとの形式であればメモリマップした配列を切り出す
+    if os.path.isdir(path):
+        columns = load_columns(path)
+        n_rows = len(next(iter(columns.values())))
+        for begin in range(start, n_rows, chunksize):
+            end = min(begin + chunksize, n_rows)
+            yield pd.DataFrame(
+                {name: values[begin:end] for name, values in columns.items()}
+            )
+        return
+
+    # CSV であれば開始行の先頭まで解析せずにシークし, 列名はヘッダーから取得する
+    names = list(pd.read_csv(path, nrows=0).columns)
+    with open(path, "rb") as f:
+        f.seek(find_row_offset(path, start))
+        reader = pd.read_csv(f, header=None, names=names, chunksize=chunksize)
+        with reader:
+            for chunk in reader:
+                yield chunk
+
+
+def iter_lagged_chunks(
+        path: str, lag: int, chunksize: int, start: int, stop: int
+    ) -> Iterator[pd.DataFrame]:
+    """
+    ラグ特徴量を付加したデータを少しずつ作成する関数
+
+    Parameters
+    ----------
+    path: str
+        CSV ファイル, もしくは列ごとの .npy ファイルからなるディレクトリのパス
+    lag: int
+        作成するラグの数
+    chunksize: int
+        一度に読み込む行数
+    start: int
+        作成する範囲の先頭の行
+    stop: int
+        作成する範囲の末尾の次の行
+
+    Returns
+    ----------
+    chunk: Iterator[pd.DataFrame]
+        "y_{i}_shift" 列を付加した部分のデータフレーム
+    """
+    # ラグの参照に必要な分だけ手前から読み込む
+    begin = max(start - lag, 0)
+    row = begin
+
+    # 直前の部分の末尾 lag 個を持ち越すバッファ
+    carry = np.empty(0, dtype=np.float64)
+
+    for chunk in iter_chunks(path, chunksize, start=begin):
+        if row >= stop:
+            break
+
+        # 持ち越した値と繋げてラグ行列を作成し, 持ち越し分を除く
+        y = chunk["y"].to_numpy(dtype=np.float64)
+        extended = np.concatenate([carry, y])
+        lag_matrix = make_lag_matrix(extended, lag)[len(carry):]
+        carry = extended[-lag:] if lag > 0 else carry
+
+        # 必要な範囲だけを切り出す
+        lo = max(start - row, 0)
+        hi = min(stop - row, len(chunk))
+        row += len(chunk)
+        if lo >= hi:
+            continue
+
+        lag_df = pd.DataFrame(
+            lag_matrix[lo:hi],
+            columns=[f"y_{i + 1}_shift" for i in range(lag)]
+        )
+        yield pd.concat(
+            [chunk.iloc[lo:hi].reset_index(drop=True), lag_df], axis=1
+        )
+
+
+class LagWindowDataset(IterableDataset):
+    """
+    ラグ特徴量をミニバッチ単位で少しずつ作成するデータセット
+
+    一度に保持するデータは chunksize 行分に限られる.
+    DataLoader からは batch_size=None として呼び出す.
+    """
+    def __init__(
+            self, path: str, lag: int, start: int, stop: int,
+            chunksize: int, batch_size: int, shuffle: bool = False,
+            drop_last: bool = False, dropna: bool = False,
+            torch_type: Literal["Float", "Long"] = "Float"
+        ):
+        super(LagWindowDataset, self).__init__()
+        self.path = path
+        self.lag = lag
+        self.start = start
+        self.stop = stop
+        self.chunksize = chunksize
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.dropna = dropna
+        self.torch_type = torch_type
+
+    def __len__(self) -> int:
+        # 系列の先頭の欠損を削除する場合はその分を除く
+        start = max(self.start, self.lag) if self.dropna else self.start
+        return max(self.stop - start, 0)
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        # 部分をまたいだミニバッチを作るための余り
+        rest_X = None
+        rest_y = None
+
+        for chunk in iter_lagged_chunks(
+            self.path, self.lag, self.chunksize, self.start, self.stop
+        ):
+            if self.dropna:
+                chunk = chunk.dropna(how="any")
+            if self.shuffle:
+                chunk = chunk.sample(frac=1.0)
+
+            # 説明変数と目的変数に分けて Tensor 型にする
+            X, y = to_torch(
+                chunk.drop("y", axis=1).to_numpy(),
+                chunk["y"].to_numpy(),
+                torch_type=self.torch_type
+            )
+            if rest_X is not None:
+                X = torch.cat([rest_X, X])
+                y = torch.cat([rest_y, y])
+
+            # ミニバッチに切り分け, 余りは次の部分に持ち越す
+            n_full = len(X) // self.batch_size * self.batch_size
+            for i in range(0, n_full, self.batch_size):
+                yield X[i:i + self.batch_size], y[i:i + self.batch_size]
+            rest_X, rest_y = X[n_full:], y[n_full:]
+
+        if rest_X is not None and len(rest_X) > 0 and not self.drop_last:
+            yield rest_X, rest_y
+
+
+def make_streaming_datasets_for_nn(cfg: dict) -> dict:
+    """
+    データを少しずつ読み込むニューラルネットワーク系のデータセットを作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    out: dict
+        データセットの辞書
+    """
+    # data_split と同じ境界を行数から求める
+    n_rows = count_rows(cfg["data_path"])
+    n_train = int(n_rows * cfg["sampling_rate"]["train"])
+    n_valid = int((n_rows - n_train) * cfg["sampling_rate"]["valid"])
+
+    # 学習・検証データのデータセットを作成
+    params = {
+        "path": cfg["data_path"],
+        "lag": cfg["lag"],
+        "chunksize": cfg["streaming"]["chunksize"],
+        "batch_size": cfg["dataloader_params"]["batch_size"],
+        "shuffle": cfg["dataloader_params"]["shuffle"],
+        "drop_last": cfg["dataloader_params"]["drop_last"],
+        "torch_type": cfg["torch_type"]
+    }
+    train_dataset = LagWindowDataset(
+        start=0, stop=n_train, dropna=True, **params
+    )
+    valid_dataset = LagWindowDataset(
+        start=n_train, stop=n_train + n_valid, **params
+    )
+
+    # 評価データは再帰的な予測に使うためデータフレームとして作成する
+    # 系列の長さによらずメモリに収まるよう, 先頭の eval_rows 行までとする
+    eval_start = n_train + n_valid
+    eval_rows = cfg["streaming"].get("eval_rows")
+    eval_stop = n_rows if eval_rows is None else min(eval_start + eval_rows, n_rows)
+    eval_df = pd.concat(
+        iter_lagged_chunks(
+            cfg["data_path"], cfg["lag"], cfg["streaming"]["chunksize"],
+            eval_start, eval_stop
+        ),
+        ignore_index=True
+    )
+
+    out = {
+        "num_records": n_rows,
+        "num_eval_records": n_rows - eval_start,
+        "train_dataset": train_dataset,
+        "valid_dataset": valid_dataset,
+        "eval_data": eval_df
+    }
+
+    return out
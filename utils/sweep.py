@@ -0,0 +1,271 @@
+import copy
+import itertools
+import json
+import math
+import random
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def expand_grid(space: dict) -> List[dict]:
+    """
+    探索空間の全ての組み合わせを列挙する関数
+
+    Parameters
+    ----------
+    space: dict
+        "params.lr" のようなドット区切りのキーと候補のリストの辞書
+
+    Returns
+    ----------
+    trials: List[dict]
+        各試行で上書きする値の辞書のリスト
+    """
+    keys = list(space.keys())
+    trials = [
+        dict(zip(keys, values))
+        for values in itertools.product(*(space[key] for key in keys))
+    ]
+
+    return trials
+
+
+def sample_random(space: dict, n_trials: int, seed: int) -> List[dict]:
+    """
+    探索空間からランダムに値を選ぶ関数
+
+    Parameters
+    ----------
+    space: dict
+        ドット区切りのキーと探索範囲の辞書
+        探索範囲はリスト, もしくは {"low", "high", "log"} の辞書で指定する
+    n_trials: int
+        試行の数
+    seed: int
+        シード値
+
+    Returns
+    ----------
+    trials: List[dict]
+        各試行で上書きする値の辞書のリスト
+    """
+    rng = random.Random(seed)
+
+    trials = []
+    for _ in range(n_trials):
+        overrides = {}
+        for key, candidates in space.items():
+            # リストの場合は候補から選ぶ
+            if isinstance(candidates, list):
+                overrides[key] = rng.choice(candidates)
+                continue
+
+            # 範囲の場合は一様分布, もしくは対数一様分布から選ぶ
+            low, high = candidates["low"], candidates["high"]
+            if candidates.get("log", False):
+                value = math.exp(rng.uniform(math.log(low), math.log(high)))
+            else:
+                value = rng.uniform(low, high)
+            if isinstance(low, int) and isinstance(high, int):
+                value = int(round(value))
+            overrides[key] = value
+        trials.append(overrides)
+
+    return trials
+
+
+def get_trials(sweep_cfg: dict) -> List[dict]:
+    """
+    sweep の config から各試行で上書きする値を作成する関数
+
+    Parameters
+    ----------
+    sweep_cfg: dict
+        sweep の config データ
+
+    Returns
+    ----------
+    trials: List[dict]
+        各試行で上書きする値の辞書のリスト
+    """
+    if sweep_cfg["method"] == "grid":
+        return expand_grid(sweep_cfg["space"])
+
+    return sample_random(
+        sweep_cfg["space"], sweep_cfg["n_trials"], sweep_cfg["seed"]
+    )
+
+
+def apply_overrides(cfg: dict, overrides: dict) -> dict:
+    """
+    config の値をドット区切りのキーで上書きする関数
+
+    Parameters
+    ----------
+    cfg: dict
+        元の config データ
+    overrides: dict
+        ドット区切りのキーと上書きする値の辞書
+
+    Returns
+    ----------
+    trial_cfg: dict
+        上書きした config データ, 元の config は変更しない
+    """
+    trial_cfg = copy.deepcopy(cfg)
+    for key, value in overrides.items():
+        *parents, last = key.split(".")
+        target = trial_cfg
+        for parent in parents:
+            target = target[parent]
+        target[last] = value
+
+    return trial_cfg
+
+
+def get_preprocessing_key(cfg: dict) -> str:
+    """
+    前処理の結果を決める config の値からキーを作成する関数
+
+    Parameters
+    ----------
+    cfg: dict
+        実験に使う値の config データ
+
+    Returns
+    ----------
+    key: str
+        同じ前処理の結果となる試行で共通のキー
+    """
+    items = {
+        "data_path": cfg["data_path"],
+        "lag": cfg["lag"],
+        "sampling_rate": cfg["sampling_rate"]
+    }
+    key = json.dumps(items, sort_keys=True)
+
+    return key
+
+
+def share_splits(
+        splits: dict
+    ) -> Tuple[dict, List[shared_memory.SharedMemory]]:
+    """
+    分割済みのデータを共有メモリに配置する関数
+
+    Parameters
+    ----------
+    splits: dict
+        分割済みのデータフレームの辞書
+
+    Returns
+    ----------
+    descriptor: dict
+        共有メモリの名前, 形状, 列名の辞書, 子プロセスに渡す
+    handles: List[shared_memory.SharedMemory]
+        作成した共有メモリ, 全ての試行が終わった後に解放する
+    """
+    descriptor = {}
+    handles = []
+    for name, df in splits.items():
+        values = df.to_numpy(dtype=np.float64)
+
+        # 共有メモリを確保してデータを複製する
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(values.nbytes, 1)
+        )
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        handles.append(shm)
+
+        descriptor[name] = {
+            "shm_name": shm.name,
+            "shape": values.shape,
+            "columns": list(df.columns)
+        }
+
+    return descriptor, handles
+
+
+def attach_splits(
+        descriptor: dict
+    ) -> Tuple[dict, List[shared_memory.SharedMemory]]:
+    """
+    共有メモリに配置された分割済みのデータを参照する関数
+
+    Parameters
+    ----------
+    descriptor: dict
+        share_splits で作成した辞書
+
+    Returns
+    ----------
+    splits: dict
+        共有メモリをコピーせずに参照するデータフレームの辞書
+    handles: List[shared_memory.SharedMemory]
+        参照した共有メモリ, 使い終わった後に閉じる
+    """
+    splits = {}
+    handles = []
+    for name, item in descriptor.items():
+        shm = shared_memory.SharedMemory(name=item["shm_name"])
+        values = np.ndarray(
+            tuple(item["shape"]), dtype=np.float64, buffer=shm.buf
+        )
+        splits[name] = pd.DataFrame(
+            values, columns=item["columns"], copy=False
+        )
+        handles.append(shm)
+
+    return splits, handles
+
+
+def release(
+        handles: List[shared_memory.SharedMemory], unlink: bool = False
+    ) -> None:
+    """
+    共有メモリを閉じる関数
+
+    Parameters
+    ----------
+    handles: List[shared_memory.SharedMemory]
+        閉じる共有メモリ
+    unlink: bool = False
+        共有メモリ自体を削除するかどうか, 作成したプロセスでのみ True とする
+
+    Returns
+    ----------
+    None
+    """
+    for shm in handles:
+        # データフレームの参照が残っている場合はプロセスの終了時に解放される
+        try:
+            shm.close()
+        except BufferError:
+            pass
+        if unlink:
+            shm.unlink()
+
+
+def get_pruned_at(callbacks: Optional[list]) -> Optional[int]:
+    """
+    試行が打ち切られた予算をコールバックから取得する関数
+
+    Parameters
+    ----------
+    callbacks: Optional[list]
+        学習に渡したコールバックのリスト
+
+    Returns
+    ----------
+    pruned_at: Optional[int]
+        打ち切られた予算, 打ち切られていない場合は None
+    """
+    for callback in callbacks or []:
+        pruned_at = getattr(callback, "pruned_at", None)
+        if pruned_at is not None:
+            return pruned_at
+
+    return None